@@ -1,13 +1,12 @@
 import os
-import json
 from Utilities import default_prompt
+from FileUtilities import config_store
 
 
 
 
 class NVRConfig:
     def __init__(self):
-        self.config = {}
         self.documentNever:str = os.path.join(os.getenv("USERPROFILE"), "Documents", "NEVER Editor")
         self.config_path = os.path.join(self.documentNever, "config.json")
 
@@ -19,34 +18,41 @@ class NVRConfig:
                 f.write(default_prompt)
                 f.close()
 
-        self.load()
+        self.store = config_store(self.config_path, {})
+        self.store.subscribe(self._changed)
+        self._changed(None)
 
+    def _changed(self, keys):
+        """Keep the attributes in step with the store, including changes made to config.json by hand."""
         self.ollamaModel = self.config.get("ollamaModel", None)
         self.theme = self.config.get("theme", "dracula")
         self.textAreaTheme = self.config.get("textAreaTheme", "vscode_dark")
         self.autoMerge: bool = self.config.get("autoMerge", False)
         self.autoSave: bool = self.config.get("autoSave", False)
+        self.autoSaveDelay: float = self.config.get("autoSaveDelay", 1.0)
+        self.largeFileThreshold: int = self.config.get("largeFileThreshold", 64 * 1024 * 1024)
+
+    @property
+    def config(self) -> dict:
+        return self.store.data
 
     def load(self):
-        """Discover and load plugins from the plugins directory."""
-        if not os.path.exists(self.config_path):
-            file = open(self.config_path, "+w")
-            file.write(json.dumps({}))
-            file.close()
-        else:
-            with open(self.config_path, "r") as config_file:
-                self.config = json.load(config_file)
-
-    def save(self):
-        with open(self.config_path, "+w") as config_file:
-            json.dump(self.config, config_file, indent=4)
+        """The store reads config.json once and again whenever it changes on disk, nothing to do."""
+
+    def save(self, *keys):
+        self.store.save(*keys)
 
     def get(self, key, default=None):
-        self.load()
-        return self.config.get(key, default)
+        return self.store.get(key, default)
     
     def set(self, key, value):
-        self.config[key] = value
-        self.save()
+        self.store.set(key, value)
+
+    def subscribe(self, listener):
+        """Call listener(keys) with the keys that changed, from the watcher thread for changes made to config.json by hand."""
+        self.store.subscribe(listener)
+
+    def unsubscribe(self, listener):
+        self.store.unsubscribe(listener)
 
 config = NVRConfig()
\ No newline at end of file
@@ -0,0 +1,910 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from collections import Counter
+from collections.abc import Sequence
+from difflib import SequenceMatcher
+from typing import NamedTuple, Iterator, Callable
+from rich.cells import cell_len
+from textual._cells import cell_width_to_column_index
+from textual._wrap import compute_wrap_offsets
+from textual.document._document import Document, DocumentBase, EditResult, Location
+from textual.document._wrapped_document import WrappedDocument
+from textual.expand_tabs import expand_tabs_inline, get_tab_widths
+from textual.geometry import Offset, Size, clamp
+from FileUtilities import atomic_write
+
+ORIGINAL = 0
+ADDED = 1
+
+# Number of lines handed to the writer at once when streaming a document to disk.
+WRITE_CHUNK_LINES = 16384
+
+# Bytes of a memory-mapped file that are indexed before it is shown, the rest is indexed in the background.
+FIRST_SCREEN_BYTES = 1024 * 1024
+
+# Number of lines the background indexer finds between two progress callbacks.
+INDEX_BATCH_LINES = 50000
+
+# Seconds an edit journal gathers records for before they are written and fsync'ed together.
+JOURNAL_SYNC_INTERVAL = 0.25
+
+
+def detect_newline(text: str) -> str:
+    """Return the newline style used by the first line break in text."""
+    index = text.find("\n")
+    if index > 0 and text[index - 1] == "\r":
+        return "\r\n"
+    if index == -1 and "\r" in text:
+        return "\r"
+    return "\n"
+
+
+def line_starts(text: str, newline: str) -> array:
+    """Return the offsets at which every line of text starts."""
+    starts = array("q", [0])
+    step = len(newline)
+    find = text.find
+    index = find(newline)
+    while index != -1:
+        starts.append(index + step)
+        index = find(newline, index + step)
+    return starts
+
+
+class Piece(NamedTuple):
+    """A run of consecutive lines taken from one of the document buffers."""
+    source: int
+    start: int
+    count: int
+
+
+class LineView(Sequence):
+    """Read-only list-like view over the lines of a document, built on demand."""
+
+    def __init__(self, document: "PieceTableDocument"):
+        self.document = document
+
+    def __len__(self) -> int:
+        return self.document.line_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.document.get_line(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return self.document.get_line(index)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.document.iter_lines()
+
+
+class PieceTableDocument(DocumentBase):
+    """A document which never copies the text it was loaded with.
+
+    The loaded text is kept as an immutable original buffer indexed by line
+    offsets. Edits append their resulting lines to an append-only buffer and
+    the document itself is a list of pieces pointing into either buffer, so
+    edits, saves and dirty checks cost in proportion to the edit, not the file.
+    """
+
+    def __init__(self, text: str):
+        self._newline = detect_newline(text)
+        self._original = text
+        self._starts = line_starts(text, self._newline)
+        self._added: list[str] = []
+        self._pieces: list[Piece] = [Piece(ORIGINAL, 0, len(self._starts))]
+        self._ends: list[int] = []
+        self._max_width: int = None
+        self._indent_width: int = None
+        self._saved = tuple(self._pieces)
+        self._update_ends()
+
+    def _update_ends(self):
+        """Rebuild the cumulative line counts used to locate a row."""
+        total = 0
+        ends = []
+        for piece in self._pieces:
+            total += piece.count
+            ends.append(total)
+        self._ends = ends
+
+    def _splice(self, first: int, last: int, pieces: list[Piece]):
+        """Replace pieces first..last with pieces, only shifting the line counts after them when needed."""
+        before = self._ends[first - 1] if first else 0
+        replaced_end = self._ends[last - 1] if last > first else before
+        ends = list(accumulate((piece.count for piece in pieces), initial=before))[1:]
+        delta = (ends[-1] if ends else before) - replaced_end
+        tail = self._ends[last:]
+        if delta:
+            tail = [end + delta for end in tail]
+        self._pieces[first:last] = pieces
+        self._ends[first:] = ends + tail
+
+    def _original_line(self, index: int) -> str:
+        return self._original_range(index, index + 1)
+
+    def _original_range(self, start: int, end: int) -> str:
+        """Return the original lines start..end joined by the document newline."""
+        first = self._starts[start]
+        if end < len(self._starts):
+            return self._original[first:self._starts[end] - len(self._newline)]
+        return self._original[first:]
+
+    def _original_bytes(self, start: int, end: int, encoding: str) -> bytes:
+        return self._original_range(start, end).encode(encoding)
+
+    def _locate(self, row: int) -> tuple[int, int]:
+        """Return the piece holding row and the row's offset inside it."""
+        piece_index = bisect_right(self._ends, row)
+        piece_start = self._ends[piece_index - 1] if piece_index else 0
+        return piece_index, row - piece_start
+
+    def _split(self, row: int) -> int:
+        """Make sure a piece starts at row and return its index."""
+        if row >= self.line_count:
+            return len(self._pieces)
+        piece_index, offset = self._locate(row)
+        if offset:
+            piece = self._pieces[piece_index]
+            self._splice(piece_index, piece_index + 1, [
+                Piece(piece.source, piece.start, offset),
+                Piece(piece.source, piece.start + offset, piece.count - offset),
+            ])
+            piece_index += 1
+        return piece_index
+
+    @property
+    def text(self) -> str:
+        """Get the text from the document. This materializes the whole buffer."""
+        return self._newline.join(self.iter_lines())
+
+    @property
+    def newline(self) -> str:
+        return self._newline
+
+    @property
+    def lines(self) -> LineView:
+        return LineView(self)
+
+    @property
+    def line_count(self) -> int:
+        return self._ends[-1] if self._ends else 0
+
+    @property
+    def start(self) -> Location:
+        return (0, 0)
+
+    @property
+    def end(self) -> Location:
+        last_row = self.line_count - 1
+        return (last_row, len(self.get_line(last_row)))
+
+    @property
+    def is_modified(self) -> bool:
+        """Whether the document changed since it was loaded or last marked as saved."""
+        return tuple(self._pieces) != self._saved
+
+    def snapshot(self) -> tuple:
+        """Return the current state of the document, for write() and mark_saved().
+
+        Buffers are append-only, so a snapshot stays valid while the document
+        is edited further and can be written from another thread.
+        """
+        return tuple(self._pieces)
+
+    def mark_saved(self, snapshot: tuple = None):
+        """Remember the current pieces (or the given snapshot) as the saved state of the document."""
+        self._saved = tuple(self._pieces) if snapshot is None else snapshot
+
+    def get_line(self, index: int) -> str:
+        piece_index, offset = self._locate(index)
+        piece = self._pieces[piece_index]
+        if piece.source == ORIGINAL:
+            return self._original_line(piece.start + offset)
+        return self._added[piece.start + offset]
+
+    def __getitem__(self, line_index):
+        return self.lines[line_index]
+
+    def iter_lines(self) -> Iterator[str]:
+        # Original lines are decoded and split a run at a time, which is much faster than line by line.
+        for source, start, end in self._iter_runs():
+            if source == ORIGINAL:
+                yield from self._original_range(start, end).split(self._newline)
+            else:
+                yield from self._added[start:end]
+
+    def _iter_runs(self, pieces=None) -> Iterator[tuple[int, int, int]]:
+        """Yield (source, start, end) runs of at most WRITE_CHUNK_LINES lines, in document order."""
+        for piece in self._pieces if pieces is None else pieces:
+            for start in range(piece.start, piece.start + piece.count, WRITE_CHUNK_LINES):
+                yield piece.source, start, min(start + WRITE_CHUNK_LINES, piece.start + piece.count)
+
+    def iter_chunks(self) -> Iterator[str]:
+        """Yield the document text in bounded chunks, separated by the document newline."""
+        for index, (source, start, end) in enumerate(self._iter_runs()):
+            chunk = self._original_range(start, end) if source == ORIGINAL else self._newline.join(self._added[start:end])
+            yield self._newline + chunk if index else chunk
+
+    def write(self, file, encoding: str = "utf-8", snapshot: tuple = None):
+        """Stream the document (or a snapshot of it) into a binary file object without joining it first."""
+        separator = self._newline.encode(encoding)
+        for index, (source, start, end) in enumerate(self._iter_runs(snapshot)):
+            if index:
+                file.write(separator)
+            if source == ORIGINAL:
+                file.write(self._original_bytes(start, end, encoding))
+            else:
+                file.write(self._newline.join(self._added[start:end]).encode(encoding))
+
+    def get_text_range(self, start: Location, end: Location) -> str:
+        if start == end:
+            return ""
+
+        top, bottom = sorted((start, end))
+        top_row, top_column = top
+        bottom_row, bottom_column = bottom
+        if top_row == bottom_row:
+            return self.get_line(top_row)[top_column:bottom_column]
+
+        parts = [self.get_line(top_row)[top_column:]]
+        for row in range(top_row + 1, min(bottom_row, self.line_count)):
+            parts.append(self.get_line(row))
+        if bottom_row < self.line_count:
+            parts.append(self.get_line(bottom_row)[:bottom_column])
+        return self._newline.join(parts)
+
+    def get_size(self, indent_width: int) -> Size:
+        if self._max_width is None or indent_width != self._indent_width:
+            self._indent_width = indent_width
+            self._max_width = max((cell_len(line.expandtabs(indent_width)) for line in self.iter_lines()), default=0)
+        return Size(self._max_width, self.line_count)
+
+    def replace_range(self, start: Location, end: Location, text: str) -> EditResult:
+        top, bottom = sorted((start, end))
+        top_row, top_column = top
+        bottom_row, bottom_column = bottom
+        line_count = self.line_count
+
+        insert_lines = text.splitlines()
+        if text.endswith(("\r\n", "\n", "\r")):
+            # Special case where a single newline character is inserted.
+            insert_lines.append("")
+
+        replaced_text = self.get_text_range(top, bottom)
+        before_selection = self.get_line(top_row)[:top_column] if top_row < line_count else ""
+        after_selection = self.get_line(bottom_row)[bottom_column:] if bottom_row < line_count else ""
+
+        if insert_lines:
+            insert_lines[0] = before_selection + insert_lines[0]
+            destination_column = len(insert_lines[-1])
+            insert_lines[-1] = insert_lines[-1] + after_selection
+        else:
+            destination_column = len(before_selection)
+            insert_lines = [before_selection + after_selection]
+
+        first = self._split(top_row)
+        last = self._split(min(bottom_row + 1, line_count))
+        piece = Piece(ADDED, len(self._added), len(insert_lines))
+        self._added.extend(insert_lines)
+
+        # Coalesce with the previous piece when it ends right where this one starts.
+        if first and self._pieces[first - 1].source == ADDED and self._pieces[first - 1].start + self._pieces[first - 1].count == piece.start:
+            previous = self._pieces[first - 1]
+            first -= 1
+            piece = Piece(ADDED, previous.start, previous.count + piece.count)
+        self._splice(first, last, [piece])
+
+        if self._max_width is not None:
+            self._max_width = max(self._max_width, max(cell_len(line.expandtabs(self._indent_width)) for line in insert_lines))
+
+        return EditResult((top_row + len(insert_lines) - 1, destination_column), replaced_text)
+
+
+class DocumentSnapshot:
+    """A frozen state of a TextArea document which can be written from another thread."""
+
+    def __init__(self, document: DocumentBase, state, generation: int = 0):
+        self.document = document
+        self.state = state
+        # The edit generation of the TextArea the state was taken at, see NVRTextArea.mark_saved().
+        self.generation = generation
+
+    def write(self, file, encoding: str = "utf-8"):
+        if isinstance(self.document, PieceTableDocument):
+            self.document.write(file, encoding, snapshot=self.state)
+        else:
+            file.write(self.state.encode(encoding))
+
+
+class MappedDocument(PieceTableDocument):
+    """A PieceTableDocument whose original buffer is a memory-mapped file.
+
+    Only the first screen worth of the file is indexed up front, `build_index`
+    indexes the rest and is meant to run on a worker thread. Lines are decoded
+    when they are requested, and a line only lives in memory once it was edited.
+    """
+
+    def __init__(self, path: str, encoding: str = "utf-8"):
+        self.path = path
+        self.encoding = encoding
+        self._file = open(path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._original = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._original = b""
+
+        first_line = self._original.find(b"\n")
+        if first_line > 0 and self._original[first_line - 1:first_line] == b"\r":
+            self._newline = "\r\n"
+        else:
+            self._newline = "\n"
+        self._separator = self._newline.encode(encoding)
+
+        self._starts = array("q", [0])
+        self._scanned = 0
+        self._widest = 0
+        # The most tabs in one line, each of them takes up to indent_width cells.
+        self._most_tabs = 0
+        self._next_tab = -1
+        self._indexed = 0
+        self.is_indexed = False
+        self.closed = False
+        self._scan(FIRST_SCREEN_BYTES)
+        while not self._indexed and not self.is_indexed:
+            self._scan(FIRST_SCREEN_BYTES)
+
+        self._added: list[str] = []
+        self._shown = self._indexed
+        self._pieces: list[Piece] = [Piece(ORIGINAL, 0, self._indexed)]
+        self._ends: list[int] = []
+        self._max_width: int = None
+        self._indent_width: int = None
+        self._saved = tuple(self._pieces)
+        self._update_ends()
+
+    def _scan(self, limit: int = None, lines: int = None) -> None:
+        """Extend the line index by up to limit bytes or lines."""
+        size = len(self._original)
+        stop = size if limit is None else min(size, self._scanned + limit)
+        find = self._original.find
+        original = self._original
+        separator = b"\n"
+        starts = self._starts
+        widest = self._widest
+        most_tabs = self._most_tabs
+        # The first tab at or after the line being scanned, -1 when there is none before stop. Most files
+        # have no tabs, only the lines holding one are counted and every byte is searched once.
+        next_tab = self._next_tab
+        if next_tab < starts[-1]:
+            next_tab = find(b"\t", starts[-1], stop)
+        previous = starts[-1]
+        found = 0
+        index = find(separator, self._scanned, stop)
+        while index != -1:
+            start = index + 1
+            starts.append(start)
+            if start - previous > widest:
+                widest = start - previous
+            if 0 <= next_tab < start:
+                most_tabs = max(most_tabs, original[previous:start].count(b"\t"))
+                next_tab = find(b"\t", start, stop)
+            previous = start
+            found += 1
+            if lines is not None and found >= lines:
+                stop = start
+                break
+            index = find(separator, start, stop)
+
+        self._scanned = stop
+        self._widest = widest
+        self._most_tabs = most_tabs
+        self._next_tab = next_tab
+        if stop >= size:
+            self.is_indexed = True
+            self._indexed = len(starts)
+            if size - previous > widest:
+                self._widest = size - previous
+            if next_tab >= 0:
+                self._most_tabs = max(most_tabs, original[previous:size].count(b"\t"))
+        else:
+            self._indexed = len(starts) - 1
+
+    def build_index(self, progress: Callable[[], None] = None) -> None:
+        """Index the remaining lines of the file, calling progress after every batch."""
+        while not self.is_indexed and not self.closed:
+            try:
+                self._scan(lines=INDEX_BATCH_LINES)
+            except ValueError:
+                # The mapping was closed underneath the indexer.
+                if self.closed:
+                    return
+                raise
+            if progress:
+                progress()
+
+    def extend_original(self) -> int:
+        """Make lines indexed since the last call part of the document, returns the new line count."""
+        if self._indexed > self._shown:
+            was_modified = self.is_modified
+            last = self._pieces[-1]
+            if last.source == ORIGINAL and last.start + last.count == self._shown:
+                self._pieces[-1] = Piece(ORIGINAL, last.start, self._indexed - last.start)
+            else:
+                self._pieces.append(Piece(ORIGINAL, self._shown, self._indexed - self._shown))
+            self._shown = self._indexed
+            if not was_modified:
+                self._saved = tuple(self._pieces)
+            self._update_ends()
+        return self.line_count
+
+    def _original_range(self, start: int, end: int) -> str:
+        return self._original_bytes(start, end, self.encoding).decode(self.encoding, errors="replace")
+
+    def _original_bytes(self, start: int, end: int, encoding: str) -> bytes:
+        first = self._starts[start]
+        if end < len(self._starts):
+            data = self._original[first:self._starts[end] - len(self._separator)]
+        else:
+            data = self._original[first:]
+        if encoding != self.encoding:
+            return data.decode(self.encoding, errors="replace").encode(encoding)
+        return data
+
+    def get_size(self, indent_width: int) -> Size:
+        # The widest line in bytes, with every tab of the line with the most tabs expanded, is an upper
+        # bound for the width of any line in cells, and needs no decoding.
+        widest = max(self._widest + self._most_tabs * (indent_width - 1), max((cell_len(line.expandtabs(indent_width)) for line in self._added), default=0))
+        return Size(widest, self.line_count)
+
+    def replace_range(self, start: Location, end: Location, text: str) -> EditResult:
+        result = super().replace_range(start, end, text)
+        self._max_width = None
+        return result
+
+    def close(self):
+        """Stop indexing and release the mapping and the file handle."""
+        self.closed = True
+        if isinstance(self._original, mmap.mmap):
+            self._original.close()
+        self._file.close()
+
+
+class LineInfo(Sequence):
+    """Maps vertical offsets to (line index, section) for a document that isn't wrapped."""
+
+    def __init__(self, document: DocumentBase):
+        self.document = document
+
+    def __len__(self) -> int:
+        return self.document.line_count
+
+    def __getitem__(self, offset):
+        if offset < 0:
+            offset += len(self)
+        if not 0 <= offset < len(self):
+            raise IndexError("offset out of range")
+        return (offset, 0)
+
+
+class UnwrappedDocument(WrappedDocument):
+    """A WrappedDocument which never wraps and keeps no per-line state.
+
+    WrappedDocument caches wrap offsets and tab widths for every line of the
+    document, which costs as much as the document itself for huge files. This
+    view computes everything from the requested line instead.
+    """
+
+    def wrap(self, width: int, tab_width: int | None = None) -> None:
+        self._width = 0
+        if tab_width:
+            self._tab_width = tab_width
+        self._offset_to_line_info = LineInfo(self.document)
+
+    def wrap_range(self, start: Location, old_end: Location, new_end: Location) -> None:
+        pass
+
+    @property
+    def wrapped(self) -> bool:
+        return False
+
+    @property
+    def height(self) -> int:
+        return self.document.line_count
+
+    @property
+    def lines(self) -> list[list[str]]:
+        return [[line] for line in self.document.lines]
+
+    def offset_to_location(self, offset: Offset) -> Location:
+        x, y = offset
+        line_index = min(max(0, y), self.document.line_count - 1)
+        column_index = cell_width_to_column_index(self.document.get_line(line_index), max(0, x), self._tab_width)
+        return line_index, column_index
+
+    def location_to_offset(self, location: Location) -> Offset:
+        line_index, column_index = location
+        line_index = clamp(line_index, 0, self.document.line_count - 1)
+        line = self.document.get_line(line_index)
+        return Offset(cell_len(expand_tabs_inline(line[:column_index], self._tab_width)), line_index)
+
+    def get_sections(self, line_index: int) -> list[str]:
+        return [self.document[line_index]]
+
+    def get_offsets(self, line_index: int) -> list[int]:
+        if line_index < 0 or line_index >= self.document.line_count:
+            raise ValueError(
+                f"The document line index {line_index!r} is out of bounds. "
+                f"The document contains {self.document.line_count!r} lines."
+            )
+        return []
+
+    def get_tab_widths(self, line_index: int) -> list[int]:
+        return [width for _, width in get_tab_widths(self.document.get_line(line_index), self._tab_width)]
+
+
+class WrappedLineInfo(Sequence):
+    """Maps vertical offsets to (line index, section) for a LineWrappedDocument."""
+
+    def __init__(self, wrapped_document: "LineWrappedDocument"):
+        self.wrapped_document = wrapped_document
+
+    def __len__(self) -> int:
+        return self.wrapped_document.height
+
+    def __getitem__(self, offset):
+        if offset < 0:
+            offset += len(self)
+        if not 0 <= offset < len(self):
+            raise IndexError("offset out of range")
+        return self.wrapped_document.line_at(offset)
+
+
+class LineWrappedDocument(WrappedDocument):
+    """A WrappedDocument whose edits cost as much as the lines they touch.
+
+    WrappedDocument keeps the vertical offsets of every line and the line at
+    every vertical offset, so each edit that adds or removes a line shifts all
+    of them, and its height is summed over all lines. This view keeps the wrap
+    offsets, tab widths and cell width per line, and derives vertical offsets
+    from the lines that actually wrap, which are few in source code.
+    """
+
+    def wrap(self, width: int, tab_width: int | None = None) -> None:
+        self._width = width
+        if tab_width:
+            self._tab_width = tab_width
+        self._offset_to_line_info = WrappedLineInfo(self)
+        self._line_index_to_offsets = []
+        self._wrap_offsets, self._tab_width_cache, self._cell_widths, self._tall, self._rows = self._measure(self.document.lines, 0)
+        self._width_counts = Counter(self._cell_widths)
+        self._extra_rows = sum(self._rows)
+        self._tall_offsets = None
+
+    def _measure(self, lines, first: int) -> tuple[list, list, list, list, list]:
+        """Wrap offsets, tab widths and cell widths of lines, and the indexes and extra rows of those that wrap."""
+        width = self._width
+        tab_width = self._tab_width
+        wrap_offsets, tab_widths, cell_widths, tall, rows = [], [], [], [], []
+        for line_index, line in enumerate(lines, first):
+            tab_sections = get_tab_widths(line, tab_width)
+            offsets = compute_wrap_offsets(line, width, tab_width, precomputed_tab_sections=tab_sections) if width else []
+            wrap_offsets.append(offsets)
+            tab_widths.append([tab for _, tab in tab_sections])
+            cell_widths.append(cell_len(line.expandtabs(tab_width)))
+            if offsets:
+                tall.append(line_index)
+                rows.append(len(offsets))
+        return wrap_offsets, tab_widths, cell_widths, tall, rows
+
+    def wrap_range(self, start: Location, old_end: Location, new_end: Location) -> None:
+        document = self.document
+        old_max_index = len(self._wrap_offsets) - 1
+        new_max_index = document.line_count - 1
+        start_line_index = clamp(start[0], 0, min(old_max_index, new_max_index))
+        old_end_line_index = clamp(old_end[0], 0, old_max_index)
+        new_end_line_index = clamp(new_end[0], 0, new_max_index)
+        top, old_bottom = sorted((start_line_index, old_end_line_index))
+        new_bottom = max(start_line_index, new_end_line_index)
+
+        lines = [document.get_line(line_index) for line_index in range(top, new_bottom + 1)]
+        wrap_offsets, tab_widths, cell_widths, tall, rows = self._measure(lines, top)
+
+        end = old_bottom + 1
+        counts = self._width_counts
+        for cell_width in self._cell_widths[top:end]:
+            counts[cell_width] -= 1
+            if not counts[cell_width]:
+                del counts[cell_width]
+        counts.update(cell_widths)
+        self._wrap_offsets[top:end] = wrap_offsets
+        self._tab_width_cache[top:end] = tab_widths
+        self._cell_widths[top:end] = cell_widths
+
+        # Only the lines that wrap are indexed, so an edit shifts as many entries as there are wrapping lines below it.
+        low = bisect_left(self._tall, top)
+        high = bisect_left(self._tall, end)
+        shift = new_bottom - old_bottom
+        if shift:
+            self._tall[high:] = [line_index + shift for line_index in self._tall[high:]]
+        self._tall[low:high] = tall
+        self._extra_rows += sum(rows) - sum(self._rows[low:high])
+        self._rows[low:high] = rows
+        self._tall_offsets = None
+
+    def _offsets(self) -> tuple[list[int], list[int]]:
+        """The vertical offset of each line that wraps, and the extra rows of the wrapping lines before each of them."""
+        if self._tall_offsets is None:
+            extra = list(accumulate(self._rows, initial=0))
+            self._tall_offsets = ([line_index + rows for line_index, rows in zip(self._tall, extra)], extra)
+        return self._tall_offsets
+
+    def line_at(self, y_offset: int) -> tuple[int, int]:
+        """The line index and section shown at a vertical offset."""
+        tall_offsets, extra = self._offsets()
+        position = bisect_right(tall_offsets, y_offset) - 1
+        if position < 0:
+            return y_offset, 0
+        section = y_offset - tall_offsets[position]
+        if section <= self._rows[position]:
+            return self._tall[position], section
+        return y_offset - extra[position + 1], 0
+
+    def line_offset(self, line_index: int) -> int:
+        """The vertical offset of the first section of a line."""
+        _, extra = self._offsets()
+        return line_index + extra[bisect_left(self._tall, line_index)]
+
+    @property
+    def wrapped(self) -> bool:
+        return bool(self._tall)
+
+    @property
+    def height(self) -> int:
+        return len(self._wrap_offsets) + self._extra_rows
+
+    def get_size(self) -> Size:
+        """The size of the document when it isn't wrapped, as DocumentBase.get_size with the tab width of this view."""
+        return Size(max(self._width_counts, default=0), len(self._wrap_offsets))
+
+    def location_to_offset(self, location: Location) -> Offset:
+        line_index, column_index = location
+        line_index = clamp(line_index, 0, len(self._wrap_offsets) - 1)
+        wrap_offsets = self._wrap_offsets[line_index]
+        section_index = bisect_right(wrap_offsets, column_index)
+        section_start = wrap_offsets[section_index - 1] if section_index else 0
+        section = self.get_sections(line_index)[section_index]
+        x_offset = cell_len(expand_tabs_inline(section[:column_index - section_start], self._tab_width))
+        return Offset(x_offset, self.line_offset(line_index) + section_index)
+
+
+class EditJournal:
+    """Append-only swap file of the edits made to a buffer since it was last saved.
+
+    The first line is a JSON header with the path and the (mtime, size, inode)
+    signature of the file the edits apply to. Every following line is one
+    replace_range() call as [top_row, top_column, bottom_row, bottom_column,
+    text], or {"load": text} when the whole buffer was replaced and couldn't be
+    recorded as the lines that changed. Records are
+    appended and fsync'ed in batches on a background thread, so an edit costs
+    in proportion to its own size. The journal file only exists while it holds
+    records, and replaying them over the file restores the buffer after a crash.
+    """
+
+    def __init__(self, path: str, file_path: str):
+        self.path = path
+        self.file_path = os.path.abspath(file_path)
+        self.signature = None
+        # Number of records ever added, a checkpoint drops the records up to a sequence number.
+        self.sequence = 0
+        self._records: list[tuple[int, str]] = []
+        self._queue: list[str] = []
+        self._file = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread: threading.Thread = None
+
+    @staticmethod
+    def path_for(directory: str, file_path: str) -> str:
+        """Return the journal path for file_path inside directory."""
+        name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+        return os.path.join(directory, name + ".journal")
+
+    def read(self) -> tuple[dict, list]:
+        """Return the header and records of the journal on disk, or ({}, []) when there is none.
+
+        A record torn by a crash ends the journal.
+        """
+        try:
+            file = open(self.path, "r", encoding="utf-8", newline="\n")
+        except OSError:
+            return {}, []
+        records = []
+        with file:
+            try:
+                header = json.loads(file.readline())
+            except ValueError:
+                return {}, []
+            for line in file:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+        if header.get("path") != self.file_path:
+            return {}, []
+        return header, records
+
+    def matches(self, header: dict, signature) -> bool:
+        """Whether a header read from disk belongs to the file in the state given by signature."""
+        return signature is not None and header.get("signature") == list(signature)
+
+    def start(self, signature, records: list = ()):
+        """Begin journaling edits of the file with the given signature, keeping records that weren't saved yet."""
+        with self._io_lock:
+            with self._condition:
+                self._records = []
+                self._queue = []
+                for record in records:
+                    self.sequence += 1
+                    self._records.append((self.sequence, json.dumps(record)))
+                self.signature = signature
+                self._closed = False
+            self._rewrite()
+
+    def record(self, start: Location, end: Location, text: str):
+        """Add a replace_range() call to the journal."""
+        self._add(json.dumps([start[0], start[1], end[0], end[1], text]))
+
+    def record_load(self, previous: DocumentBase, document: DocumentBase):
+        """Add the replacement of the buffer previous by document to the journal.
+
+        The lines are diffed and only the runs that changed are recorded, as
+        replace_range() calls, so a merge or a reload costs as much as it
+        changed instead of the whole buffer.
+        """
+        if previous.newline != document.newline or (isinstance(previous, MappedDocument) and not previous.is_indexed):
+            # Rows past the indexed part of the file, or a change of the newline style, can't be replayed as edits.
+            self._add(json.dumps({"load": document.text}))
+            return
+        old_lines = list(previous.iter_lines()) if isinstance(previous, PieceTableDocument) else previous.lines
+        new_lines = list(document.iter_lines()) if isinstance(document, PieceTableDocument) else document.lines
+        newline = document.newline
+        if len(old_lines) == len(new_lines):
+            # Lines were only changed in place (or as many added as removed), which doesn't need the matcher.
+            opcodes = [("replace", 0, len(old_lines), 0, len(new_lines))]
+        else:
+            opcodes = SequenceMatcher(None, old_lines, new_lines).get_opcodes()
+        # Runs are recorded bottom up, so the rows of each one are still those of previous when it is replayed.
+        for tag, first, end, new_first, new_end in reversed(opcodes):
+            if tag == "equal":
+                continue
+            if tag == "replace" and end - first == new_end - new_first:
+                # Runs of as many lines are compared line by line, which also finds the changes between
+                # lines repeated all over the buffer, as the matcher ignores those.
+                for row, new_row in zip(range(end - 1, first - 1, -1), range(new_end - 1, new_first - 1, -1)):
+                    if old_lines[row] != new_lines[new_row]:
+                        self._record_lines(old_lines, row, row + 1, [new_lines[new_row]], newline)
+                continue
+            self._record_lines(old_lines, first, end, new_lines[new_first:new_end], newline)
+
+    def _record_lines(self, lines, first: int, end: int, inserted: list[str], newline: str):
+        """Add the replacement of lines[first:end] by inserted to the journal, either of them can be empty."""
+        text = newline.join(inserted)
+        if first < end and inserted:
+            self.record((first, 0), (end - 1, len(lines[end - 1])), text)
+        elif end < len(lines):
+            self.record((first, 0), (end, 0), text + newline if inserted else "")
+        else:
+            # Lines are added or removed at the end of the buffer, along with the newline before them.
+            self.record((first - 1, len(lines[first - 1])), (end - 1, len(lines[end - 1])), newline + text if inserted else "")
+
+    def _add(self, line: str):
+        with self._condition:
+            if self._closed:
+                return
+            self.sequence += 1
+            self._records.append((self.sequence, line))
+            self._queue.append(line)
+            self._condition.notify()
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="EditJournal", daemon=True)
+                self._thread.start()
+
+    def checkpoint(self, signature, sequence: int = None):
+        """The file was saved with the records up to sequence (or all of them), and now has signature."""
+        with self._io_lock:
+            with self._condition:
+                if sequence is None:
+                    sequence = self.sequence
+                self._records = [(number, line) for number, line in self._records if number > sequence]
+                self._queue = []
+                self.signature = signature
+            self._rewrite()
+
+    def _rewrite(self):
+        """Replace the journal file with the header and the current records, or remove it when there are none."""
+        if self._file:
+            self._file.close()
+            self._file = None
+        with self._condition:
+            lines = [line for _, line in self._records]
+            header = json.dumps({"path": self.file_path, "signature": self.signature})
+        if not lines:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, lambda file: file.write(("\n".join([header] + lines) + "\n").encode("utf-8")))
+        self._file = open(self.path, "ab")
+
+    def flush(self):
+        """Write and fsync the queued records now."""
+        with self._io_lock:
+            with self._condition:
+                lines = self._queue
+                self._queue = []
+            if not lines:
+                return
+            if self._file is None:
+                # The journal file is created with the first record, _rewrite writes every record so far.
+                self._rewrite()
+                return
+            self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if self._closed:
+                    return
+            # Let a burst of keystrokes gather so it costs a single fsync.
+            time.sleep(JOURNAL_SYNC_INTERVAL)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error writing the edit journal '{self.path}': {e}")
+
+    def close(self, delete: bool = False):
+        """Write the queued records and stop journaling, removing the journal file when delete is set."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        with self._io_lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            if delete:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+
+def replay_journal(document: DocumentBase, records: list) -> DocumentBase:
+    """Apply EditJournal records to document, returns the resulting document (a new one after a load record)."""
+    for record in records:
+        if isinstance(record, dict):
+            document = Document(record["load"])
+        else:
+            top_row, top_column, bottom_row, bottom_column, text = record
+            document.replace_range((top_row, top_column), (bottom_row, bottom_column), text)
+    return document
@@ -0,0 +1,950 @@
+import os
+import sys
+import json
+import stat
+import atexit
+import errno
+import select
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import ctypes, ctypes.util
+from collections import OrderedDict
+from typing import Callable, Dict, List, BinaryIO, Optional, Tuple
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+# Seconds to wait for more events after one arrived, and the longest a burst is coalesced for.
+SETTLE_TIME = 0.05
+SETTLE_LIMIT = 0.5
+
+# Most folders and folder entries the directory cache holds on to.
+DIRECTORY_CACHE_FOLDERS = 512
+DIRECTORY_CACHE_ENTRIES = 1_000_000
+
+# A listing taken less than this many seconds after its folder changed may have missed a change within
+# the same mtime tick, so it isn't trusted.
+RACY_WINDOW = 2.0
+
+# Seconds between two progress reports of a file operation, and bytes a copy reads at once.
+PROGRESS_INTERVAL = 0.1
+COPY_CHUNK = 1024 * 1024
+
+# Seconds a changed config file waits for more changes before it is written.
+CONFIG_WRITE_DELAY = 0.5
+
+# The mode new files get from open(), mkstemp creates its files readable by their owner only.
+UMASK = os.umask(0)
+os.umask(UMASK)
+NEW_FILE_MODE = 0o666 & ~UMASK
+
+
+def file_signature(path):
+    """Return a cheap (mtime, size, inode) signature of a file, or None if it can't be stat'ed."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def atomic_write(path: str, write: Callable[[BinaryIO], None], before_replace: Callable[[], None] = None):
+    """Write path through write(file) into a temporary file next to it, then rename it over path.
+
+    Readers of path see either the old or the new contents, never a partial write.
+    A symlink is followed, the file it points to is replaced and the link kept.
+    """
+    path = os.path.realpath(path)
+    fd, temp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".nvrtmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            os.chmod(temp_path, NEW_FILE_MODE)
+        if before_replace:
+            before_replace()
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> list:
+        """Wait up to timeout seconds and return a list of (wd, mask, name) tuples."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """Process-wide file watcher shared by every editor screen.
+
+    Files are watched through inotify on their parent directory on Linux, so
+    atomic saves by other editors (write + rename) are noticed too. Elsewhere,
+    or when inotify isn't available, every watched path is stat'ed every
+    poll_interval seconds, as are the directories inotify refused to watch
+    (when the user's inotify watches ran out, for instance). In all cases a
+    callback only fires when the (mtime, size, inode) signature of the file
+    actually changed. Callbacks run on the watcher thread and have to hand
+    their work to the UI themselves.
+
+    Folders can be watched for entries being created, deleted or renamed with
+    watch_directory(). Their callbacks get the names that changed during a
+    burst of events at once, or None when the names aren't known (on the stat
+    backend, or after the inotify queue overflowed).
+
+    Errors are reported to on_error(message), from whichever thread hit them,
+    or printed while it isn't set.
+    """
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self.on_error: Optional[Callable[[str], None]] = None
+        self._lock = threading.Lock()
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._signatures: Dict[str, tuple] = {}
+        self._folderCallbacks: Dict[str, List[Callable[[str, Optional[set]], None]]] = {}
+        self._folderStamps: Dict[str, Optional[int]] = {}
+        self._directories: Dict[str, int] = {}
+        self._wds: Dict[int, str] = {}
+        # Directories add_watch failed for, which are stat'ed every poll_interval instead.
+        self._polled: set = set()
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+        self._inotify: Inotify = None
+
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = Inotify()
+            except (OSError, AttributeError):
+                self._inotify = None
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._inotify else "stat"
+
+    def watch(self, path: str, callback: Callable[[str], None]):
+        """Call callback(path) from the watcher thread whenever the file at path changes."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._callbacks:
+                self._callbacks[path] = []
+                self._signatures[path] = file_signature(path)
+                self._add_directory(os.path.dirname(path))
+            self._callbacks[path].append(callback)
+        self._start()
+
+    def unwatch(self, path: str, callback: Callable[[str], None]):
+        """Stop calling callback for path."""
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._callbacks.get(path)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._callbacks[path]
+                del self._signatures[path]
+                self._remove_directory(os.path.dirname(path))
+
+    def watch_directory(self, path: str, callback: Callable[[str, Optional[set]], None]):
+        """Call callback(path, names) from the watcher thread whenever entries of the folder at path change."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._folderCallbacks:
+                self._folderCallbacks[path] = []
+                self._folderStamps[path] = self._folder_stamp(path)
+                self._add_directory(path)
+            self._folderCallbacks[path].append(callback)
+        self._start()
+
+    def unwatch_directory(self, path: str, callback: Callable[[str, Optional[set]], None]):
+        """Stop calling callback for the folder at path."""
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._folderCallbacks.get(path)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._folderCallbacks[path]
+                del self._folderStamps[path]
+                self._remove_directory(path)
+
+    @staticmethod
+    def _folder_stamp(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _report(self, message: str):
+        if self.on_error is None:
+            print(message)
+            return
+        try:
+            self.on_error(message)
+        except Exception as e:
+            print(f"{message} ({e.__class__.__name__} reporting it: {e})")
+
+    def _add_directory(self, directory: str):
+        if not self._inotify or directory in self._directories or directory in self._polled:
+            return
+        try:
+            wd = self._inotify.add_watch(directory, WATCH_MASK)
+        except OSError as e:
+            self._polled.add(directory)
+            self._report(f"Can't watch '{directory}' for changes ({e.strerror or e}), checking it every {self.poll_interval:g} s instead.")
+            return
+        self._directories[directory] = wd
+        self._wds[wd] = directory
+
+    def _remove_directory(self, directory: str):
+        if directory not in self._directories and directory not in self._polled:
+            return
+        if directory in self._folderCallbacks or any(os.path.dirname(path) == directory for path in self._callbacks):
+            return
+        if directory in self._polled:
+            self._polled.discard(directory)
+            return
+        wd = self._directories.pop(directory)
+        self._wds.pop(wd, None)
+        self._inotify.rm_watch(wd)
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="FileWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread, watches are kept and resume on the next watch()."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        nextPoll = time.monotonic() + self.poll_interval
+        while not self._stopped.is_set():
+            if self._inotify:
+                changed = set()
+                folders: Dict[str, Optional[set]] = {}
+                events = self._inotify.read_events(self.poll_interval)
+                deadline = time.monotonic() + SETTLE_LIMIT
+                while events:
+                    with self._lock:
+                        for wd, mask, name in events:
+                            if mask & IN_Q_OVERFLOW:
+                                changed.update(self._callbacks)
+                                folders.update((folder, None) for folder in self._folderCallbacks)
+                            elif wd in self._wds and not mask & IN_IGNORED:
+                                directory = self._wds[wd]
+                                changed.add(os.path.join(directory, name))
+                                if directory in self._folderCallbacks and name and folders.get(directory, set()) is not None:
+                                    folders.setdefault(directory, set()).add(name)
+                    # A single save usually produces a burst of events, wait for it to settle.
+                    events = self._inotify.read_events(SETTLE_TIME) if time.monotonic() < deadline else []
+                if time.monotonic() >= nextPoll:
+                    nextPoll = time.monotonic() + self.poll_interval
+                    with self._lock:
+                        changed.update(path for path in self._callbacks if os.path.dirname(path) in self._polled)
+                        polled = [folder for folder in self._folderCallbacks if folder in self._polled]
+                    folders.update(self._changed_folders(polled))
+                self.check(changed)
+                self._dispatch_folders(folders)
+            else:
+                self._stopped.wait(self.poll_interval)
+                self.check()
+                self._dispatch_folders(self._changed_folders())
+
+    def check(self, paths=None):
+        """Stat the given (or all) watched paths and dispatch callbacks for the ones that changed."""
+        with self._lock:
+            candidates = [path for path in (self._callbacks if paths is None else paths) if path in self._callbacks]
+        for path in candidates:
+            signature = file_signature(path)
+            with self._lock:
+                if path not in self._signatures or self._signatures[path] == signature:
+                    continue
+                self._signatures[path] = signature
+                callbacks = list(self._callbacks[path])
+            for callback in callbacks:
+                try:
+                    callback(path)
+                except Exception as e:
+                    self._report(f"Error in file watcher callback for '{path}': {e}")
+
+
+    def _changed_folders(self, folders: List[str] = None) -> Dict[str, Optional[set]]:
+        """Stat the given (or every) watched folder and return the ones whose mtime changed, for the stat backend."""
+        if folders is None:
+            with self._lock:
+                folders = list(self._folderCallbacks)
+        changed = {}
+        for folder in folders:
+            stamp = self._folder_stamp(folder)
+            with self._lock:
+                if folder in self._folderStamps and self._folderStamps[folder] != stamp:
+                    self._folderStamps[folder] = stamp
+                    changed[folder] = None
+        return changed
+
+    def _dispatch_folders(self, folders: Dict[str, Optional[set]]):
+        for folder, names in folders.items():
+            with self._lock:
+                callbacks = list(self._folderCallbacks.get(folder, ()))
+            for callback in callbacks:
+                try:
+                    callback(folder, names)
+                except Exception as e:
+                    self._report(f"Error in file watcher callback for '{folder}': {e}")
+
+
+class AutoSaver:
+    """Writes files on a background thread.
+
+    A write submitted for a path replaces a write for the same path that is
+    still queued, so a burst of saves reaches the disk once, with the newest
+    contents. Every write goes through atomic_write. done(path, error) is
+    called on the writer thread after each write, before flush() returns.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending: Dict[str, tuple] = {}
+        self._writing: str = None
+        self._thread: threading.Thread = None
+
+    def submit(self, path: str, write: Callable[[BinaryIO], None], done: Callable[[str, Exception], None] = None):
+        """Queue write(file) for path, replacing a queued write for the same path."""
+        path = os.path.abspath(path)
+        with self._condition:
+            self._pending.pop(path, None)
+            self._pending[path] = (write, done)
+            self._condition.notify_all()
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="AutoSaver", daemon=True)
+                self._thread.start()
+
+    def is_pending(self, path: str = None) -> bool:
+        """Whether a write for path (or any write) is queued or in progress."""
+        with self._condition:
+            return self._is_pending(path)
+
+    def _is_pending(self, path: str = None) -> bool:
+        if path is None:
+            return bool(self._pending) or self._writing is not None
+        path = os.path.abspath(path)
+        return path in self._pending or self._writing == path
+
+    def flush(self, path: str = None, timeout: float = None) -> bool:
+        """Block until the writes for path (or all writes) are on disk. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._is_pending(path), timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                path = next(iter(self._pending))
+                write, done = self._pending.pop(path)
+                self._writing = path
+
+            error = None
+            try:
+                atomic_write(path, write)
+            except Exception as e:
+                error = e
+
+            if done:
+                try:
+                    done(path, error)
+                except Exception as e:
+                    print(f"Error in autosave callback for '{path}': {e}")
+
+            with self._condition:
+                self._writing = None
+                self._condition.notify_all()
+
+
+class OperationCancelled(Exception):
+    """Raised inside a FileOperation once it was cancelled."""
+
+
+class FileOperation:
+    """A delete, copy, move or creation run by FileOperations.
+
+    kind is "delete", "copy", "move", "create_file" or "create_folder", copies
+    and moves go from path to target. progress(operation) is called from the
+    worker thread at most every PROGRESS_INTERVAL seconds, done(operation)
+    once it finished, failed (error is set then) or was cancelled. A cancelled
+    copy or move removes what it copied already, a cancelled delete leaves
+    what it didn't get to.
+    """
+
+    KINDS = ("delete", "copy", "move", "create_file", "create_folder")
+    VERBS = {"delete": "Deleting", "copy": "Copying", "move": "Moving", "create_file": "Creating", "create_folder": "Creating"}
+
+    def __init__(self, kind: str, path: str, target: str = None, progress: Callable[["FileOperation"], None] = None, done: Callable[["FileOperation"], None] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown file operation '{kind}'")
+        self.kind = kind
+        self.path = os.path.abspath(path)
+        self.target = os.path.abspath(target) if target else None
+        self.progress = progress
+        self.done = done
+        self.entries = 0
+        self.bytes = 0
+        self.error: Exception = None
+        self.finished = False
+        self._cancelled = threading.Event()
+        self._reported = time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def changed_paths(self) -> List[str]:
+        """The paths whose entries in the file trees changed."""
+        if self.kind == "copy":
+            return [self.target]
+        if self.kind == "move":
+            return [self.path, self.target]
+        return [self.path]
+
+    def __str__(self) -> str:
+        name = os.path.basename(self.path)
+        if self.kind in ("copy", "move"):
+            name += f" to {self.target}"
+        status = f"{self.VERBS[self.kind]} {name}: {self.entries} entries"
+        if self.bytes:
+            status += f", {self.bytes / 1024 ** 2:.1f} MB"
+        return status
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _step(self, entries: int = 1, size: int = 0):
+        """Count progress, report it when it is due and stop here if the operation was cancelled."""
+        self.entries += entries
+        self.bytes += size
+        if self.cancelled:
+            raise OperationCancelled()
+        now = time.monotonic()
+        if self.progress and now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            try:
+                self.progress(self)
+            except Exception as e:
+                print(f"Error in file operation progress callback: {e}")
+
+    def run(self):
+        try:
+            if self.cancelled:
+                raise OperationCancelled()
+            if self.kind == "delete":
+                self._delete(self.path)
+                directoryCache.removed(self.path)
+            elif self.kind == "create_file":
+                # "x" fails instead of truncating a file that exists already.
+                open(self.path, "x").close()
+                directoryCache.added(self.path)
+            elif self.kind == "create_folder":
+                os.makedirs(self.path)
+                directoryCache.added(self.path)
+            elif self.kind == "copy":
+                self._copy_or_undo(self.path, self.target)
+                directoryCache.added(self.target)
+            elif self.kind == "move":
+                self._move(self.path, self.target)
+                directoryCache.removed(self.path)
+                directoryCache.added(self.target)
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            if self.kind == "delete" and os.path.lexists(self.path):
+                directoryCache.invalidate(os.path.dirname(self.path))
+        if self.done:
+            try:
+                self.done(self)
+            except Exception as e:
+                print(f"Error in file operation callback: {e}")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except PermissionError:
+            # Read-only files can't be deleted on Windows until they are made writable.
+            os.chmod(path, stat.S_IWRITE)
+            os.remove(path)
+
+    def _delete(self, path: str, cancellable: bool = True):
+        step = self._step if cancellable else lambda *args: None
+        if not os.path.isdir(path) or os.path.islink(path):
+            self._remove(path)
+            step()
+            return
+        # Folders are pushed twice, to be listed and then removed once everything in them is.
+        stack = [(path, False)]
+        while stack:
+            folder, emptied = stack.pop()
+            if emptied:
+                os.rmdir(folder)
+                step()
+                continue
+            stack.append((folder, True))
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, False))
+                    else:
+                        self._remove(entry.path)
+                        step()
+
+    def _copy_file(self, source: str, target: str):
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), target)
+            self._step()
+            return
+        with open(source, "rb") as reader, open(target, "xb") as writer:
+            while True:
+                chunk = reader.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                self._step(0, len(chunk))
+        shutil.copystat(source, target)
+        self._step()
+
+    def _copy(self, source: str, target: str):
+        if not os.path.isdir(source) or os.path.islink(source):
+            self._copy_file(source, target)
+            return
+        stack = [(source, target)]
+        while stack:
+            folder, copy = stack.pop()
+            os.mkdir(copy)
+            self._step()
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, os.path.join(copy, entry.name)))
+                    else:
+                        self._copy_file(entry.path, os.path.join(copy, entry.name))
+            shutil.copymode(folder, copy)
+
+    def _copy_or_undo(self, source: str, target: str):
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "File exists", target)
+        try:
+            self._copy(source, target)
+        except BaseException:
+            if os.path.lexists(target):
+                self._delete(target, cancellable=False)
+            raise
+
+    def _move(self, source: str, target: str):
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "File exists", target)
+        try:
+            os.rename(source, target)
+            self._step()
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        # Another file system, copy and then delete the source, which can't be cancelled any more.
+        self._copy_or_undo(source, target)
+        self._delete(source, cancellable=False)
+
+
+class FileOperations:
+    """Runs FileOperations one after the other on a background thread."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queue: List[FileOperation] = []
+        self.current: FileOperation = None
+        self._thread: threading.Thread = None
+
+    def submit(self, operation: FileOperation) -> FileOperation:
+        with self._condition:
+            self._queue.append(operation)
+            self._condition.notify_all()
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="FileOperations", daemon=True)
+                self._thread.start()
+        return operation
+
+    def pending(self) -> List[FileOperation]:
+        """The running operation and the queued ones, the running one may have just finished."""
+        with self._condition:
+            return ([self.current] if self.current else []) + list(self._queue)
+
+    def cancel_all(self):
+        for operation in self.pending():
+            operation.cancel()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until every operation finished. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self.current, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                self.current = self._queue.pop(0)
+            self.current.run()
+            with self._condition:
+                self.current = None
+                self._condition.notify_all()
+
+
+def scan_directory(path: str):
+    """Yield (name, is_dir) for the files and folders in the folder at path."""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                # DirEntry caches the file type from the directory listing, so this doesn't stat on most systems.
+                if entry.is_dir():
+                    yield (entry.name, True)
+                elif entry.is_file():
+                    yield (entry.name, False)
+            except OSError:
+                continue
+
+
+def pack_listing(entries) -> Tuple[str, bytes]:
+    """Pack (name, is_dir) pairs into the names joined by NUL, which no file name contains, and a byte per entry telling folders apart."""
+    entries = list(entries)
+    return "\0".join(entry[0] for entry in entries), bytes(entry[1] for entry in entries)
+
+
+def unpack_listing(names: str, kinds: bytes) -> List[Tuple[str, bool]]:
+    """The (name, is_dir) pairs of a listing packed by pack_listing."""
+    return list(zip(names.split("\0"), map(bool, kinds))) if kinds else []
+
+
+class DirectoryCache:
+    """Process-wide cache of folder listings shared by every file tree.
+
+    A listing is packed by pack_listing, so a big folder costs little more
+    than the characters of its names, and is only handed out while the mtime
+    of its folder is unchanged, so checking one costs a single stat. The least
+    recently used listings are dropped once more than DIRECTORY_CACHE_FOLDERS
+    folders or DIRECTORY_CACHE_ENTRIES entries are held. Changes made by the
+    editor itself are patched into the cached listing with added() and
+    removed() instead of invalidating it.
+    """
+
+    def __init__(self, max_folders: int = DIRECTORY_CACHE_FOLDERS, max_entries: int = DIRECTORY_CACHE_ENTRIES):
+        self.max_folders = max_folders
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._listings: OrderedDict[str, tuple] = OrderedDict()
+        self._entries = 0
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino)
+
+    def get(self, path: str) -> Optional[Tuple[str, bytes]]:
+        """Return the packed listing of path if the folder didn't change since it was cached, otherwise None."""
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        with self._lock:
+            cached = self._listings.get(path)
+            if cached is None or stamp is None or cached[0] != stamp:
+                return None
+            self._listings.move_to_end(path)
+            return cached[1], cached[2]
+
+    def stamp(self, path: str):
+        """Return the token to hand to put() for a listing of path that is about to be taken."""
+        return self._stamp(os.path.abspath(path))
+
+    def put(self, path: str, stamp, names: str, kinds: bytes):
+        """Cache the packed listing of path, taken after stamp() returned stamp."""
+        if stamp is None or time.time() - stamp[0] / 1e9 < RACY_WINDOW:
+            return
+        path = os.path.abspath(path)
+        with self._lock:
+            self._drop(path)
+            self._listings[path] = (stamp, names, kinds)
+            self._entries += len(kinds)
+            while self._listings and (len(self._listings) > self.max_folders or self._entries > self.max_entries):
+                self._drop(next(iter(self._listings)))
+
+    def _drop(self, path: str):
+        cached = self._listings.pop(path, None)
+        if cached is not None:
+            self._entries -= len(cached[2])
+
+    def invalidate(self, path: str):
+        """Forget the listing of the folder at path."""
+        with self._lock:
+            self._drop(os.path.abspath(path))
+
+    def _patch(self, folder: str, patch: Callable[[list], list]):
+        folder = os.path.abspath(folder)
+        stamp = self._stamp(folder)
+        with self._lock:
+            cached = self._listings.get(folder)
+            if cached is None:
+                return
+            self._drop(folder)
+            if stamp is None:
+                return
+            names, kinds = pack_listing(patch(unpack_listing(cached[1], cached[2])))
+            self._listings[folder] = (stamp, names, kinds)
+            self._entries += len(kinds)
+
+    def changed(self, path: str, entries: Dict[str, Optional[bool]]):
+        """Entries of the folder at path changed, patch {name: is_dir, or None once it's gone} into its cached listing."""
+        self._patch(path, lambda listing: [item for item in listing if item[0] not in entries] + [(name, is_dir) for name, is_dir in entries.items() if is_dir is not None])
+        for name, is_dir in entries.items():
+            if not is_dir:
+                self.invalidate(os.path.join(path, name))
+
+    def added(self, path: str):
+        """The editor created path, add it to the cached listing of its folder."""
+        self.changed(os.path.dirname(os.path.abspath(path)), {os.path.basename(path): os.path.isdir(path)})
+
+    def removed(self, path: str):
+        """The editor deleted path, remove it from the cached listing of its folder and forget its own listing."""
+        self.changed(os.path.dirname(os.path.abspath(path)), {os.path.basename(path): None})
+
+
+class ConfigStore:
+    """A JSON object in a file, kept in memory.
+
+    The file is read once. Changes are written together CONFIG_WRITE_DELAY
+    seconds after the first of them, through atomic_write, and the ones
+    still pending are written when the process exits. When someone else
+    changes the file it is read again, keeping the keys changed here that
+    aren't written yet. A file that can't be read, like one caught half
+    written or with a typo, is neither taken over nor written over; the
+    changes made here wait until it can be read. Listeners get the set of
+    keys that changed: on the calling thread for changes made here, on the
+    watcher thread for changes on disk. Use config_store to share one store
+    per file.
+    """
+
+    def __init__(self, path: str, default: dict = None):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._timer: threading.Timer = None
+        # Keys changed here that aren't on disk yet.
+        self._unsaved = set()
+        self._signature = None
+        # Whether the file on disk couldn't be read. It isn't written over then, the changes made here
+        # wait until it can be read again.
+        self._unreadable = False
+        self._listeners: List[Callable[[set], None]] = []
+        try:
+            self.data = self._read()
+        except (OSError, ValueError) as e:
+            print(f"Error reading '{self.path}', using the defaults until it can be read: {e}")
+            self.data = dict(default or {})
+            self._unreadable = True
+        if self.data is None:
+            self.data = dict(default or {})
+            self._unsaved.update(self.data)
+            self.flush()
+        watcher.watch(self.path, self._file_changed)
+
+    def _read(self) -> Optional[dict]:
+        """The object in the file, None if there is no file. Raises OSError or ValueError if it can't be read."""
+        signature = file_signature(self.path)
+        try:
+            with open(self.path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError("it doesn't hold a JSON object")
+        self._signature = signature
+        return data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self.data and self.data[key] == value:
+                return
+            self.data[key] = value
+        self.save(key)
+
+    def save(self, *keys):
+        """Write the store soon, after keys of data were changed in place."""
+        with self._lock:
+            self._unsaved.update(keys)
+            if self._timer is None:
+                self._timer = threading.Timer(CONFIG_WRITE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if keys:
+            self._notify(set(keys))
+
+    def flush(self):
+        """Write the pending changes now."""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self._unreadable:
+                return
+            try:
+                text = json.dumps(self.data, indent=4)
+            except RuntimeError:
+                # The data was changed in place while it was serialized, try again soon.
+                self.save()
+                return
+            try:
+                atomic_write(self.path, lambda file: file.write(text.encode("utf-8")))
+            except OSError as e:
+                print(f"Error writing '{self.path}': {e}")
+                return
+            self._unsaved.clear()
+            self._signature = file_signature(self.path)
+
+    def subscribe(self, listener: Callable[[set], None]):
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[set], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, keys: set):
+        for listener in list(self._listeners):
+            try:
+                listener(keys)
+            except Exception as e:
+                print(f"Error in config listener for '{self.path}': {e}")
+
+    def _file_changed(self, path: str):
+        """Called from the file watcher thread when the file changed on disk."""
+        with self._lock:
+            if file_signature(self.path) == self._signature:
+                # Written by flush.
+                return
+            try:
+                data = self._read()
+            except (OSError, ValueError) as e:
+                # Half written by an editor, or a typo; the data is kept until the file can be read again.
+                print(f"Error reading '{self.path}', keeping the settings in use: {e}")
+                self._unreadable = True
+                return
+            self._unreadable = False
+            if data is None:
+                return
+            for key in self._unsaved:
+                if key in self.data:
+                    data[key] = self.data[key]
+            changed = {key for key in set(data) | set(self.data) if data.get(key) != self.data.get(key)}
+            self.data = data
+            if self._unsaved and not self._timer:
+                # Held back while the file couldn't be read.
+                self.save()
+        if changed:
+            self._notify(changed)
+
+
+# The ConfigStore of each file, see config_store.
+configStores: Dict[str, ConfigStore] = {}
+
+
+def config_store(path: str, default: dict = None) -> ConfigStore:
+    """Return the ConfigStore shared for the file at path, creating the file with default if it doesn't exist."""
+    path = os.path.abspath(path)
+    if path not in configStores:
+        configStores[path] = ConfigStore(path, default)
+    return configStores[path]
+
+
+@atexit.register
+def flush_config_stores():
+    for store in list(configStores.values()):
+        store.flush()
+
+
+watcher = FileWatcher()
+autosaver = AutoSaver()
+directoryCache = DirectoryCache()
+fileOperations = FileOperations()
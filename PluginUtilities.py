@@ -1,53 +1,272 @@
 import os
+import sys
 import json
-import importlib
-from textual.app import App
-from typing import Dict
+import time
+import threading
+import subprocess
+import importlib, importlib.util
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Not imported otherwise, the plugin host process runs this file without needing textual.
+    from textual.app import App
+
+# Seconds an isolated plugin may take to start and construct its plugin class, and to answer any later call.
+# The events of other plugins are skipped while one of their hooks runs longer, see HookLane.
+PLUGIN_LOAD_TIMEOUT = 10.0
+PLUGIN_CALL_TIMEOUT = 1.0
+# The methods of the app an isolated plugin can call, with arguments that can be sent as JSON.
+PLUGIN_APP_METHODS = ("notify", "bell", "clear_notifications", "copy_to_clipboard")
+
+# Events plugins can hook by naming a method of their plugin class for them under "hooks" in their
+# config.json, like {"save": "on_save"}. The method is called with a dict describing the event.
+PLUGIN_EVENTS = ("open", "save", "change", "ai_merge")
+# Seconds a hook should take at most. Slower hooks only get the latest change every HOOK_SLOW_INTERVAL
+# seconds, and none of their events while more than HOOK_BACKLOG events wait to be handed out.
+HOOK_BUDGET = 0.05
+HOOK_SLOW_INTERVAL = 1.0
+HOOK_BACKLOG = 100
+# Seconds the module of a loaded plugin has to stay unchanged before the plugin is reloaded.
+PLUGIN_RELOAD_DELAY = 0.2
+
+
+class PluginStats:
+    """How long a plugin took to load and how long its calls took, in seconds."""
+
+    def __init__(self):
+        self.load_time: float = None
+        self.calls = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.timeouts = 0
+        self.errors = 0
+        # Average over the last few calls, weighing the latest the most.
+        self.recent = 0.0
+        self.deferred = 0
+        self.skipped = 0
+
+    def record(self, elapsed: float, failed: bool = False):
+        self.calls += 1
+        self.total += elapsed
+        self.slowest = max(self.slowest, elapsed)
+        self.recent = elapsed if self.calls == 1 else self.recent * 0.8 + elapsed * 0.2
+        if failed:
+            self.errors += 1
+
+    def __str__(self):
+        parts = []
+        if self.load_time is not None:
+            parts.append(f"load {self.load_time * 1000:.0f} ms")
+        if self.calls:
+            parts.append(f"{self.calls} calls, avg {self.total / self.calls * 1000:.1f} ms, max {self.slowest * 1000:.1f} ms")
+        if self.timeouts:
+            parts.append(f"{self.timeouts} timed out")
+        if self.errors:
+            parts.append(f"{self.errors} failed")
+        if self.deferred:
+            parts.append(f"{self.deferred} deferred")
+        if self.skipped:
+            parts.append(f"{self.skipped} skipped")
+        return ", ".join(parts) if parts else "not loaded"
+
 
 class Plugin:
-    def __init__(self, name: str, plugin_path: str, app: App):
+    def __init__(self, name: str, plugin_path: str, app: "App", loader: "PluginLoader" = None):
         self.name = name
         self.plugin_path = os.path.abspath(plugin_path)  # Ensure full directory path
         self.config_path = os.path.join(self.plugin_path, "config.json")
         self.is_enabled = False
         self.config = {}
+        self.configMtime = None
         self.is_loaded = False
+        self.module = None
+        self.instance = None
+        self.host: PluginHost = None
+        self.stats = PluginStats()
+        self.hookStats: Dict[str, PluginStats] = {}
+        # Widgets the plugin mounted through its PluginApp, removed when it is stopped.
+        self.widgets: list = []
+        self.moduleMtime = None
+        self.watchedPath: str = None
+        self.reloadTimer = None
         self.app = app
+        self.loader = loader
         self.load_config()
 
         if not self.config.get("projectPreferences", None):
             self.config["projectPreferences"] = {}
             self.save_config()
 
+    @property
+    def isolated(self) -> bool:
+        """Whether the config asks for the plugin to run in its own process, see PluginHost."""
+        return bool(self.config.get("isolated", False))
+
+    @property
+    def hooks(self) -> Dict[str, str]:
+        """The methods of the plugin class the config names for PLUGIN_EVENTS, by event."""
+        hooks = self.config.get("hooks", {})
+        return {event: method for event, method in hooks.items() if event in PLUGIN_EVENTS} if isinstance(hooks, dict) else {}
+
+    def hook_stats(self, event: str) -> PluginStats:
+        if event not in self.hookStats:
+            self.hookStats[event] = PluginStats()
+        return self.hookStats[event]
+
+    def entry_point(self) -> Tuple[str, str]:
+        """The module and class name of the plugin class."""
+        entry_point = self.config.get("entry_point", "").split(".")
+        if len(entry_point) < 2:
+            raise ValueError("Entry point not defined in config.")
+        return ".".join(entry_point[:-1]), entry_point[-1]
+
+    def module_path(self) -> str:
+        return os.path.join(self.plugin_path, self.entry_point()[0] + ".py")
+
     def load(self):
-        """Load the plugin and its entry point."""
+        """Load the plugin and its entry point, executing its module only the first time or when it changed since."""
+        if self.is_loaded:
+            return
+        if self.isolated:
+            self.load_isolated()
+            self.watch()
+            return
         try:
-            entry_point = self.config.get("entry_point", "").split(".")
-            if not entry_point:
-                raise ValueError("Entry point not defined in config.")
-            
-            module_name, class_name = ".".join(entry_point[:-1]), entry_point[-1]
-            module_path = os.path.join(self.plugin_path, module_name + ".py")
-            spec = importlib.util.spec_from_file_location(module_name, module_path)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
+            started = time.perf_counter()
+            module_name, class_name = self.entry_point()
+            module_path = self.module_path()
+            mtime = os.stat(module_path).st_mtime_ns
+            if self.module is None or mtime != self.moduleMtime:
+                spec = importlib.util.spec_from_file_location(module_name, module_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                self.module = module
+                self.moduleMtime = mtime
 
-            plugin_class = getattr(module, class_name, None)
+            plugin_class = getattr(self.module, class_name, None)
             if not plugin_class:
                 raise ImportError(f"Class {class_name} not found in module {module_name}.")
             
-            self.instance = plugin_class(self.app)
+            self.instance = plugin_class(PluginApp(self.app, self))
+            self.stats.load_time = time.perf_counter() - started
             self.is_enabled = True
             self.is_loaded = True
         except Exception as e:
             print(f"Error loading plugin '{self.name}': {e}")
+        # Watched even when loading failed, so fixing the module loads it.
+        self.watch()
+
+    def load_isolated(self):
+        """Start the plugin in a PluginHost, without waiting for it to be loaded there."""
+        def loaded(future: Future):
+            if future.exception():
+                self.is_loaded = False
+                print(f"Error loading plugin '{self.name}': {future.exception()}")
+
+        try:
+            self.host = PluginHost(self)
+            self.host.start().add_done_callback(loaded)
+        except Exception as e:
+            self.host = None
+            print(f"Error loading plugin '{self.name}': {e}")
+            return
+        self.is_enabled = True
+        self.is_loaded = True
+
+    def call(self, method: str, *args) -> Future:
+        """Call method of the plugin class with args, returning a Future of its result.
+
+        Isolated plugins are called in their process and their calls fail
+        after PLUGIN_CALL_TIMEOUT; never wait for the Future on the UI
+        thread. Other plugins are called right away, on the calling thread.
+        """
+        if self.host:
+            return self.host.call(method, list(args))
+        future = Future()
+        if self.instance is None:
+            future.set_exception(RuntimeError(f"Plugin '{self.name}' isn't loaded."))
+            return future
+        started = time.perf_counter()
+        try:
+            future.set_result(getattr(self.instance, method)(*args))
+        except Exception as e:
+            future.set_exception(e)
+        self.stats.record(time.perf_counter() - started, future.exception() is not None)
+        return future
 
     def unload(self):
         """Unload the plugin."""
         self.is_enabled = False
-        self.instance = None
+        self.stop()
         #self.app.notify(f"Plugin '{self.name}' unloaded.")
 
+    def stop(self):
+        """Drop the plugin class and remove the widgets it mounted, leaving the config alone.
+
+        A plugin class can clean up anything else it set up in an unload method.
+        """
+        self.unwatch()
+        if self.reloadTimer:
+            self.reloadTimer.stop()
+            self.reloadTimer = None
+        instance, self.instance = self.instance, None
+        self.is_loaded = False
+        if instance is not None and hasattr(instance, "unload"):
+            try:
+                instance.unload()
+            except Exception as e:
+                print(f"Error unloading plugin '{self.name}': {e}")
+        for widget in self.widgets:
+            if widget.is_attached:
+                widget.remove()
+        self.widgets = []
+        if self.host:
+            self.host.stop()
+            self.host = None
+
+    def reload(self):
+        """Stop the plugin and load it again, executing its module again if it changed."""
+        self.reloadTimer = None
+        self.stop()
+        if self.is_enabled:
+            self.load()
+        if self.loader:
+            self.loader.changed(self)
+
+    def watch(self):
+        """Reload the plugin whenever its module changes on disk."""
+        # Imported here, plugin host processes don't need the file watcher.
+        from FileUtilities import watcher
+        try:
+            path = self.module_path()
+        except ValueError:
+            return
+        if path != self.watchedPath:
+            self.unwatch()
+            self.watchedPath = path
+            watcher.watch(path, self._module_changed)
+
+    def unwatch(self):
+        from FileUtilities import watcher
+        if self.watchedPath:
+            watcher.unwatch(self.watchedPath, self._module_changed)
+            self.watchedPath = None
+
+    def _module_changed(self, path: str):
+        """Called from the file watcher thread when the module of the plugin changed."""
+        try:
+            self.app.call_from_thread(self._schedule_reload)
+        except RuntimeError:
+            # The app stopped.
+            pass
+
+    def _schedule_reload(self):
+        if self.reloadTimer:
+            self.reloadTimer.stop()
+        self.reloadTimer = self.app.set_timer(PLUGIN_RELOAD_DELAY, self.reload)
+
     def enable(self, project_path: str = None):
         """Enable the plugin using its config."""
         if project_path:
@@ -58,6 +277,10 @@ class Plugin:
             self.config["enabled"] = True
         self.save_config()
         #self.app.notify(f"Plugin '{self.name}' enabled.")
+        if self.is_enabled:
+            self.load()
+        if self.loader:
+            self.loader.changed(self)
 
     def disable(self, project_path: str = None):
         """Disable the plugin using its config."""
@@ -70,45 +293,408 @@ class Plugin:
             self.config["enabled"] = False
         self.save_config()
         #self.app.notify(f"Plugin '{self.name}' disabled.")
+        self.stop()
+        if self.loader:
+            self.loader.changed(self)
 
 
     def load_config(self):
-        """Load plugin configuration from file."""
-        if os.path.exists(self.config_path):
-            with open(self.config_path, "r") as config_file:
-                self.config = json.load(config_file)
-                self.is_enabled = self.config.get("enabled", False)
+        """Load plugin configuration from file, unless it didn't change since it was last loaded or saved."""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.configMtime:
+            return
+        with open(self.config_path, "r") as config_file:
+            self.config = json.load(config_file)
+            self.is_enabled = self.config.get("enabled", False)
+        self.configMtime = mtime
 
     def save_config(self):
         """Save the current configuration to file."""
         with open(self.config_path, "w") as config_file:
             json.dump(self.config, config_file, indent=4)
+        self.configMtime = os.stat(self.config_path).st_mtime_ns
+
+class PluginApp:
+    """Stands in for the app in a plugin that isn't isolated, remembering the widgets it mounts.
+
+    Everything but mount and mount_all goes straight to the app. The
+    widgets mounted through it are removed when the plugin is stopped.
+    """
+
+    def __init__(self, app: "App", plugin: Plugin):
+        object.__setattr__(self, "_app", app)
+        object.__setattr__(self, "_plugin", plugin)
+
+    def mount(self, *widgets, **kwargs):
+        self._plugin.widgets.extend(widgets)
+        return self._app.mount(*widgets, **kwargs)
+
+    def mount_all(self, widgets, **kwargs):
+        widgets = list(widgets)
+        self._plugin.widgets.extend(widgets)
+        return self._app.mount_all(widgets, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self._app, name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._app, name, value)
+
+
+class PluginHost:
+    """Runs the plugin class of an isolated plugin in a child process, see _host_main.
+
+    Requests and their replies are JSON lines on the stdin and stdout of
+    the child, and everything it prints shows up in the log of the app.
+    The plugin gets a stand-in for the app that forwards calls of
+    PLUGIN_APP_METHODS to the UI thread. Every request has a time budget;
+    a child that overruns one is killed and later calls fail until the
+    plugin is loaded again.
+    """
+
+    def __init__(self, plugin: Plugin):
+        self.plugin = plugin
+        self.process: subprocess.Popen = None
+        # Requests waiting for their reply by id, with their future, start time, method and timer.
+        self.pending: Dict[int, tuple] = {}
+        self.nextId = 0
+        self.lock = threading.Lock()
+
+    def start(self) -> Future:
+        """Start the child and have it construct the plugin class, returning a Future of when it did."""
+        module_name, class_name = self.plugin.entry_point()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--host", self.plugin.plugin_path, module_name, class_name],
+            cwd=self.plugin.plugin_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+        threading.Thread(target=self._read, args=(self.process,), daemon=True, name=f"PluginHost {self.plugin.name}").start()
+        threading.Thread(target=self._read_output, args=(self.process,), daemon=True, name=f"PluginHost output {self.plugin.name}").start()
+        return self._request("load", [], PLUGIN_LOAD_TIMEOUT)
+
+    def call(self, method: str, args: list) -> Future:
+        return self._request(method, args, PLUGIN_CALL_TIMEOUT)
+
+    def stop(self):
+        with self.lock:
+            process, self.process = self.process, None
+        if process and process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def _request(self, method: str, args: list, timeout: float) -> Future:
+        future = Future()
+        with self.lock:
+            id = self.nextId
+            self.nextId += 1
+            timer = threading.Timer(timeout, self._expire, (id, timeout))
+            timer.daemon = True
+            self.pending[id] = (future, time.perf_counter(), method, timer)
+            try:
+                if self.process is None or self.process.poll() is not None:
+                    raise RuntimeError(f"Plugin '{self.plugin.name}' isn't running.")
+                self.process.stdin.write(json.dumps({"id": id, "call": method, "args": args}) + "\n")
+                self.process.stdin.flush()
+            except (OSError, TypeError, ValueError, RuntimeError) as e:
+                del self.pending[id]
+                future.set_exception(e)
+                return future
+        timer.start()
+        return future
+
+    def _finish(self, id: int, result=None, error: Exception = None, timed_out: bool = False) -> bool:
+        with self.lock:
+            request = self.pending.pop(id, None)
+        if request is None:
+            return False
+        future, started, method, timer = request
+        timer.cancel()
+        elapsed = time.perf_counter() - started
+        if method == "load":
+            self.plugin.stats.load_time = elapsed
+        else:
+            self.plugin.stats.record(elapsed, error is not None and not timed_out)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return True
+
+    def _expire(self, id: int, timeout: float):
+        with self.lock:
+            method = self.pending.get(id, (None, None, "call"))[2]
+        if self._finish(id, error=TimeoutError(f"Plugin '{self.plugin.name}' didn't finish {method} within {timeout} seconds."), timed_out=True):
+            self.plugin.stats.timeouts += 1
+            print(f"Error in plugin '{self.plugin.name}': {method} ran over its time budget, stopping the plugin.")
+            self.plugin.is_loaded = False
+            self.stop()
+
+    def _read(self, process: subprocess.Popen):
+        """Runs on its own thread, handing the replies of the child to their futures."""
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if "app" in message:
+                self._call_app(message)
+            elif "error" in message:
+                self._finish(message["id"], error=RuntimeError(message["error"]))
+            else:
+                self._finish(message["id"], message.get("result"))
+        with self.lock:
+            ids = list(self.pending)
+        for id in ids:
+            self._finish(id, error=RuntimeError(f"Plugin '{self.plugin.name}' stopped."))
+
+    def _read_output(self, process: subprocess.Popen):
+        for line in process.stderr:
+            print(f"Plugin '{self.plugin.name}': {line.rstrip()}")
+
+    def _call_app(self, message: dict):
+        name = message["app"]
+        if name not in PLUGIN_APP_METHODS:
+            print(f"Error in plugin '{self.plugin.name}': it can't call {name} of the app.")
+            return
+        app = self.plugin.app
+        try:
+            app.call_from_thread(getattr(app, name), *message.get("args", ()), **message.get("kwargs", {}))
+        except RuntimeError:
+            # The app stopped.
+            pass
+        except Exception as e:
+            print(f"Error in plugin '{self.plugin.name}' calling {name}: {e}")
+
+
+class HookLane:
+    """Calls the hooks of one plugin in the order of their events, on a thread of its own.
+
+    Every plugin has its own lane, so a slow hook only holds back the later
+    events of its plugin. A hook of a plugin that isn't isolated can't be
+    stopped; once it runs longer than PLUGIN_CALL_TIMEOUT the lane is stuck
+    and the events of the plugin are skipped until the hook returns.
+    Isolated plugins time out on their own, see PluginHost.
+    """
+
+    def __init__(self, plugin: Plugin):
+        self.plugin = plugin
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.stuck = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name=f"PluginEvents {plugin.name}")
+        self.thread.start()
+
+    def submit(self, method: str, payload: dict):
+        self.queue.append((method, payload))
+        self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while self.queue:
+                method, payload = self.queue.popleft()
+                self._call(method, payload)
+
+    def _call(self, method: str, payload: dict):
+        plugin = self.plugin
+        event = payload["event"]
+        timer = None
+        if not plugin.isolated:
+            timer = threading.Timer(PLUGIN_CALL_TIMEOUT, self._expire, (event,))
+            timer.daemon = True
+            timer.start()
+        started = time.perf_counter()
+        failed = False
+        try:
+            plugin.call(method, payload).result()
+        except Exception as e:
+            failed = True
+            print(f"Error in the {event} hook of plugin '{plugin.name}': {e}")
+        finally:
+            if timer:
+                timer.cancel()
+            self.stuck = False
+        plugin.hook_stats(event).record(time.perf_counter() - started, failed)
+
+    def _expire(self, event: str):
+        self.stuck = True
+        self.plugin.stats.timeouts += 1
+        print(f"Error in plugin '{self.plugin.name}': the {event} hook ran over its time budget, its events are skipped until it returns.")
+
+
+class PluginEvents:
+    """Hands events to the hooks of the loaded plugins, off the UI thread.
+
+    Firing an event only queues it, so hooks never add to the time the UI
+    thread takes for a keystroke. A thread of its own hands the queue out in
+    batches in which the change events of a file collapse into the latest
+    one, to the HookLane of every plugin, so plugins don't wait for each
+    other. Hooks are profiled: one whose recent calls took longer than
+    HOOK_BUDGET is only called with the latest change once every
+    HOOK_SLOW_INTERVAL, and is skipped while more than HOOK_BACKLOG events
+    are queued.
+    """
+
+    def __init__(self, loader: "PluginLoader"):
+        self.loader = loader
+        self.queue = deque()
+        self.wakeup = threading.Event()
+        self.thread: threading.Thread = None
+        self.lanes: Dict[str, HookLane] = {}
+        # The latest change held back from a slow hook, and when each hook last ran, by plugin and event.
+        self.deferred: Dict[Tuple[str, str], tuple] = {}
+        self.lastRun: Dict[Tuple[str, str], float] = {}
+
+    def emit(self, event: str, **payload):
+        """Queue event for the hooks of the plugins, with payload describing it (only JSON values, for isolated plugins)."""
+        payload["event"] = event
+        self.queue.append(payload)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True, name="PluginEvents")
+            self.thread.start()
+        self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(HOOK_SLOW_INTERVAL if self.deferred else None)
+            self.wakeup.clear()
+            backlog = len(self.queue)
+            batch = []
+            while self.queue:
+                batch.append(self.queue.popleft())
+            try:
+                self._dispatch(self._coalesce(batch), backlog > HOOK_BACKLOG)
+            except Exception as e:
+                print(f"Error dispatching plugin events: {e}")
+
+    @staticmethod
+    def _coalesce(batch: List[dict]) -> List[dict]:
+        """The events of batch in order, with only the last change event of every path."""
+        last = {payload.get("path"): index for index, payload in enumerate(batch) if payload["event"] == "change"}
+        return [payload for index, payload in enumerate(batch) if payload["event"] != "change" or last[payload.get("path")] == index]
+
+    def _lane(self, plugin: Plugin) -> HookLane:
+        lane = self.lanes.get(plugin.name)
+        if lane is None:
+            lane = self.lanes[plugin.name] = HookLane(plugin)
+        # A plugin removed and discovered again is a new Plugin.
+        lane.plugin = plugin
+        return lane
+
+    def _dispatch(self, batch: List[dict], overloaded: bool):
+        for payload in batch:
+            event = payload["event"]
+            for plugin in list(self.loader.plugins.values()):
+                method = plugin.hooks.get(event) if plugin.is_loaded else None
+                if not method:
+                    continue
+                stats = plugin.hook_stats(event)
+                if self._lane(plugin).stuck:
+                    stats.skipped += 1
+                    continue
+                if stats.recent > HOOK_BUDGET:
+                    if overloaded:
+                        stats.skipped += 1
+                        continue
+                    if event == "change":
+                        if (plugin.name, event) in self.deferred:
+                            stats.skipped += 1
+                        self.deferred[(plugin.name, event)] = (plugin, method, payload)
+                        stats.deferred += 1
+                        continue
+                self._call(plugin, method, payload)
+
+        now = time.monotonic()
+        for key, (plugin, method, payload) in list(self.deferred.items()):
+            if now - self.lastRun.get(key, 0) >= HOOK_SLOW_INTERVAL and not self._lane(plugin).stuck:
+                del self.deferred[key]
+                if plugin.is_loaded:
+                    self._call(plugin, method, payload)
+
+    def _call(self, plugin: Plugin, method: str, payload: dict):
+        self.lastRun[(plugin.name, payload["event"])] = time.monotonic()
+        self._lane(plugin).submit(method, payload)
+
 
 class PluginLoader:
-    def __init__(self, app: App, plugins_directory: str):
+    """The plugins of a plugins directory, shared by every screen of the app (see plugin_loader).
+
+    The directory is listed again on every load_plugins, but a config.json
+    is only parsed again when its mtime changed and the module of a plugin
+    is only executed the first time the plugin is loaded.
+    """
+
+    def __init__(self, app: "App", plugins_directory: str):
         self.app = app
         self.plugins_directory = os.path.abspath(plugins_directory)  # Ensure full directory path
         self.plugins: Dict[str, Plugin] = {}
+        # The plugin in each plugin folder, by path.
+        self.folders: Dict[str, Plugin] = {}
+        self.listeners: List[Callable[[Plugin], None]] = []
+        self.events = PluginEvents(self)
 
     def load_plugins(self, project_path: str = None):
-        """Discover and load plugins from the plugins directory."""
+        """Discover the plugins in the plugins directory and load the enabled ones that aren't loaded yet."""
+        self.discover()
+        for plugin in self.plugins.values():
+            if plugin.is_enabled and not plugin.is_loaded:
+                if project_path:
+                    if not project_path in plugin.config["projectPreferences"]:
+                        plugin.load()
+                else:
+                    plugin.load()
+
+    def discover(self):
+        """Bring the plugins up to date with the plugins directory, reading only the configs that changed."""
         if not os.path.exists(self.plugins_directory):
             os.makedirs(self.plugins_directory)
 
+        folders = {}
         for folder in os.listdir(self.plugins_directory):
             plugin_path = os.path.join(self.plugins_directory, folder)
-            if os.path.isdir(plugin_path):
+            plugin = self.folders.get(plugin_path)
+            if plugin is not None and os.path.exists(plugin.config_path):
+                plugin.load_config()
+            elif os.path.isdir(plugin_path):
                 plugin = self._initialize_plugin(folder, plugin_path)
-                if plugin:
-                    self.plugins[plugin.name] = plugin
-                    plugin.load_config()
+            if plugin:
+                folders[plugin_path] = plugin
+
+        for plugin_path, plugin in self.folders.items():
+            if plugin_path not in folders:
+                plugin.unload()
+        self.folders = folders
+        self.plugins = {plugin.name: plugin for plugin in folders.values()}
 
-                    if plugin.is_enabled and not plugin.is_loaded:
-                        if project_path:
-                            if not project_path in plugin.config["projectPreferences"]:
-                                plugin.load()
-                        elif not plugin.is_loaded:
-                            plugin.load()
+    def remove(self, plugin: Plugin):
+        """Forget about plugin and unload it, when its folder is about to be deleted."""
+        plugin.unload()
+        self.plugins.pop(plugin.name, None)
+        self.folders.pop(plugin.plugin_path, None)
+        self.changed(plugin)
+
+    def subscribe(self, listener: Callable[[Plugin], None]):
+        """Have listener called with a plugin whenever it is enabled, disabled or removed."""
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Plugin], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def changed(self, plugin: Plugin):
+        for listener in list(self.listeners):
+            try:
+                listener(plugin)
+            except Exception as e:
+                print(f"Error in plugin listener for '{plugin.name}': {e}")
 
     def _initialize_plugin(self, folder: str, plugin_path: str) -> Plugin:
         """Initialize a plugin from its configuration."""
@@ -117,7 +703,71 @@ class PluginLoader:
             try:
                 with open(config_path, "r") as config_file:
                     config = json.load(config_file)
-                    return Plugin(name=config["name"], plugin_path=plugin_path, app=self.app)
+                    return Plugin(name=config["name"], plugin_path=plugin_path, app=self.app, loader=self)
             except Exception as e:
                 print(f"Error initializing plugin '{folder}': {e}")
         return None
+
+
+# The PluginLoader of each plugins directory, see plugin_loader.
+pluginLoaders: Dict[str, PluginLoader] = {}
+
+
+def plugin_loader(app: "App", plugins_directory: str) -> PluginLoader:
+    """Return the PluginLoader of plugins_directory shared by every screen of app."""
+    plugins_directory = os.path.abspath(plugins_directory)
+    loader = pluginLoaders.get(plugins_directory)
+    if loader is None or loader.app is not app:
+        loader = pluginLoaders[plugins_directory] = PluginLoader(app, plugins_directory)
+    return loader
+
+
+class _AppProxy:
+    """Stands in for the app in a plugin host process, forwarding calls of PLUGIN_APP_METHODS to the app."""
+
+    def __init__(self, send: Callable[[dict], None]):
+        self._send = send
+
+    def __getattr__(self, name: str):
+        if name not in PLUGIN_APP_METHODS:
+            raise AttributeError(f"Isolated plugins can only call {', '.join(PLUGIN_APP_METHODS)} of the app.")
+        return lambda *args, **kwargs: self._send({"app": name, "args": args, "kwargs": kwargs})
+
+
+def _host_main(plugin_path: str, module_name: str, class_name: str):
+    """The plugin host process, answering the requests of a PluginHost until its stdin is closed."""
+    replies = sys.stdout
+    # Whatever the plugin prints goes to the log of the app.
+    sys.stdout = sys.stderr
+    lock = threading.Lock()
+
+    def send(message: dict):
+        line = json.dumps(message, default=repr)
+        with lock:
+            replies.write(line + "\n")
+            replies.flush()
+
+    instance = None
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            if request["call"] == "load":
+                spec = importlib.util.spec_from_file_location(module_name, os.path.join(plugin_path, module_name + ".py"))
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                plugin_class = getattr(module, class_name, None)
+                if not plugin_class:
+                    raise ImportError(f"Class {class_name} not found in module {module_name}.")
+                instance = plugin_class(_AppProxy(send))
+                result = None
+            elif request["call"].startswith("_") or instance is None:
+                raise AttributeError(f"Can't call {request['call']} of the plugin.")
+            else:
+                result = getattr(instance, request["call"])(*request["args"])
+            send({"id": request["id"], "result": result})
+        except Exception as e:
+            send({"id": request["id"], "error": f"{e.__class__.__name__}: {e}"})
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--host"]:
+    _host_main(*sys.argv[2:5])
@@ -0,0 +1,152 @@
+from textual.app import ComposeResult
+from textual.widgets import Checkbox, Footer, Header, Input, Label, OptionList
+from textual.widgets.option_list import Option
+from textual.screen import Screen
+from textual.timer import Timer
+import textual.containers as containers
+from rich.text import Text
+from Screens import TextEditor
+from SearchUtilities import file_index, compile_search, ProjectSearch, SearchMatch
+from Config import config
+import os, re
+
+# Seconds the query has to stay unchanged before it is searched for.
+SEARCH_DELAY = 0.25
+
+
+class ScreenObject(Screen):
+    """Find in Files Screen."""
+
+    TITLE = "Find in Files"
+    SUB_TITLE = ""
+
+    search: ProjectSearch = None
+    searchTimer: Timer = None
+
+    def __init__(self, name=None, id=None, classes=None, directory: str = None):
+        self.mainDirectory = os.path.abspath(directory or os.getcwd())
+        self.SUB_TITLE = f"Project: {os.path.basename(self.mainDirectory)}"
+        self.matches: list[SearchMatch] = []
+        super().__init__(name, id, classes)
+
+    def compose(self) -> ComposeResult:
+        with containers.Vertical() as container:
+            container.can_focus = False
+            with containers.Horizontal() as cont:
+                cont.styles.height = "auto"
+                self.queryInput = Input(placeholder="Search in files...", id="searchInput")
+                self.queryInput.styles.width = "1fr"
+                yield self.queryInput
+                self.regexCheckbox = Checkbox("Regex", id="regexCheckbox")
+                yield self.regexCheckbox
+                self.caseCheckbox = Checkbox("Match Case", id="caseCheckbox")
+                yield self.caseCheckbox
+            self.statusLabel = Label("").set_styles("width: 100%; padding: 0 1 0 1;")
+            yield self.statusLabel
+            self.resultList = OptionList(id="searchResults")
+            self.resultList.styles.height = "1fr"
+            yield self.resultList
+
+        yield Header(show_clock=True)
+        yield Footer()
+
+    def _on_mount(self, event):
+        self.queryInput.focus()
+        return super()._on_mount(event)
+
+    def on_unmount(self) -> None:
+        if self.search:
+            self.search.cancel()
+            self.search = None
+
+    def schedule_search(self):
+        """Search once the query and options haven't changed for SEARCH_DELAY seconds."""
+        if self.searchTimer:
+            self.searchTimer.stop()
+        self.searchTimer = self.set_timer(SEARCH_DELAY, self.start_search)
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        if event.input is self.queryInput:
+            self.schedule_search()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        if event.input is self.queryInput:
+            if self.searchTimer:
+                self.searchTimer.stop()
+            self.start_search()
+
+    def on_checkbox_changed(self, event: Checkbox.Changed) -> None:
+        self.schedule_search()
+
+    def start_search(self):
+        """Cancel the running search and start one for the current query."""
+        self.searchTimer = None
+        if self.search:
+            self.search.cancel()
+            self.search = None
+        self.matches = []
+        self.resultList.clear_options()
+
+        query = self.queryInput.value
+        if not query:
+            self.statusLabel.update("")
+            return
+        try:
+            pattern = compile_search(query, regex=self.regexCheckbox.value, case_sensitive=self.caseCheckbox.value)
+        except re.error as e:
+            self.statusLabel.update(f"Invalid regular expression: {e}")
+            return
+
+        app = self.app
+
+        def from_thread(callback, *args):
+            try:
+                app.call_from_thread(callback, *args)
+            except RuntimeError:
+                # The app stopped while the search was running.
+                search.cancel()
+
+        index = file_index(self.mainDirectory, os.path.join(config.documentNever, ".index"))
+        search = ProjectSearch(
+            index,
+            pattern,
+            lambda matches: from_thread(self.add_matches, search, matches),
+            lambda search: from_thread(self.search_done, search),
+        )
+        self.search = search
+        self.statusLabel.update("Searching...")
+        search.start()
+
+    def add_matches(self, search: ProjectSearch, matches: list):
+        if search is not self.search:
+            return
+        options = []
+        for match in matches:
+            relative = os.path.relpath(match.path, self.mainDirectory)
+            options.append(Option(Text.assemble((relative, "bold"), f":{match.line + 1}  ", match.text.strip())))
+        self.matches.extend(matches)
+        self.resultList.add_options(options)
+        self.statusLabel.update(f"Searching... {search.found} matches in {search.searched} of {search.files} files")
+
+    def search_done(self, search: ProjectSearch):
+        if search is not self.search:
+            return
+        self.search = None
+        if search.error:
+            self.notify(f"ERROR! {search.error.__class__.__name__}: {search.error}", severity="error")
+        status = f"{search.found} matches in {search.files} files"
+        if search.truncated:
+            status += f", stopped after the first {search.found}"
+        self.statusLabel.update(status)
+
+    def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
+        if event.option_list is not self.resultList:
+            return
+        match = self.matches[event.option_index]
+        stack = self.app.screen_stack
+        editor = stack[-2] if len(stack) > 1 else None
+        self.app.pop_screen()
+        if isinstance(editor, TextEditor.ScreenObject):
+            editor.open_file(match.path, (match.line, match.column))
+        else:
+            self.app.push_screen(TextEditor.ScreenObject(filepath=match.path, location=(match.line, match.column)))
@@ -0,0 +1,49 @@
+from functools import partial
+from textual.command import Provider, DiscoveryHit, Hit, Hits
+from Screens import TextEditor
+from SearchUtilities import file_index
+from WorkspaceUtilities import workspace
+from Config import config
+import os
+
+# Files quick open lists for a query.
+QUICK_OPEN_RESULTS = 50
+
+
+class QuickOpenProvider(Provider):
+    """Command palette provider finding the files of the current project by name."""
+
+    def project_root(self) -> str:
+        if isinstance(self.screen, TextEditor.ScreenObject):
+            return self.screen.mainDirectory
+        return os.getcwd()
+
+    async def startup(self) -> None:
+        self.index = file_index(self.project_root(), os.path.join(config.documentNever, ".index"))
+        # Answer from what is indexed already while the folders that changed are listed again.
+        self.index.refresh()
+
+    async def discover(self) -> Hits:
+        """List the files of the project opened last before anything is typed."""
+        for path in workspace(self.project_root(), os.path.join(config.documentNever, ".workspaces")).recent_files():
+            if os.path.isfile(path):
+                relative = os.path.relpath(path, self.index.root)
+                yield DiscoveryHit(relative, partial(self.open_file, path), text=relative)
+
+    async def search(self, query: str) -> Hits:
+        matcher = self.matcher(query)
+        paths = self.index.query(query, QUICK_OPEN_RESULTS)
+        for rank, path in enumerate(paths):
+            relative = os.path.relpath(path, self.index.root)
+            yield Hit(
+                1 - rank / len(paths),
+                matcher.highlight(relative),
+                partial(self.open_file, path),
+                text=relative,
+            )
+
+    def open_file(self, path: str) -> None:
+        if isinstance(self.screen, TextEditor.ScreenObject):
+            self.screen.open_file(path)
+        else:
+            self.app.push_screen(TextEditor.ScreenObject(filepath=path))
@@ -1,14 +1,16 @@
 from textual.app import ComposeResult
-from textual.widgets import *
+from textual.widgets import Collapsible, Footer, Header, Label, OptionList, RadioButton, TextArea
 import textual.containers as containers
-import main
 from textual.screen import Screen
 import os
 from Config import config
 from textual.widgets.selection_list import Selection
-import ollama
+from PluginUtilities import Plugin, plugin_loader
 from Utilities import ReactiveLabel
 
+# Seconds between updates of the load times and call latencies shown for the plugins.
+PLUGIN_STATS_INTERVAL = 1.0
+
 class ScreenObject(Screen):
     """Text Editor Screen."""
     
@@ -49,8 +51,11 @@ class ScreenObject(Screen):
 
     
     async def on_radio_button_changed(self, event: RadioButton.Changed) -> None:
-        if event.radio_button.id == "pluginButton":
-            if event.radio_button.value:
+        if event.radio_button.has_class("pluginButton"):
+            if event.radio_button.value == event.radio_button.data.is_enabled:
+                # Set by plugin_changed.
+                pass
+            elif event.radio_button.value:
                 event.radio_button.data.enable()
             else:
                 event.radio_button.data.disable()
@@ -65,9 +70,35 @@ class ScreenObject(Screen):
             config.autoSave = event.radio_button.value
 
 
+    def on_mount(self) -> None:
+        self.PL.subscribe(self.plugin_changed)
+        self.set_interval(PLUGIN_STATS_INTERVAL, self.update_plugin_stats)
+
+    def plugin_label(self, plugin: Plugin) -> str:
+        hooks = "".join(f"; {event} hook: {stats}" for event, stats in list(plugin.hookStats.items()))
+        return f"{plugin.name}{' (isolated)' if plugin.isolated else ''} - {plugin.stats}{hooks}"
+
+    def update_plugin_stats(self):
+        for button in self.query(".pluginButton").results(RadioButton):
+            label = self.plugin_label(button.data)
+            if str(button.label) != label:
+                button.label = label
+
+    def on_unmount(self) -> None:
+        self.PL.unsubscribe(self.plugin_changed)
+
+    def plugin_changed(self, plugin: Plugin):
+        """Keep the plugin buttons in step with plugins toggled or removed on other screens."""
+        for button in self.query(".pluginButton").results(RadioButton):
+            if button.data is plugin:
+                if plugin.name not in self.PL.plugins:
+                    button.remove()
+                elif button.value != plugin.is_enabled:
+                    button.value = plugin.is_enabled
+
     def compose(self) -> ComposeResult:
-        self.PL = main.PluginLoader(self.app, os.path.join(config.documentNever, "Plugins"))
-        self.PL.load_plugins()
+        self.PL = plugin_loader(self.app, os.path.join(config.documentNever, "Plugins"))
+        self.PL.discover()
 
         self.themes = [
             "textual-dark", "textual-light", "nord", "gruvbox", "catppuccin-mocha",
@@ -98,6 +129,8 @@ class ScreenObject(Screen):
                         id="autoMergeButton"
                     )
 
+                    # Imported here, the ollama client takes longer to import than the rest of the editor.
+                    import ollama
                     modelNames = ["None"]
                     for tup in ollama.list():
                         tup2 = tup[1]
@@ -123,9 +156,9 @@ class ScreenObject(Screen):
                             for plugin_name, plugin in self.PL.plugins.items():
                                 plugin.load_config()
                                 button = RadioButton(
-                                    label=plugin_name,
+                                    label=self.plugin_label(plugin),
                                     value=plugin.config["enabled"],
-                                    id="pluginButton"
+                                    classes="pluginButton"
                                 )
                                 button.data = plugin
                                 yield button
@@ -1,17 +1,24 @@
 from textual.app import ComposeResult
 from textual.binding import Binding
-from textual.widgets import *
-from Utilities import NVRTextArea, remove_code_snippets, WorkspaceClass, populate_tree
+from textual.widget import Widget
+from textual.widgets import Button, Collapsible, Footer, Header, Input, Label, OptionList, RadioButton, TextArea, Tree
+from Utilities import NVRTextArea, ChatLog
+from TreeUtilities import FileTree
+from FileUtilities import file_signature, watcher, autosaver
+from DocumentUtilities import MappedDocument, EditJournal
+from SearchUtilities import file_index
+from WorkspaceUtilities import workspace
 import textual.containers as containers
 from textual.containers import Container
 from textual.screen import Screen
-from Screens import Settings
-from PluginUtilities import PluginLoader, Plugin
-import os, shutil
+from PluginUtilities import PluginLoader, Plugin, plugin_loader
+import os, shutil, time
 from Config import config
-import assistant, intellimerge
+import intellimerge
 from textual import work
-from asyncio import to_thread
+from textual.message import Message
+from textual.timer import Timer
+from textual.worker import Worker
 import asyncio
 from datetime import datetime, timedelta
 from textual.events import DescendantFocus
@@ -30,18 +37,19 @@ class ProjectSettingsScreen(Screen):
         return super()._on_mount(event)
 
     def on_radio_button_changed(self, event: RadioButton.Changed) -> None:
-        if event.radio_button.id == "pluginButton" and self.filepath:
+        if event.radio_button.has_class("pluginButton") and self.filepath:
             if event.radio_button.data:
                 data: Plugin = event.radio_button.data
                 if event.radio_button.value:
                     data.enable(self.filepath)
+                    self.notify(f"Plugin '{data.name}' enabled for this project.")
                 else:
                     data.disable(self.filepath)
-            self.notify(f"Please refresh the Code Editor to reload the plugins.")
+                    self.notify(f"Plugin '{data.name}' disabled for this project.")
 
     def compose(self) -> ComposeResult:
-        self.PL = PluginLoader(self.app, os.path.join(config.documentNever, "Plugins"))
-        self.PL.load_plugins()
+        self.PL = plugin_loader(self.app, os.path.join(config.documentNever, "Plugins"))
+        self.PL.discover()
                     
         with containers.ScrollableContainer() as container:
             container.can_focus = False
@@ -59,7 +67,7 @@ class ProjectSettingsScreen(Screen):
                             button = RadioButton(
                                 label=plugin_name,
                                 value=not self.filepath in plugin.config["projectPreferences"].keys(),
-                                id="pluginButton",
+                                classes="pluginButton",
                             )
                             button.data = plugin
                             yield button
@@ -77,8 +85,7 @@ class MergerScreen(Screen):
     closedSnippets = 0
 
     def __init__(self, name = None, id = None, classes = None, snippets: list = None, mainTextArea: TextArea = None, this: Screen = None):
-        if snippets:
-            self.snippets = snippets
+        self.snippets = list(snippets or [])
         if mainTextArea:
             self.mainTextArea = mainTextArea
         if this:
@@ -92,39 +99,44 @@ class MergerScreen(Screen):
         self.app.notify("Press ESC to go back to coding!")
         return super()._on_mount(event)
 
+    def snippet_view(self, index: int, snippet: dict) -> Widget:
+        textArea = NVRTextArea.code_editor(snippet['code'], language="python", theme=config.textAreaTheme)
+
+        acceptButton = Button("Accept", id=f"acceptButton", variant="primary")
+        acceptButton.textarea = textArea
+        denyButton = Button("Deny", id="declineButton", variant="warning")
+
+        cont2 = containers.Vertical(acceptButton, denyButton)
+        cont2.styles.width = "auto"
+        cont2.styles.height = "auto"
+        cont2.styles.align = ("center", "middle")
+
+        cont3 = containers.VerticalScroll(
+            Label(f"Snippet {index+1}").set_styles("width: 100%; height: 1; text-align: center;"),
+            containers.Horizontal(textArea, cont2),
+        )
+        cont3.styles.align = ("center", "middle")
+        acceptButton.container = cont3
+        denyButton.container = cont3
+        return cont3
+
     def compose(self) -> ComposeResult:
-        i = 0
-        for snippet in self.snippets:
-            with containers.VerticalScroll() as cont3:
-                yield Label(f"Snippet {i+1}").set_styles("width: 100%; height: 1; text-align: center;")
-                cont3.styles.align = ("center", "middle")
-
-                with containers.Horizontal() as cont:
-                    textArea = NVRTextArea.code_editor(snippet['code'], language="python", theme=config.textAreaTheme)
-                    yield textArea
-
-                    acceptButton = Button("Accept", id=f"acceptButton", variant="primary")
-                    acceptButton.textarea = textArea
-                    acceptButton.container = cont3
-
-                    denyButton = Button("Deny", id="declineButton", variant="warning")
-                    denyButton.container = cont3
-
-                    with containers.Vertical() as cont2:
-                        cont2.styles.width = "auto"
-                        cont2.styles.height = "auto"
-                        cont2.styles.align = ("center", "middle")
-                        yield acceptButton
-                        yield denyButton
-            i+=1
+        for i, snippet in enumerate(self.snippets):
+            yield self.snippet_view(i, snippet)
 
         yield Header(show_clock=True)
         yield Footer()
 
+    def add_snippet(self, snippet: dict):
+        """Show another snippet of the reply that is still being generated."""
+        self.snippets.append(snippet)
+        self.mount(self.snippet_view(len(self.snippets) - 1, snippet))
+
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "acceptButton":
             self.mainTextArea.text = intellimerge.merge(self.mainTextArea.text, event.button.textarea.text)
             self.this.aiCodeHistory.append(self.mainTextArea.text)
+            self.this.emit_plugin_event("ai_merge", snippets=[event.button.textarea.text])
             event.button.container.remove_children()
             event.button.container.remove()
         elif event.button.id == "declineButton":
@@ -146,26 +158,50 @@ class ScreenObject(Screen):
     textArea: TextArea
     optionList: OptionList
     collapsibleOPTL: Collapsible
-    fileTree = Tree
+    fileTree: FileTree = None
 
     contentsOfFile: str = None
+    fileSignature = None
+    mappedDocument: MappedDocument = None
+    watchedPath: str = None
+    autosaveTimer: Timer = None
+    autosavesInFlight = 0
+    journal: EditJournal = None
+    pendingRecovery = False
+    startLocation: tuple = None
+    mergerScreen: MergerScreen = None
+    aiWorker: Worker = None
 
     selectedProcessID = None
     filePath = None
     mainDirectory = None
+    PL: PluginLoader = None
 
     aiCodeHistory = []
     thisFilePath = os.path.realpath(__file__)
 
-    never = assistant.ArtificialIntelligence(model=config.ollamaModel, promptPath=os.path.join(thisFilePath, os.path.join(config.documentNever, ".prompts", "neverPrompt.txt")))
+    _never = None
+    # The conversation with the assistant about the open file, see aiContext.
+    _aiContext = None
 
     currentReverts = 0
     lastExpandedNodeTime = datetime.now()
 
+    class Autosaved(Message):
+        """Posted from the autosave thread once the open file was written."""
+
+        def __init__(self, path: str, snapshot, signature, error: Exception = None):
+            self.path = path
+            self.snapshot = snapshot
+            self.signature = signature
+            self.error = error
+            super().__init__()
+
     BINDINGS = [
         Binding("ctrl+s", "save", "Save", "Save contents of the TextArea to said file", priority=True, tooltip="Save contents of TextArea to said file"),
         Binding("ctrl+b", "undo_ai", "Undo AI Changes", "Undo AI Changes", priority=False, tooltip="Undo AI Changes."),
         Binding("ctrl+shift+b", "redo_ai", "Redo AI Changes", "Redo AI Changes", priority=False, tooltip="Redo AI Changes."),
+        Binding("ctrl+f", "find_in_files", "Find in Files", "Search the files of the project", priority=False, tooltip="Search the files of the project"),
         Binding("escape", action="none", show=False),
     ]
 
@@ -194,12 +230,33 @@ class ScreenObject(Screen):
     def action_focus_tree(self):
         self.fileTree.focus()
 
+    @property
+    def never(self):
+        """The AI assistant, created (and its client library imported) the first time it is asked for."""
+        if ScreenObject._never is None:
+            import assistant
+            ScreenObject._never = assistant.ArtificialIntelligence(model=config.ollamaModel, promptPath=os.path.join(self.thisFilePath, os.path.join(config.documentNever, ".prompts", "neverPrompt.txt")), contextTokens=config.get("aiContextTokens", 8192), cachePath=os.path.join(config.documentNever, ".aicache", "responses.sqlite3"), cacheBytes=config.get("aiCacheBytes", 16 * 1024 * 1024))
+        return ScreenObject._never
+
+    @property
+    def aiContext(self):
+        """The conversation of this editor with the assistant, started again when another file is opened."""
+        if self._aiContext is None:
+            self._aiContext = self.never.conversation()
+        return self._aiContext
+
+    def action_find_in_files(self):
+        from Screens import ProjectSearch
+        self.app.push_screen(ProjectSearch.ScreenObject(directory=self.mainDirectory))
+
     def action_undo_ai(self):
+        if not self.aiCodeHistory: return
         self.textArea.text = self.aiCodeHistory[self.currentReverts]
         if self.currentReverts > 0:
             self.currentReverts -= 1
 
     def action_redo_ai(self):
+        if not self.aiCodeHistory: return
         self.textArea.load_text(self.aiCodeHistory[self.currentReverts])
         if self.currentReverts < len(self.aiCodeHistory)-1:
             self.currentReverts += 1
@@ -207,60 +264,271 @@ class ScreenObject(Screen):
     def action_save(self):
         if not self.filePath: return
         try:
-            open(self.filePath.strip(), 'wb').write(self.textArea.text.encode('utf-8'))
-            self.contentsOfFile = self.textArea.text
-            self.sub_title = str(len(self.contentsOfFile.splitlines())+1) + " Lines"
+            self.textArea.save(self.filePath.strip())
+            if self.mappedDocument:
+                self.mappedDocument = self.textArea.document
+            self.fileSignature = file_signature(self.filePath.strip())
+            if self.journal:
+                self.journal.checkpoint(self.fileSignature)
+            self.sub_title = str(self.textArea.line_count) + " Lines"
             self.title = os.path.basename(self.filePath)
-            if self.filePath not in self.workspace.config['updatedFiles']:
-                self.workspace.config['updatedFiles'].append(self.filePath)
-                fileNode = self.workspaceTree.root.add(os.path.basename(self.filePath))
-                fileNode.data = self.filePath
-                self.workspace.save()
+            self.add_workspace_file()
+            self.emit_plugin_event("save")
 
         except Exception as e:
             self.app.clear_notifications()
             self.notify(f"ERROR! {e.__class__.__name__}: {e.args[0]}", severity="error")
-    
-    def __init__(self, name=None, id=None, classes=None, filepath: str = None):
+
+    def add_workspace_file(self):
+        path = os.path.abspath(self.filePath.strip())
+        if self.workspace.mark_modified(path):
+            fileNode = self.workspaceTree.root.add(os.path.basename(path))
+            fileNode.data = path
+
+    def remember_location(self):
+        """Store where the cursor and the scroll offset of the open file are, to restore them when it is opened again."""
+        if self.filePath and getattr(self, "textArea", None) is not None:
+            scroll = self.textArea.scroll_offset
+            self.workspace.set_location(self.filePath.strip(), self.textArea.cursor_location, (scroll.x, scroll.y))
+
+    def restore_location(self, location: tuple):
+        """Move the cursor and the scroll offset back to where they were, see remember_location."""
+        cursor, (x, y) = location
+        self.textArea.move_cursor(cursor)
+        # The TextArea can only scroll once it was laid out.
+        self.textArea.call_after_refresh(self.textArea.scroll_to, x, y, animate=False)
+
+    def schedule_autosave(self):
+        """Autosave the open file once it hasn't changed for config.autoSaveDelay seconds."""
+        if self.autosaveTimer:
+            self.autosaveTimer.stop()
+        self.autosaveTimer = self.set_timer(config.autoSaveDelay, self.autosave)
+
+    def autosave(self):
+        """Hand a snapshot of the open file to the autosave thread."""
+        self.autosaveTimer = None
+        if not self.filePath or not self.textArea.is_modified:
+            return
+        if isinstance(self.textArea.document, MappedDocument):
+            # The mapping has to be swapped on the UI thread.
+            self.action_save()
+            return
+
+        snapshot = self.textArea.snapshot()
+        journal = self.journal
+        sequence = journal.sequence if journal else None
+
+        def done(path, error):
+            signature = file_signature(path)
+            if journal and not error:
+                # Edits made after the snapshot was taken stay in the journal.
+                journal.checkpoint(signature, sequence)
+            self.post_message(self.Autosaved(path, snapshot, signature, error))
+
+        self.autosavesInFlight += 1
+        autosaver.submit(self.filePath.strip(), snapshot.write, done)
+
+    def flush_autosave(self):
+        """Write a pending autosave now and wait until it is on disk, before the open file is switched or closed."""
+        if self.autosaveTimer:
+            self.autosaveTimer.stop()
+            self.autosave()
+        if self.filePath:
+            autosaver.flush(self.filePath.strip())
+
+    def on_screen_object_autosaved(self, event: Autosaved) -> None:
+        self.autosavesInFlight -= 1
+        if not self.filePath or event.path != os.path.abspath(self.filePath.strip()):
+            return
+        if event.error:
+            self.app.clear_notifications()
+            self.notify(f"ERROR! {event.error.__class__.__name__}: {event.error}", severity="error")
+            return
+
+        self.fileSignature = event.signature
+        if isinstance(event.snapshot.state, str):
+            self.contentsOfFile = event.snapshot.state
+        self.textArea.mark_saved(event.snapshot)
+        self.title = ("*" if self.textArea.is_modified else "") + os.path.basename(self.filePath)
+        self.sub_title = str(self.textArea.line_count) + " Lines"
+        self.add_workspace_file()
+        # Changes made by someone else while the write was in flight were skipped by check_for_updates.
+        self.check_for_updates()
+
+    def __init__(self, name=None, id=None, classes=None, filepath: str = None, location: tuple = None):
         self.mainDirectory = os.path.dirname(filepath) if os.path.isfile(filepath) else filepath
         if not os.path.exists(self.mainDirectory):
             self.mainDirectory = os.getcwd()
         if os.path.isfile(os.path.join(self.mainDirectory, filepath.strip())):
+            self.read_file(os.path.join(self.mainDirectory, filepath.strip()))
             self.filePath = filepath
-            self.contentsOfFile = open(os.path.join(self.mainDirectory, filepath.strip()), 'rb').read().decode('utf-8')
         else:
             self.filePath = None
             self.contentsOfFile = "NO FILE SELECTED"
         self.TITLE = os.path.basename(filepath)
-        self.SUB_TITLE = str(len(self.contentsOfFile.splitlines()) + 1) + " Lines"
+        if self.mappedDocument:
+            self.SUB_TITLE = str(self.mappedDocument.line_count) + "+ Lines"
+        else:
+            self.SUB_TITLE = str(self.contentsOfFile.count("\n") + 1) + " Lines"
 
-        self.workspace = WorkspaceClass(".workspace.json")
+        self.workspace = workspace(self.mainDirectory, os.path.join(config.documentNever, ".workspaces"))
+        self.restoredLocation = None
+        if self.filePath:
+            self.workspace.opened(self.filePath.strip())
+            if location is None:
+                self.restoredLocation = self.workspace.location(self.filePath.strip())
 
-        self.aiCodeHistory = [self.contentsOfFile]
+        self.aiCodeHistory = [self.contentsOfFile] if not self.mappedDocument else []
+        self.startLocation = location
 
         super().__init__(name, id, classes)
 
+    def read_file(self, path: str):
+        """Read path into contentsOfFile, or map it into mappedDocument when it is larger than config.largeFileThreshold."""
+        if self.mappedDocument:
+            self.mappedDocument.close()
+            self.mappedDocument = None
+        self.fileSignature = file_signature(path)
+        if os.path.getsize(path) >= config.largeFileThreshold:
+            self.mappedDocument = MappedDocument(path)
+            self.contentsOfFile = None
+        else:
+            self.contentsOfFile = open(path, 'rb').read().decode('utf-8')
+
     def check_for_updates(self):
-        if self.filePath is None:
+        if self.filePath is None or self.autosavesInFlight:
+            return
+        signature = file_signature(self.filePath.strip())
+        if signature == self.fileSignature:
             return
-        if self.contentsOfFile != open(self.filePath.strip(), 'rb').read().decode('utf-8'):
-            if self.contentsOfFile == self.textArea.text:
-                self.contentsOfFile = open(self.filePath.strip(), 'rb').read().decode('utf-8')
+        self.fileSignature = signature
+        if self.mappedDocument:
+            if not self.textArea.is_modified:
+                curs = self.textArea.cursor_location
+                self.read_file(self.filePath.strip())
+                if self.mappedDocument:
+                    self.textArea.load_document(self.mappedDocument, curs)
+                else:
+                    self.textArea.text = self.contentsOfFile
+                    self.textArea.move_cursor(curs)
+                if self.journal:
+                    self.journal.checkpoint(signature)
+            self.notify("File was modified outside of NEVER Editor!", severity="warning")
+            return
+        contents = open(self.filePath.strip(), 'rb').read().decode('utf-8')
+        if self.contentsOfFile != contents:
+            if not self.textArea.is_modified:
+                self.contentsOfFile = contents
                 curs = self.textArea.cursor_location
                 self.textArea.text = self.contentsOfFile
                 self.textArea.move_cursor(curs)
+                if self.journal:
+                    self.journal.checkpoint(signature)
                 self.notify("File was modified outside of NEVER Editor!", severity="warning")
             else:
-                self.contentsOfFile = open(self.filePath.strip(), 'rb').read().decode('utf-8')
+                self.contentsOfFile = contents
                 self.notify("File was modified outside of NEVER Editor!", severity="warning")
 
+    def open_journal(self):
+        """Journal the edits of the open file, first replaying the edits a previous session didn't save."""
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        self.pendingRecovery = False
+        if not self.filePath:
+            return
+
+        path = self.filePath.strip()
+        journal = EditJournal(EditJournal.path_for(os.path.join(config.documentNever, ".journals"), path), path)
+        header, records = journal.read()
+        if records and not journal.matches(header, self.fileSignature):
+            self.notify(f"{os.path.basename(path)} changed since its unsaved edits were journaled, discarding {len(records)} edits.", severity="warning")
+            records = []
+        if records and isinstance(self.textArea.document, MappedDocument) and not self.textArea.document.is_indexed:
+            # Rows past the indexed part of the file don't exist yet, try again once the indexer finished.
+            self.pendingRecovery = True
+            return
+
+        if records:
+            try:
+                self.textArea.replay(records)
+                self.notify(f"Recovered {len(records)} unsaved edits of {os.path.basename(path)}.")
+            except Exception as e:
+                self.notify(f"ERROR! {e.__class__.__name__}: Couldn't replay the edit journal, {e}", severity="error")
+                records = []
+        journal.start(self.fileSignature, records)
+        self.journal = journal
+        self.textArea.attach_journal(journal)
+
+    def close_journal(self):
+        """Stop journaling the open file, keeping the journal only if the buffer has unsaved edits."""
+        if self.journal:
+            self.textArea.detach_journal()
+            self.journal.close(delete=not self.textArea.is_modified)
+            self.journal = None
+        self.pendingRecovery = False
+
+    def watch_file(self, path: str):
+        """Watch path for changes made outside of the editor, instead of the previously watched file."""
+        if self.watchedPath:
+            watcher.unwatch(self.watchedPath, self.file_changed)
+        self.watchedPath = path
+        if path:
+            watcher.watch(path, self.file_changed)
+
+    def file_changed(self, path: str):
+        """Called from the file watcher thread when the open file changed on disk."""
+        self.app.call_from_thread(self.check_for_updates)
+
     def _on_mount(self, event):
-        self.set_interval(1, self.check_for_updates)
+        if self.filePath:
+            self.watch_file(os.path.join(self.mainDirectory, self.filePath.strip()))
+        # Have the project indexed by the time quick open is used.
+        file_index(self.mainDirectory, os.path.join(config.documentNever, ".index")).refresh()
+        config.subscribe(self.config_changed)
         return super()._on_mount(event)
 
-    def compose(self) -> ComposeResult:
-        self.PL = PluginLoader(self.app, "Plugins")
+    def config_changed(self, keys: set):
+        """Called when the config changed, from the file watcher thread if config.json was edited by hand."""
+        if "textAreaTheme" in keys:
+            self.call_later(self.apply_text_area_theme)
+
+    def apply_text_area_theme(self):
+        try:
+            self.textArea.theme = config.textAreaTheme
+        except Exception as e:
+            self.notify(f"ERROR! {e.__class__.__name__}: {e.args[0]}", severity="error")
+
+    def on_unmount(self) -> None:
+        config.unsubscribe(self.config_changed)
+        self.remember_location()
+        self.flush_autosave()
+        self.close_journal()
+        self.watch_file(None)
+        if self.mappedDocument:
+            self.mappedDocument.close()
+
+    def on_nvr_text_area_document_indexed(self, event: NVRTextArea.DocumentIndexed) -> None:
+        if event.text_area is self.textArea:
+            self.sub_title = str(event.line_count) + (" Lines" if event.finished else "+ Lines")
+            if event.finished and self.pendingRecovery:
+                self.open_journal()
+
+    def load_plugins(self):
+        firstLoad = self.PL is None
+        self.PL = plugin_loader(self.app, os.path.join(config.documentNever, "Plugins"))
         self.PL.load_plugins(project_path=self.mainDirectory)
+        if firstLoad and self.filePath:
+            self.emit_plugin_event("open")
+
+    def emit_plugin_event(self, event: str, **payload):
+        """Queue event of the open file for the hooks of the plugins, once they are loaded."""
+        if self.PL and self.filePath:
+            self.PL.events.emit(event, path=os.path.abspath(os.path.join(self.mainDirectory, self.filePath.strip())), **payload)
+
+    def compose(self) -> ComposeResult:
+        # Plugins are loaded once the editor is shown, not before it.
+        self.call_after_refresh(self.load_plugins)
 
         with containers.ScrollableContainer() as container:
             container.styles.dock = "left"
@@ -271,22 +539,17 @@ class ScreenObject(Screen):
 
 
             with Container().set_styles(f"width: 100%; padding: 0 0 1 0;") as innerCont2:
-                self.fileTree = Tree(f"{self.mainDirectory}")
-                self.fileTree.root.expand()
-                populate_tree(self.fileTree.root, self.mainDirectory)
+                self.fileTree = FileTree(self.mainDirectory, f"{self.mainDirectory}")
 
                 self.workspaceTree = Tree(f"Workspace Files")
                 self.workspaceTree.root.expand()
 
-                for file in self.workspace.config['updatedFiles']:
+                for file in self.workspace.modified_files():
                     fileNode = self.workspaceTree.root.add(os.path.basename(file))
                     fileNode.data = file
 
                 self.workspaceTree.ICON_NODE = "❌ "
                 self.workspaceTree.ICON_NODE_EXPANDED = "❌ "
-
-                self.fileTree.ICON_NODE = "📁 "
-                self.fileTree.ICON_NODE_EXPANDED = "📂 "
                 
                 yield Label("Workarea").set_styles("text-align: center; width: 100%;")
 
@@ -307,8 +570,17 @@ class ScreenObject(Screen):
 
         with containers.VerticalScroll() as container:
             container.can_focus = False
-            self.textArea = NVRTextArea.code_editor(text=self.contentsOfFile, language="python", theme=config.textAreaTheme)
+            self.textArea = NVRTextArea.code_editor(text=self.contentsOfFile or "", language="python", theme=config.textAreaTheme)
             yield self.textArea
+            if self.mappedDocument:
+                self.call_after_refresh(self.textArea.load_document, self.mappedDocument)
+            self.call_after_refresh(self.open_journal)
+            if self.startLocation:
+                self.call_after_refresh(self.go_to_location, self.startLocation)
+                self.startLocation = None
+            elif self.restoredLocation:
+                self.call_after_refresh(self.restore_location, self.restoredLocation)
+                self.restoredLocation = None
 
             if config.ollamaModel is not None:
                 with Collapsible(title=f"NEVER Coder: {config.ollamaModel}") as collapsible:
@@ -317,7 +589,7 @@ class ScreenObject(Screen):
                     with containers.Vertical() as cont:
                         cont.can_focus = False
                         cont.styles.margin = (0, 4, 0, 0)
-                        self.aiChat = NVRTextArea.code_editor("", language="python", theme=config.textAreaTheme, read_only=True)
+                        self.aiChat = ChatLog()
                         yield self.aiChat
                         yield Input(placeholder="Type here...", id="aiInput").set_styles("dock: bottom; margin: 0 0 1 0;")
 
@@ -328,7 +600,14 @@ class ScreenObject(Screen):
         if event.input.id == "aiInput":
             try:
                 self.aiCodeHistory.append(self.textArea.text)
-                self.auto_generate(event)
+                if self.aiWorker is not None and self.aiWorker.is_running:
+                    # Let the request this one replaces close its stream and say so first.
+                    self.aiWorker.cancel()
+                    try:
+                        await self.aiWorker.wait()
+                    except Exception:
+                        pass
+                self.aiWorker = self.auto_generate(event)
             except Exception as e: pass
         else:
             pass
@@ -341,30 +620,68 @@ class ScreenObject(Screen):
             try:
                 compile(self.textArea.text, '<string>', 'exec')
             except Exception as e:
-                self.aiChat.load_text(self.aiChat.text + "NEVER: " + str(e) + "\n")
+                self.aiChat.feed("NEVER: " + str(e) + "\n")
                 self.aiChat.set_loading(False)
                 break
+            # A prompt starting with "!" is sent to the model even if its reply is cached.
+            prompt = event.value
+            useCache = not prompt.startswith("!")
+            if not useCache:
+                prompt = prompt[1:].lstrip()
+            self.aiChat.feed(f"You: {event.value}\nNEVER: ")
+            start = time.perf_counter()
+            firstText = []
+
+            def on_text(text: str):
+                if not firstText:
+                    firstText.append(text)
+                    self.show_first_token(time.perf_counter() - start)
+                self.aiChat.feed(text)
+
             try:
-                fullyMergedCode, response, snippets = await to_thread(
-                    self.never.generate, self.textArea.text, event.value
+                # Runs on the event loop, cancelling this worker closes the stream and Ollama stops generating.
+                fullyMergedCode, response, snippets = await self.never.generate(
+                    self.textArea.text, prompt, self.aiContext, on_text, self.snippet_ready, useCache, self.textArea.cursor_location[0]
                 )
-                cleanResponse = "NEVER: " + remove_code_snippets(response.message.content)
-                if cleanResponse.strip() == "NEVER:":
-                    cleanResponse = "NEVER: Didn't respond with an explanation."
-                self.aiChat.load_text(self.aiChat.text + cleanResponse + "\n")
+                self.aiChatCollapsible.title = f"NEVER Coder: {config.ollamaModel} - {self.aiContext.metrics[-1]}"
+                if not response.message.content.strip():
+                    self.aiChat.feed("Didn't respond.")
+                self.aiChat.feed("\n")
                 event.input.value = ""
                 self.aiChat.set_loading(False)
-                if not config.autoMerge and snippets is not None and len(snippets) > 0:
-                    self.app.push_screen(MergerScreen(snippets=snippets, mainTextArea=self.textArea, this=self))
-                else:
+                # Without autoMerge the snippets were handed to the MergerScreen by snippet_ready while the reply was generated.
+                if config.autoMerge or not snippets:
                     self.textArea.text = fullyMergedCode
                     self.aiCodeHistory.append(fullyMergedCode)
+                    self.emit_plugin_event("ai_merge", snippets=[snippet["code"] for snippet in snippets])
                 break
             except asyncio.CancelledError:
-                self.aiChat.load_text(self.aiChat.text + "NEVER: Cancelled Generation!" + "\n")
+                self.aiChat.feed("\nNEVER: Cancelled Generation!\n")
+                self.aiChat.set_loading(False)
+                break
+            except Exception as e:
+                self.aiChat.feed("\n")
                 self.aiChat.set_loading(False)
+                self.app.clear_notifications()
+                self.notify(f"ERROR! {e.__class__.__name__}: {e}", severity="error")
                 break
 
+    def snippet_ready(self, snippet: dict):
+        """A snippet of the reply being generated was merged, or couldn't be."""
+        if snippet.get("error"):
+            self.notify(f"Skipped a snippet of the reply! {snippet['error']}", severity="warning")
+        elif not config.autoMerge:
+            if self.mergerScreen is not None and self.mergerScreen in self.app.screen_stack:
+                self.mergerScreen.add_snippet(snippet)
+            else:
+                self.mergerScreen = MergerScreen(snippets=[snippet], mainTextArea=self.textArea, this=self)
+                self.app.push_screen(self.mergerScreen)
+
+    def show_first_token(self, seconds: float):
+        """The first text of a reply arrived seconds after it was asked for."""
+        self.aiChat.set_loading(False)
+        self.aiChatCollapsible.title = f"NEVER Coder: {config.ollamaModel} - first token after {seconds:.1f} s"
+
     async def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
         selected_language = event.option.prompt
         syntax_name = selected_language.lower()
@@ -383,6 +700,7 @@ class ScreenObject(Screen):
 
     async def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "settingsButton":
+            from Screens import Settings
             self.app.push_screen(Settings.ScreenObject())
         elif event.button.id == "projectSettings":
             self.app.push_screen(ProjectSettingsScreen(filepath=self.mainDirectory))
@@ -391,18 +709,10 @@ class ScreenObject(Screen):
         """Handle lazy loading of folder contents when expanded."""
         now = datetime.now()
 
-        if event.control is self.fileTree:
-            node = event.node
-            if node.data and not node.children:
-                populate_tree(node, node.data)
-            event.stop()  # Prevent propagation for fileTree events
-
-        elif event.control is self.workspaceTree:
+        if event.control is self.workspaceTree:
             if event.node.data and getattr(self, 'lastExpandedNodeTime', datetime.min) + timedelta(milliseconds=500) <= now:
                 node = event.node
-                if node.data in self.workspace.config.get('updatedFiles', []):
-                    self.workspace.config['updatedFiles'].remove(node.data)
-                    self.workspace.save()
+                self.workspace.unmark_modified(node.data)
                 self.refresh(repaint=True, recompose=True)  # Only repaint, not full recompose
                 event.stop()  # Prevent propagation for workspaceTree events
 
@@ -412,39 +722,52 @@ class ScreenObject(Screen):
     async def on_tree_node_selected(self, event: Tree.NodeSelected) -> None:
         """Handle file or folder selection."""
         node = event.node
-
         if node.data:
             item_type = "File" if os.path.isfile(node.data) else "Folder"
 
             if item_type == "File":
-                self.filePath = node.data
-                self.contentsOfFile = open(self.filePath.strip(), 'rb').read().decode('utf-8')
-                self.textArea.text = self.contentsOfFile
-                self.title = os.path.basename(self.filePath)
-                self.sub_title = str(len(self.contentsOfFile.splitlines())+1) + " Lines"
-
-                self.aiCodeHistory = [self.contentsOfFile]
+                self.open_file(node.data)
+
+    async def on_file_tree_selected(self, event: FileTree.Selected) -> None:
+        if not event.is_dir:
+            self.open_file(event.path)
+
+    def go_to_location(self, location: tuple):
+        """Move the cursor to the (row, column) location, scrolled into the middle of the TextArea."""
+        self.textArea.move_cursor(location, center=True)
+        self.textArea.focus()
+
+    def open_file(self, path: str, location: tuple = None):
+        """Show the file at path in this editor, in place of the open one, with the cursor at location."""
+        self.flush_autosave()
+        self.close_journal()
+        self.remember_location()
+        self.startLocation = location
+        self.filePath = path
+        self.workspace.opened(path.strip())
+        self.restoredLocation = self.workspace.location(path.strip()) if location is None else None
+        self._aiContext = None
+        self.read_file(self.filePath.strip())
+        self.watch_file(self.filePath.strip())
+        self.title = os.path.basename(self.filePath)
+        if self.mappedDocument:
+            self.sub_title = str(self.mappedDocument.line_count) + "+ Lines"
+            self.aiCodeHistory = []
+        else:
+            self.textArea.text = self.contentsOfFile
+            self.sub_title = str(self.textArea.line_count) + " Lines"
+            self.aiCodeHistory = [self.contentsOfFile]
 
-                self.refresh(repaint=True, recompose=True)
+        self.refresh(repaint=True, recompose=True)
+        self.emit_plugin_event("open")
     
     async def on_text_area_changed(self, event: TextArea.Changed) -> None:
-        if config.autoSave and self.filePath:
-            try:
-                open(self.filePath.strip(), 'wb').write(self.textArea.text.encode('utf-8'))
-                self.contentsOfFile = self.textArea.text
-                self.sub_title = str(len(self.contentsOfFile.splitlines())+1) + " Lines"
-                self.title = os.path.basename(self.filePath)
-                if self.filePath not in self.workspace.config['updatedFiles']:
-                    self.workspace.config['updatedFiles'].append(self.filePath)
-                    fileNode = self.workspaceTree.root.add(os.path.basename(self.filePath))
-                    fileNode.data = self.filePath
-                    self.workspace.save()
-
-            except Exception as e:
-                self.app.clear_notifications()
-                self.notify(f"ERROR! {e.__class__.__name__}: {e.args[0]}", severity="error")
+        if event.text_area is not self.textArea or not self.filePath:
+            return
+        self.emit_plugin_event("change")
+        if self.textArea.is_modified:
+            self.title = "*" + os.path.basename(self.filePath)
+            if config.autoSave:
+                self.schedule_autosave()
         else:
-            if event.text_area.text != self.contentsOfFile and self.filePath:
-                self.title = "*" + os.path.basename(self.filePath)
-            elif self.filePath:
-                self.title = os.path.basename(self.filePath)
\ No newline at end of file
+            self.title = os.path.basename(self.filePath)
\ No newline at end of file
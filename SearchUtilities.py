@@ -0,0 +1,719 @@
+import os
+import re
+import sys
+import json
+import mmap
+import heapq
+import hashlib
+import threading
+import time
+import multiprocessing
+from multiprocessing import resource_tracker
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, NamedTuple, Optional
+from FileUtilities import atomic_write, RACY_WINDOW
+
+# Folders that are never indexed, on top of the ones .gitignore files exclude.
+IGNORED_FOLDERS = {".git", ".hg", ".svn"}
+
+# Files a project index holds at most, the rest of a bigger tree is left out.
+MAX_INDEXED_FILES = 2_000_000
+
+# Matches collected before they are ranked, so a vague query stays cheap.
+SUBSTRING_CANDIDATES = 2000
+FUZZY_CANDIDATES = 500
+
+# Seconds after which a query stops looking for subsequence matches, and the characters it matches at once in between.
+QUERY_BUDGET = 0.015
+FUZZY_CHUNK = 256 * 1024
+
+# Version of the persisted file index, an index persisted in another format is built afresh.
+INDEX_FORMAT = 2
+
+# Processes searching file contents, and the files one of them is handed at once.
+SEARCH_WORKERS = os.cpu_count() or 1
+SEARCH_CHUNK = 64
+
+# Matches reported for a single file and for a whole search at most.
+SEARCH_FILE_MATCHES = 1000
+SEARCH_MAX_MATCHES = 10_000
+
+# Leading bytes looked at for a NUL byte to tell binary files apart, as git does.
+BINARY_SNIFF = 8000
+
+# Seconds between two batches of matches handed to the screen, and characters of a matching line kept.
+SEARCH_FLUSH_INTERVAL = 0.1
+SEARCH_LINE_LENGTH = 200
+
+# Bytes of a mapped file copied at once while counting its lines.
+LINE_COUNT_CHUNK = 16 * 1024 * 1024
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a .gitignore glob into a regular expression for a '/' separated path."""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", index + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[index + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                index = end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+
+class GitIgnore:
+    """The rules of the .gitignore files that apply to a folder, matched the way git matches them."""
+
+    def __init__(self, rules: list = None):
+        # (base folder, compiled pattern, negated, only matches folders)
+        self.rules = rules or []
+
+    def extended(self, base: str, path: str) -> "GitIgnore":
+        """Return a GitIgnore with the rules of the .gitignore file at path, which lives in the folder base."""
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as file:
+                lines = file.read().splitlines()
+        except OSError:
+            return self
+
+        rules = list(self.rules)
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            only_folders = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            if "/" in line:
+                regex = glob_to_regex(line.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + glob_to_regex(line)
+            rules.append((base, re.compile(regex + "$"), negated, only_folders))
+        return GitIgnore(rules)
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """Whether the project relative path is ignored, the last matching rule wins."""
+        ignored = False
+        for base, pattern, negated, only_folders in self.rules:
+            if only_folders and not is_dir:
+                continue
+            if base:
+                if not path.startswith(base + "/"):
+                    continue
+                relative = path[len(base) + 1:]
+            else:
+                relative = path
+            if pattern.match(relative):
+                ignored = not negated
+        return ignored
+
+
+class FileIndex:
+    """Index of every file in a project, for quick open.
+
+    The tree is walked on a background thread, honouring .gitignore files.
+    The file names are kept in one newline separated string, along with a
+    lowercased copy and the offset of every line, and the files of a folder
+    are a run of consecutive lines. A query is a handful of C level
+    str.find() calls over the lowercased names: names containing the query,
+    making sure the ones starting with it are among them, then names holding
+    its characters in order for as long as QUERY_BUDGET allows. In queries
+    containing a '/', the part before the last one is matched against the
+    folders the same way and the rest against the names of the files in them.
+
+    The strings and offsets are persisted as they are, together with the
+    folders and their mtimes, so loading the index takes a few reads and
+    refreshing it later one stat per folder, listing only the folders that
+    changed since.
+    """
+
+    def __init__(self, root: str, cache_path: str = None):
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+        self.ready = False
+        self._lock = threading.Lock()
+        self._thread: threading.Thread = None
+        self._loaded = False
+        # Folder relative path -> (mtime, .gitignore mtime, number, first line, line count, folders)
+        self._folders: Dict[str, tuple] = {}
+        # Folder paths by number, None once removed, and the number of the folder of every line, -1 once removed.
+        self._folderPaths: List[Optional[str]] = []
+        self._owners = array("i")
+        self._live = 0
+        # The names as they are and lowercased, each starting and ending with a newline, and where their lines start.
+        self._text = "\n"
+        self._textStarts = array("q", [1])
+        self._blob = "\n"
+        self._starts = array("q", [1])
+        # Names of the lines added since the strings were last joined.
+        self._pending: List[str] = []
+        self._folderList: List[str] = []
+        self._folderBlob = "\n"
+        self._folderStarts = array("q", [1])
+
+    @property
+    def file_count(self) -> int:
+        return self._live
+
+    def refresh(self, done=None):
+        """Bring the index up to date on a background thread, calling done() afterwards."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh, args=(done,), name="FileIndex", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float = None):
+        """Block until a running refresh finished."""
+        thread = self._thread
+        if thread:
+            thread.join(timeout)
+
+    def _refresh(self, done):
+        try:
+            if not self._loaded:
+                self._loaded = True
+                if self._load():
+                    self._rebuild_blob()
+                    self.ready = True
+            try:
+                changed = self._walk()
+            finally:
+                self._rebuild_blob()
+            if changed:
+                self._save()
+            self.ready = True
+        except Exception as e:
+            print(f"Error indexing '{self.root}': {e}")
+        if done:
+            done()
+
+    def _load(self) -> bool:
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path, "rb") as file:
+                header = json.loads(file.readline())
+                if not isinstance(header, dict) or header.get("format") != INDEX_FORMAT or header.get("root") != self.root:
+                    return False
+                sections = [file.read(size) for size in header["sections"]]
+            if [len(section) for section in sections] != header["sections"]:
+                return False
+            text, blob = (section.decode("utf-8", "surrogatepass") for section in sections[:2])
+            textStarts, starts, owners = array("q"), array("q"), array("i")
+            for values, section in zip((textStarts, starts, owners), sections[2:]):
+                values.frombytes(section)
+            folders = {folder: tuple(stored) for folder, *stored in header["folders"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not len(textStarts) == len(starts) == len(owners) + 1:
+            return False
+        with self._lock:
+            self._text, self._textStarts, self._blob, self._starts, self._owners = text, textStarts, blob, starts, owners
+            self._folders = folders
+            self._folderPaths = header["folderPaths"]
+            self._live = sum(stored[4] for stored in folders.values())
+        return True
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            header = {
+                "format": INDEX_FORMAT,
+                "root": self.root,
+                "folderPaths": self._folderPaths,
+                "folders": [[folder, *stored] for folder, stored in self._folders.items()],
+            }
+            sections = [
+                self._text.encode("utf-8", "surrogatepass"),
+                self._blob.encode("utf-8", "surrogatepass"),
+                self._textStarts.tobytes(),
+                self._starts.tobytes(),
+                self._owners.tobytes(),
+            ]
+            header["sections"] = [len(section) for section in sections]
+            text = json.dumps(header)
+
+        def write(file):
+            file.write(text.encode("utf-8") + b"\n")
+            for section in sections:
+                file.write(section)
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            atomic_write(self.cache_path, write)
+        except OSError as e:
+            print(f"Error saving the file index of '{self.root}': {e}")
+
+    @staticmethod
+    def _join(folder: str, name: str) -> str:
+        return folder + "/" + name if folder else name
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _walk(self) -> bool:
+        """List the folders that changed since the last walk and update the index, returns whether anything changed."""
+        changed = False
+        seen = set()
+        stack = [("", GitIgnore(), False)]
+        while stack:
+            folder, ignore, forced = stack.pop()
+            path = os.path.join(self.root, folder)
+            mtime = self._mtime(path)
+            if mtime is None:
+                continue
+            seen.add(folder)
+            ignore_mtime = self._mtime(os.path.join(path, ".gitignore"))
+            if ignore_mtime is not None:
+                ignore = ignore.extended(folder, os.path.join(path, ".gitignore"))
+
+            stored = self._folders.get(folder)
+            if stored and stored[1] != ignore_mtime:
+                # Different rules apply to everything below this folder now.
+                forced = True
+            if stored and not forced and stored[0] == mtime:
+                folders = stored[5]
+            else:
+                files, folders = self._list(folder, path, ignore)
+                if time.time() - mtime / 1e9 < RACY_WINDOW:
+                    # Changes within the same mtime tick would go unnoticed, list this folder again next time.
+                    mtime = None
+                with self._lock:
+                    if stored and set(self._names_of(stored[3], stored[4])) == set(files):
+                        number, first, count = stored[2:5]
+                    else:
+                        number, first, count = self._add_folder(folder, stored, files)
+                    self._folders[folder] = (mtime, ignore_mtime, number, first, count, folders)
+                changed = True
+
+            for name in folders:
+                stack.append((self._join(folder, name), ignore, forced))
+
+        with self._lock:
+            for folder in [folder for folder in self._folders if folder not in seen]:
+                stored = self._folders.pop(folder)
+                self._remove_lines(stored[3], stored[4])
+                self._folderPaths[stored[2]] = None
+                changed = True
+        return changed
+
+    def _list(self, folder: str, path: str, ignore: GitIgnore) -> tuple:
+        files, folders = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if not is_dir and not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if is_dir and entry.name in IGNORED_FOLDERS:
+                        continue
+                    if ignore.ignored(self._join(folder, entry.name), is_dir):
+                        continue
+                    (folders if is_dir else files).append(entry.name)
+        except OSError:
+            pass
+        return files, folders
+
+    def files(self) -> List[str]:
+        """The project relative, '/' separated paths of the indexed files."""
+        with self._lock:
+            return [self._join(folder, name) for folder, stored in self._folders.items() for name in self._names_of(stored[3], stored[4])]
+
+    def _names_of(self, first: int, count: int) -> List[str]:
+        """The names of count lines from first, which are all joined or all pending."""
+        if not count:
+            return []
+        joined = len(self._textStarts) - 1
+        if first >= joined:
+            return self._pending[first - joined:first - joined + count]
+        return self._text[self._textStarts[first]:self._textStarts[first + count] - 1].split("\n")
+
+    def _add_folder(self, folder: str, stored: Optional[tuple], files: List[str]) -> tuple:
+        """Replace the lines of folder with ones for files, returns its number, first line and line count."""
+        if stored:
+            number = stored[2]
+            self._remove_lines(stored[3], stored[4])
+        else:
+            number = len(self._folderPaths)
+            self._folderPaths.append(folder)
+        files = files[:max(0, MAX_INDEXED_FILES - self._live)]
+        first = len(self._owners)
+        self._owners.extend(array("i", [number]) * len(files))
+        self._pending.extend(files)
+        self._live += len(files)
+        return number, first, len(files)
+
+    def _remove_lines(self, first: int, count: int):
+        self._owners[first:first + count] = array("i", [-1]) * count
+        self._live -= count
+
+    @staticmethod
+    def _join_lines(lines: list) -> tuple:
+        """Join lines into a string starting and ending with a newline, and the offset every line starts at."""
+        return FileIndex._append_lines("\n", array("q", [1]), lines)
+
+    @staticmethod
+    def _append_lines(blob: str, starts: array, lines: list) -> tuple:
+        """Append lines to a string joined by _join_lines, and their offsets to starts."""
+        starts = array("q", starts)
+        offset = starts[-1]
+        for line in lines:
+            offset += len(line) + 1
+            starts.append(offset)
+        return blob + "\n".join(lines) + "\n" if lines else blob, starts
+
+    def _rebuild_blob(self):
+        """Join the names added since the last time for queries, dropping removed files for good once they pile up."""
+        with self._lock:
+            if len(self._owners) > 2 * self._live + 1024:
+                names, owners = [], array("i")
+                for folder, (mtime, ignore_mtime, number, first, count, folders) in self._folders.items():
+                    self._folders[folder] = (mtime, ignore_mtime, number, len(names), count, folders)
+                    names.extend(self._names_of(first, count))
+                    owners.extend(array("i", [number]) * count)
+                self._pending = []
+                self._owners = owners
+                self._text, self._textStarts = self._join_lines(names)
+                self._blob, self._starts = self._join_lines([name.lower() for name in names])
+            pending, self._pending = self._pending, []
+            if pending:
+                self._text, self._textStarts = self._append_lines(self._text, self._textStarts, pending)
+                self._blob, self._starts = self._append_lines(self._blob, self._starts, [name.lower() for name in pending])
+            self._folderList = list(self._folders)
+            self._folderBlob, self._folderStarts = self._join_lines([folder.lower() for folder in self._folderList])
+
+    def _path(self, index: int) -> str:
+        """The project relative path of the file of a joined line."""
+        return self._join(self._folderPaths[self._owners[index]], self._text[self._textStarts[index]:self._textStarts[index + 1] - 1])
+
+    def query(self, text: str, limit: int = 50) -> List[str]:
+        """Return up to limit absolute paths matching text, best matches first.
+
+        Files added since the last refresh finished are found after the next one.
+        """
+        deadline = time.perf_counter() + QUERY_BUDGET
+        query = "".join(text.lower().replace("\\", "/").split()).lstrip("/")
+        if not query or "\n" in query:
+            return []
+        with self._lock:
+            if "/" in query:
+                ids = self._find_in_folders(*query.rsplit("/", 1), deadline)
+            else:
+                ids = self._find_names(self._blob, self._starts, query, limit, deadline)
+
+            owners = self._owners
+            ids = [index for index in ids if owners[index] >= 0]
+            name_query = query.rsplit("/", 1)[-1]
+            best = heapq.nsmallest(limit, ids, key=lambda index: self._score(index, query, name_query))
+            return [os.path.join(self.root, *self._path(index).split("/")) for index in best]
+
+    def _find_names(self, blob: str, starts: array, query: str, limit: int, deadline: float) -> set:
+        """Indexes of the lines of blob containing query, then holding it as a subsequence until deadline."""
+        ids = self._find(blob, starts, query, 0, SUBSTRING_CANDIDATES)
+        if len(ids) >= SUBSTRING_CANDIDATES:
+            # Cut short, the lines starting with query rank first and mustn't be missing.
+            ids.update(self._find(blob, starts, "\n" + query, 1, SUBSTRING_CANDIDATES))
+        if len(ids) < limit:
+            ids.update(self._find_subsequence(blob, starts, query, deadline))
+        return ids
+
+    def _find_in_folders(self, folder_query: str, name_query: str, deadline: float) -> set:
+        """Indexes of the files matching name_query in the folders matching folder_query."""
+        folders = [self._folderList[index] for index in
+                   self._find_names(self._folderBlob, self._folderStarts, folder_query, FUZZY_CANDIDATES, deadline)]
+        pattern = self._subsequence_pattern(name_query) if name_query else None
+        starts = self._starts
+        ids = set()
+        for folder in folders:
+            stored = self._folders.get(folder)
+            if not stored or not stored[4] or stored[3] + stored[4] >= len(starts):
+                continue
+            first, count = stored[3], stored[4]
+            if pattern is None:
+                ids.update(range(first, first + count))
+                continue
+            for match in pattern.finditer(self._blob, starts[first], starts[first + count]):
+                ids.add(bisect_right(starts, match.start()) - 1)
+            if len(ids) >= SUBSTRING_CANDIDATES:
+                break
+        return ids
+
+    @staticmethod
+    def _subsequence_pattern(query: str) -> "re.Pattern":
+        """A pattern matching the characters of query in order within a line."""
+        # Each step skips everything but the next character, so the pattern never backtracks.
+        parts = [re.escape(query[0])]
+        for char in query[1:]:
+            parts.append(f"[^\n{re.escape(char)}]*{re.escape(char)}")
+        return re.compile("".join(parts))
+
+    @staticmethod
+    def _find(blob: str, starts: array, needle: str, skip: int, limit: int) -> set:
+        """Indexes of the lines of blob containing needle (after skip characters), at most limit of them."""
+        ids = set()
+        position = blob.find(needle)
+        while position != -1 and len(ids) < limit:
+            index = bisect_right(starts, position + skip) - 1
+            ids.add(index)
+            position = blob.find(needle, starts[index + 1] - skip)
+        return ids
+
+    @staticmethod
+    def _find_subsequence(blob: str, starts: array, query: str, deadline: float) -> set:
+        """Indexes of the lines of blob holding the characters of query in order.
+
+        Stops at FUZZY_CANDIDATES lines or at deadline, whichever comes first.
+        """
+        pattern = FileIndex._subsequence_pattern(query)
+        ids = set()
+        position = 0
+        # Matches never cross a newline, so the blob can be matched in chunks ending at one.
+        while position < len(blob) and time.perf_counter() < deadline:
+            end = blob.find("\n", position + FUZZY_CHUNK)
+            end = len(blob) if end == -1 else end
+            for match in pattern.finditer(blob, position, end):
+                ids.add(bisect_right(starts, match.start()) - 1)
+                if len(ids) >= FUZZY_CANDIDATES:
+                    return ids
+            position = end
+        return ids
+
+    def _score(self, index: int, query: str, name_query: str) -> tuple:
+        """Names starting with the query rank first, then names and paths containing it, then subsequences.
+
+        Only name_query, the part of the query after the last '/', is looked for in the name, paths
+        containing all of the query go first.
+        """
+        path = self._path(index)
+        start = self._starts[index]
+        position = self._blob.find(name_query, start, self._starts[index + 1] - 1)
+        if position == start:
+            rank = 0
+        elif position > 0:
+            rank = 1
+        elif query in path.lower():
+            rank = 2
+        else:
+            rank = 3
+        return (rank, "/" in query and query not in path.lower(), len(path), path)
+
+
+fileIndexes: Dict[str, FileIndex] = {}
+
+
+def file_index(root: str, cache_directory: str = None) -> FileIndex:
+    """Return the shared FileIndex of the project at root, persisted under cache_directory."""
+    root = os.path.abspath(root)
+    if root not in fileIndexes:
+        cache_path = None
+        if cache_directory:
+            cache_path = os.path.join(cache_directory, hashlib.sha1(root.encode("utf-8")).hexdigest() + ".index")
+        fileIndexes[root] = FileIndex(root, cache_path)
+    return fileIndexes[root]
+
+
+class SearchMatch(NamedTuple):
+    """A line of a file matching a project search, line and column count from 0."""
+    path: str
+    line: int
+    column: int
+    text: str
+
+
+def compile_search(query: str, regex: bool = False, case_sensitive: bool = False) -> "re.Pattern":
+    """Compile query into the bytes pattern search_files looks for."""
+    pattern = query.encode("utf-8")
+    if not regex:
+        pattern = re.escape(pattern)
+    return re.compile(pattern, re.MULTILINE | (0 if case_sensitive else re.IGNORECASE))
+
+
+def _count_lines(data: mmap.mmap, start: int, end: int) -> int:
+    count = 0
+    while start < end:
+        count += data[start:min(end, start + LINE_COUNT_CHUNK)].count(b"\n")
+        start += LINE_COUNT_CHUNK
+    return count
+
+
+def search_file(path: str, pattern: "re.Pattern") -> List[SearchMatch]:
+    """Return the lines of the file at path matching pattern, nothing for binary or empty files."""
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b"\0", 0, BINARY_SNIFF) != -1:
+                return []
+            matches = []
+            line = counted = position = 0
+            while position <= size and len(matches) < SEARCH_FILE_MATCHES:
+                match = pattern.search(data, position)
+                if not match:
+                    break
+                start = data.rfind(b"\n", 0, match.start()) + 1
+                end = data.find(b"\n", match.start())
+                end = size if end == -1 else end
+                line += _count_lines(data, counted, start)
+                counted = start
+                text = data[start:min(end, start + 4 * SEARCH_LINE_LENGTH)].decode("utf-8", "replace")
+                column = len(data[start:match.start()].decode("utf-8", "replace"))
+                matches.append(SearchMatch(path, line, column, text.rstrip("\r")[:SEARCH_LINE_LENGTH]))
+                # One match per line is enough to show it.
+                position = end + 1
+            return matches
+
+
+def search_files(paths: List[str], pattern: "re.Pattern") -> List[SearchMatch]:
+    """Search every file of paths, run by the processes of the search pool."""
+    matches = []
+    for path in paths:
+        try:
+            matches.extend(search_file(path, pattern))
+        except (OSError, ValueError):
+            # Gone, unreadable or not mappable, like a FIFO.
+            continue
+    return matches
+
+
+searchPool: ProcessPoolExecutor = None
+
+
+def search_pool() -> ProcessPoolExecutor:
+    """Return the process pool project searches share, started the first time one runs."""
+    global searchPool
+    if searchPool is None:
+        # The tracker process inherits stderr, which Textual swaps for an object without a file descriptor.
+        stderr = sys.stderr
+        sys.stderr = sys.__stderr__
+        try:
+            resource_tracker.ensure_running()
+        finally:
+            sys.stderr = stderr
+        # Forking the editor with its threads running isn't safe, the workers start afresh instead.
+        searchPool = ProcessPoolExecutor(SEARCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return searchPool
+
+
+class ProjectSearch:
+    """A search through every file of a FileIndex, spread over the search pool.
+
+    on_matches(matches) is called from a background thread with the matches
+    found so far every SEARCH_FLUSH_INTERVAL seconds, and on_done(search)
+    once the search finished or was cancelled. Only a few chunks of files are
+    handed to the pool at a time, so cancelling stops a search within the time
+    the workers take for one chunk.
+    """
+
+    def __init__(self, index: FileIndex, pattern: "re.Pattern", on_matches: Callable[[List[SearchMatch]], None], on_done: Callable[["ProjectSearch"], None] = None):
+        self.index = index
+        self.pattern = pattern
+        self.on_matches = on_matches
+        self.on_done = on_done
+        self.files = 0
+        self.searched = 0
+        self.found = 0
+        self.truncated = False
+        self.error: Exception = None
+        self._cancelled = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ProjectSearch", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait(self, timeout: float = None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        pending = set()
+        try:
+            if not self.index.ready:
+                self.index.refresh()
+                self.index.wait()
+            paths = self.index.files()
+            self.files = len(paths)
+            pool = search_pool()
+            position = 0
+            batch = []
+            flushed = time.monotonic()
+            while not self.cancelled and (position < len(paths) or pending):
+                while position < len(paths) and len(pending) < 2 * SEARCH_WORKERS:
+                    chunk = [os.path.join(self.index.root, *path.split("/")) for path in paths[position:position + SEARCH_CHUNK]]
+                    pending.add(pool.submit(search_files, chunk, self.pattern))
+                    position += SEARCH_CHUNK
+                done, pending = wait(pending, SEARCH_FLUSH_INTERVAL, FIRST_COMPLETED)
+                for future in done:
+                    matches = future.result()
+                    self.searched += SEARCH_CHUNK
+                    batch.extend(matches[:SEARCH_MAX_MATCHES - self.found - len(batch)])
+                if self.cancelled:
+                    break
+                if batch and (time.monotonic() - flushed >= SEARCH_FLUSH_INTERVAL or not pending):
+                    self.found += len(batch)
+                    self.on_matches(batch)
+                    batch = []
+                    flushed = time.monotonic()
+                if self.found + len(batch) >= SEARCH_MAX_MATCHES:
+                    self.truncated = True
+                    if batch:
+                        self.found += len(batch)
+                        self.on_matches(batch)
+                    break
+            self.searched = min(self.searched, self.files)
+        except Exception as e:
+            self.error = e
+            print(f"Error searching '{self.index.root}': {e}")
+        finally:
+            for future in pending:
+                future.cancel()
+            if self.on_done:
+                self.on_done(self)
@@ -0,0 +1,627 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import partial
+from itertools import accumulate
+from typing import Dict, List, Optional
+import os, time
+
+from rich.style import Style
+from rich.text import Text
+from textual import events
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.worker import get_current_worker
+
+from FileUtilities import directoryCache, watcher, scan_directory
+
+# Entries the scanning thread hands to the UI at once, and seconds it holds back fewer entries at most.
+FILE_TREE_BATCH = 5000
+FILE_TREE_BATCH_INTERVAL = 0.05
+
+# Kinds of FileTree entries.
+FILE = 0
+FOLDER = 1
+DENIED = 2
+REMOVED = 3
+
+# Guides drawn in front of an entry for its ancestors, and for itself.
+GUIDE_SPACE = "    "
+GUIDE_VERTICAL = "│   "
+GUIDE_LAST = "└── "
+GUIDE_CROSS = "├── "
+
+
+class FileTree(ScrollView, can_focus=True):
+    """A tree of the files and folders below a root folder, for folders of any size.
+
+    Entries live in flat arrays: the parent of every entry, a byte for its
+    kind and the offset of its name in one string per batch of names, so an
+    entry costs a few bytes on top of its name. Only the indexes of the
+    visible rows are kept in order and only the rows in view are rendered.
+    Folders are scanned on a worker thread the first time they are expanded,
+    their entries show up in batches, and changes on disk are applied by the
+    file watcher as long as the tree shows them.
+    """
+
+    BINDINGS = [
+        Binding("enter", "select_cursor", "Select", show=False),
+        Binding("space", "toggle_cursor", "Toggle", show=False),
+        Binding("up", "cursor_up", "Cursor Up", show=False),
+        Binding("down", "cursor_down", "Cursor Down", show=False),
+        Binding("pageup", "page_up", "Page Up", show=False),
+        Binding("pagedown", "page_down", "Page Down", show=False),
+        Binding("home", "cursor_home", "First", show=False),
+        Binding("end", "cursor_end", "Last", show=False),
+        Binding("left", "cursor_parent", "Collapse", show=False),
+        Binding("right", "cursor_expand", "Expand", show=False),
+    ]
+
+    COMPONENT_CLASSES = {"file-tree--guides", "file-tree--cursor", "file-tree--highlight-line"}
+
+    DEFAULT_CSS = """
+    FileTree {
+        height: 1fr;
+        background: $surface;
+        color: $foreground;
+
+        & > .file-tree--guides {
+            color: $surface-lighten-2;
+        }
+        & > .file-tree--cursor {
+            text-style: $block-cursor-blurred-text-style;
+            background: $block-cursor-blurred-background;
+        }
+        & > .file-tree--highlight-line {
+            background: $block-hover-background;
+        }
+
+        &:focus {
+            background-tint: $foreground 5%;
+            & > .file-tree--cursor {
+                color: $block-cursor-foreground;
+                background: $block-cursor-background;
+                text-style: $block-cursor-text-style;
+            }
+            & > .file-tree--guides {
+                color: $surface-lighten-3;
+            }
+        }
+    }
+    """
+
+    ICON_FOLDER = "📁 "
+    ICON_FOLDER_EXPANDED = "📂 "
+    ICON_FILE = "📄 "
+
+    class Selected(Message):
+        """Posted when an entry was picked with enter or a click."""
+
+        def __init__(self, file_tree: "FileTree", path: str, is_dir: bool, is_root: bool):
+            self.file_tree = file_tree
+            self.path = path
+            self.is_dir = is_dir
+            self.is_root = is_root
+            super().__init__()
+
+        @property
+        def control(self) -> "FileTree":
+            return self.file_tree
+
+    def __init__(self, path: str, label: str = None, auto_expand: bool = True, name=None, id=None, classes=None):
+        """auto_expand has folders expand and collapse when they are selected, otherwise only the root folder is ever expanded."""
+        super().__init__(name=name, id=id, classes=classes)
+        self.auto_expand = auto_expand
+        self.ownerApp = None
+        self.hoverRow = -1
+        self._generation = 0
+        self._folders: Dict[str, int] = {}
+        self._reset(path, label)
+
+    def _reset(self, path: str, label: str = None):
+        for folder_path in self._folders:
+            watcher.unwatch_directory(folder_path, self._changed)
+        self.rootPath = os.path.abspath(path)
+        self._label = label if label is not None else path
+        # Deliveries of scans of the previous root are dropped.
+        self._generation += 1
+        self._chunks: List[str] = []
+        self._chunkFirsts = array("i")
+        self._starts = array("i")
+        self._parents = array("i")
+        self._kinds = bytearray()
+        self._children: Dict[int, array] = {}
+        self._chunksOf: Dict[int, List[int]] = {}
+        self._expanded = {0}
+        # Loaded folders, which are watched, by path and the other way round.
+        self._folders: Dict[str, int] = {}
+        self._folderPaths: Dict[int, str] = {}
+        self._loading = set()
+        # Names the watcher added while a folder was still being scanned.
+        self._watchedNames: Dict[int, set] = {}
+        self._rows = array("i", [0])
+        self._width = 0
+        self.cursor = 0
+        self._append(-1, [""], bytes([FOLDER]))
+
+    def set_root(self, path: str, label: str = None):
+        """Show the folder at path, in place of everything shown so far."""
+        self._reset(path, label)
+        if self.is_mounted:
+            self._load(0)
+        self.scroll_to(0, 0, animate=False)
+        self._update()
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    @label.setter
+    def label(self, label: str):
+        self._label = label
+        self.refresh()
+
+    @property
+    def entry_count(self) -> int:
+        return len(self._kinds)
+
+    @property
+    def cursor_path(self) -> str:
+        return self.path_of(self.cursor)
+
+    def on_mount(self) -> None:
+        super().on_mount()
+        self.ownerApp = self.app
+        fileTrees.append(self)
+        self._load(0)
+        self._update()
+
+    def on_unmount(self) -> None:
+        if self in fileTrees:
+            fileTrees.remove(self)
+        for path in self._folders:
+            watcher.unwatch_directory(path, self._changed)
+        self._folders = {}
+        self._folderPaths = {}
+        self._generation += 1
+
+    # Entries
+
+    def _append(self, parent: int, names: List[str], kinds) -> int:
+        """Add entries for names below parent, returning the index of the first one."""
+        first = len(self._kinds)
+        count = len(names)
+        self._chunkFirsts.append(first)
+        self._chunks.append("\0" + "\0".join(names) + "\0")
+        # Every name starts one past the end of the previous one, after its separator.
+        starts = array("i", accumulate(map((1).__add__, map(len, names)), initial=1))
+        starts.pop()
+        self._starts.extend(starts)
+        self._parents.extend(array("i", [parent]) * count)
+        self._kinds.extend(kinds)
+        if parent >= 0:
+            self._children[parent].extend(array("i", range(first, first + count)))
+            self._chunksOf[parent].append(len(self._chunks) - 1)
+            longest = max(map(len, names), default=0)
+            self._width = max(self._width, len(GUIDE_SPACE) * self._depth(parent) + len(GUIDE_CROSS) + len(self.ICON_FOLDER) + longest + 1)
+        return first
+
+    def name_of(self, entry: int) -> str:
+        chunk = self._chunks[bisect_right(self._chunkFirsts, entry) - 1]
+        start = self._starts[entry]
+        return chunk[start:chunk.index("\0", start)]
+
+    def path_of(self, entry: int) -> str:
+        names = []
+        while entry > 0:
+            names.append(self.name_of(entry))
+            entry = self._parents[entry]
+        return os.path.join(self.rootPath, *reversed(names))
+
+    def _depth(self, entry: int) -> int:
+        depth = 0
+        while entry > 0:
+            entry = self._parents[entry]
+            depth += 1
+        return depth
+
+    def _find_child(self, folder: int, name: str) -> Optional[int]:
+        """The entry named name in folder, found in the names of its batches without looking at each entry."""
+        needle = "\0" + name + "\0"
+        for chunk in self._chunksOf.get(folder, ()):
+            blob = self._chunks[chunk]
+            first = self._chunkFirsts[chunk]
+            last = self._chunkFirsts[chunk + 1] if chunk + 1 < len(self._chunkFirsts) else len(self._kinds)
+            position = blob.find(needle)
+            while position != -1:
+                entry = bisect_left(self._starts, position + 1, first, last)
+                if self._kinds[entry] != REMOVED:
+                    return entry
+                position = blob.find(needle, position + 1)
+        return None
+
+    def _child_names(self, folder: int) -> List[str]:
+        return [self.name_of(entry) for entry in self._children.get(folder, ())]
+
+    def _is_visible(self, entry: int) -> bool:
+        entry = self._parents[entry] if entry > 0 else -1
+        while entry >= 0:
+            if entry not in self._expanded:
+                return False
+            entry = self._parents[entry] if entry > 0 else -1
+        return True
+
+    def _subtree_end(self, row: int) -> int:
+        """The row after the last visible descendant of the entry at row."""
+        entry = self._rows[row]
+        while entry in self._expanded and self._children.get(entry):
+            entry = self._children[entry][-1]
+            row = self._rows.index(entry, row)
+        return row + 1
+
+    def _flatten(self, folder: int) -> array:
+        """The rows the descendants of an expanded folder take."""
+        children = self._children.get(folder)
+        if not children:
+            return array("i")
+        expanded = [entry for entry in self._expanded if entry > 0 and self._parents[entry] == folder]
+        if not expanded:
+            return array("i", children)
+        rows = array("i")
+        position = 0
+        for index in sorted(children.index(entry) for entry in expanded):
+            rows.extend(children[position:index + 1])
+            rows.extend(self._flatten(children[index]))
+            position = index + 1
+        rows.extend(children[position:])
+        return rows
+
+    def _add_children(self, folder: int, names: List[str], kinds):
+        end = None
+        if folder in self._expanded and self._is_visible(folder):
+            end = self._subtree_end(self._rows.index(folder))
+        self._append(folder, names, kinds)
+        if end is not None:
+            self._rows[end:end] = self._children[folder][len(self._children[folder]) - len(names):]
+
+    def _remove(self, entry: int):
+        if self._is_visible(entry):
+            row = self._rows.index(entry)
+            del self._rows[row:self._subtree_end(row)]
+        self._children[self._parents[entry]].remove(entry)
+        self._forget(entry)
+        if not self._is_visible(self.cursor) or self._kinds[self.cursor] == REMOVED:
+            self.cursor = self._parents[entry]
+
+    def _forget(self, entry: int):
+        self._kinds[entry] = REMOVED
+        self._expanded.discard(entry)
+        self._loading.discard(entry)
+        self._watchedNames.pop(entry, None)
+        self._chunksOf.pop(entry, None)
+        path = self._folderPaths.pop(entry, None)
+        if path is not None:
+            self._folders.pop(path, None)
+            watcher.unwatch_directory(path, self._changed)
+        for child in self._children.pop(entry, ()):
+            if child in self._children:
+                self._forget(child)
+
+    # Expanding
+
+    def expand(self, entry: int):
+        if self._kinds[entry] != FOLDER or entry in self._expanded:
+            return
+        self._expanded.add(entry)
+        if entry not in self._children:
+            self._load(entry)
+        if self._is_visible(entry):
+            row = self._rows.index(entry)
+            self._rows[row + 1:row + 1] = self._flatten(entry)
+        self._update()
+
+    def collapse(self, entry: int):
+        if entry == 0 or entry not in self._expanded:
+            return
+        if self._is_visible(entry):
+            row = self._rows.index(entry)
+            del self._rows[row + 1:self._subtree_end(row)]
+        self._expanded.discard(entry)
+        if not self._is_visible(self.cursor):
+            self.cursor = entry
+        self._update()
+
+    def toggle(self, entry: int):
+        if entry in self._expanded:
+            self.collapse(entry)
+        else:
+            self.expand(entry)
+
+    def _load(self, folder: int):
+        path = self.path_of(folder)
+        self._children[folder] = array("i")
+        self._chunksOf[folder] = []
+        self._folders[path] = folder
+        self._folderPaths[folder] = path
+        self._loading.add(folder)
+        watcher.watch_directory(path, self._changed)
+        self.run_worker(
+            partial(self._scan, folder, path, self._generation, self.ownerApp or self.app),
+            name=f"FileTree {path}",
+            group=f"FileTree {id(self)} {folder}",
+            exclusive=True,
+            thread=True,
+        )
+
+    def _scan(self, folder: int, path: str, generation: int, app):
+        """Runs on a worker thread, handing the entries of the folder to the UI in batches."""
+        worker = get_current_worker()
+
+        def deliver(names, kinds, finished: bool) -> bool:
+            if worker.is_cancelled:
+                return False
+            try:
+                delivered = app.call_from_thread(self._receive, folder, generation, names, kinds, finished)
+            except RuntimeError:
+                # The app exited while the folder was scanned.
+                delivered = False
+            if not delivered:
+                worker.cancel()
+            return delivered
+
+        cached = directoryCache.get(path)
+        if cached is not None:
+            names, kinds = cached
+            deliver(names.split("\0") if kinds else [], kinds, True)
+            return
+
+        stamp = directoryCache.stamp(path)
+        names = []
+        kinds = bytearray()
+        sent = 0
+        deadline = time.monotonic() + FILE_TREE_BATCH_INTERVAL
+        try:
+            for name, is_dir in scan_directory(path):
+                names.append(name)
+                kinds.append(is_dir)
+                if len(names) - sent >= FILE_TREE_BATCH or time.monotonic() >= deadline:
+                    if not deliver(names[sent:], kinds[sent:], False):
+                        return
+                    sent = len(names)
+                    deadline = time.monotonic() + FILE_TREE_BATCH_INTERVAL
+        except PermissionError:
+            deliver(None, None, True)
+            return
+        except OSError as e:
+            print(f"Error scanning '{path}': {e}")
+            stamp = None
+        if deliver(names[sent:], kinds[sent:], True):
+            directoryCache.put(path, stamp, "\0".join(names), bytes(kinds))
+
+    def _receive(self, folder: int, generation: int, names, kinds, finished: bool) -> bool:
+        if generation != self._generation or not self.is_attached or folder not in self._children:
+            return False
+        if names is None:
+            self._add_children(folder, ["[Access Denied]"], bytes([DENIED]))
+        elif names:
+            watched = self._watchedNames.get(folder)
+            if watched:
+                # The watcher added some of these already.
+                kept = [index for index, name in enumerate(names) if name not in watched]
+                names = [names[index] for index in kept]
+                kinds = bytes(kinds[index] for index in kept)
+            self._add_children(folder, names, kinds)
+        if finished:
+            self._loading.discard(folder)
+            self._watchedNames.pop(folder, None)
+        self._update()
+        return True
+
+    # Changes on disk
+
+    def _changed(self, path: str, names):
+        """Called from the file watcher thread when entries of a loaded folder changed."""
+        app = self.ownerApp
+        if app is None:
+            return
+        try:
+            app.call_from_thread(self._apply, path, self._generation, names, self._collect(path, names))
+        except RuntimeError:
+            pass
+
+    @staticmethod
+    def _collect(path: str, names) -> Dict[str, bool]:
+        """Look up the changed names (or the whole folder when names is None) on disk."""
+        if names is None:
+            try:
+                return dict(scan_directory(path))
+            except OSError:
+                return {}
+        current = {}
+        for name in names:
+            entry = os.path.join(path, name)
+            if os.path.isdir(entry):
+                current[name] = True
+            elif os.path.isfile(entry):
+                current[name] = False
+        return current
+
+    def refresh_folder(self, path: str, names=None):
+        """Bring the entries (or all) of the folder at path up to date with the disk, if the tree loaded it."""
+        path = os.path.abspath(path)
+        if path in self._folders:
+            self._apply(path, self._generation, names, self._collect(path, names))
+
+    def _apply(self, path: str, generation: int, names, current: Dict[str, bool]):
+        folder = self._folders.get(path)
+        if generation != self._generation or folder is None:
+            return
+        if names is None:
+            names = set(current) | set(self._child_names(folder))
+        added, kinds = [], bytearray()
+        for name in names:
+            entry = self._find_child(folder, name)
+            is_dir = current.get(name)
+            if entry is not None and (is_dir is None or (self._kinds[entry] == FOLDER) != is_dir):
+                self._remove(entry)
+                entry = None
+            if entry is None and is_dir is not None:
+                added.append(name)
+                kinds.append(is_dir)
+        if folder in self._loading:
+            self._watchedNames.setdefault(folder, set()).update(added)
+        if added:
+            self._add_children(folder, added, kinds)
+        directoryCache.changed(path, {name: current.get(name) for name in names})
+        self._update()
+
+    # Rendering
+
+    def _update(self):
+        self.virtual_size = Size(self._width, len(self._rows))
+        self.refresh()
+
+    def notify_style_update(self) -> None:
+        super().notify_style_update()
+        self.refresh()
+
+    def _label_of(self, entry: int) -> str:
+        if entry == 0:
+            return self._label
+        kind = self._kinds[entry]
+        if kind == FOLDER:
+            return (self.ICON_FOLDER_EXPANDED if entry in self._expanded else self.ICON_FOLDER) + self.name_of(entry)
+        if kind == FILE:
+            return self.ICON_FILE + self.name_of(entry)
+        return self.name_of(entry)
+
+    def _guides_of(self, entry: int) -> str:
+        if entry == 0:
+            return ""
+        parent = self._parents[entry]
+        guides = [GUIDE_LAST if self._children[parent][-1] == entry else GUIDE_CROSS]
+        while parent > 0:
+            grandparent = self._parents[parent]
+            guides.append(GUIDE_SPACE if self._children[grandparent][-1] == parent else GUIDE_VERTICAL)
+            parent = grandparent
+        return "".join(reversed(guides))
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        style = self.rich_style
+        row = scroll_y + y
+        if row >= len(self._rows):
+            return Strip.blank(width, style)
+
+        entry = self._rows[row]
+        if row == self.hoverRow:
+            style += self.get_component_rich_style("file-tree--highlight-line")
+        label_style = Style()
+        if entry == self.cursor:
+            label_style = self.get_component_rich_style("file-tree--cursor", partial=False)
+        text = Text.assemble(
+            (self._guides_of(entry), self.get_component_rich_style("file-tree--guides", partial=True)),
+            (self._label_of(entry), label_style),
+            style=style,
+            end="",
+        )
+        strip = Strip(text.render(self.app.console), text.cell_len)
+        return strip.extend_cell_length(max(width, self.virtual_size.width) + scroll_x, style).crop(scroll_x, scroll_x + width)
+
+    # Input
+
+    def _cursor_row(self) -> int:
+        try:
+            return self._rows.index(self.cursor)
+        except ValueError:
+            return 0
+
+    def move_cursor(self, row: int):
+        row = max(0, min(row, len(self._rows) - 1))
+        self.cursor = self._rows[row]
+        top = self.scroll_offset.y
+        height = self.scrollable_content_region.height
+        if row < top:
+            self.scroll_to(y=row, animate=False)
+        elif row >= top + height:
+            self.scroll_to(y=row - height + 1, animate=False)
+        self.refresh()
+
+    def action_cursor_up(self):
+        self.move_cursor(self._cursor_row() - 1)
+
+    def action_cursor_down(self):
+        self.move_cursor(self._cursor_row() + 1)
+
+    def action_page_up(self):
+        self.move_cursor(self._cursor_row() - self.scrollable_content_region.height)
+
+    def action_page_down(self):
+        self.move_cursor(self._cursor_row() + self.scrollable_content_region.height)
+
+    def action_cursor_home(self):
+        self.move_cursor(0)
+
+    def action_cursor_end(self):
+        self.move_cursor(len(self._rows) - 1)
+
+    def action_cursor_parent(self):
+        if self.auto_expand and self.cursor in self._expanded and self.cursor != 0:
+            self.collapse(self.cursor)
+        elif self.cursor > 0:
+            self.cursor = self._parents[self.cursor]
+            self.move_cursor(self._cursor_row())
+
+    def action_cursor_expand(self):
+        if self.auto_expand:
+            self.expand(self.cursor)
+
+    def action_toggle_cursor(self):
+        if self.auto_expand:
+            self.toggle(self.cursor)
+
+    def action_select_cursor(self):
+        entry = self.cursor
+        kind = self._kinds[entry]
+        if kind not in (FILE, FOLDER):
+            return
+        if kind == FOLDER and entry != 0 and self.auto_expand:
+            self.toggle(entry)
+        self.post_message(self.Selected(self, self.path_of(entry), kind == FOLDER, entry == 0))
+
+    def _row_at(self, event: events.MouseEvent) -> int:
+        offset = event.get_content_offset(self)
+        if offset is None:
+            return -1
+        row = offset.y + self.scroll_offset.y
+        return row if row < len(self._rows) else -1
+
+    def on_click(self, event: events.Click) -> None:
+        row = self._row_at(event)
+        if row != -1:
+            self.move_cursor(row)
+            self.action_select_cursor()
+
+    def on_mouse_move(self, event: events.MouseMove) -> None:
+        row = self._row_at(event)
+        if row != self.hoverRow:
+            self.hoverRow = row
+            self.refresh()
+
+    def on_leave(self, event: events.Leave) -> None:
+        self.hoverRow = -1
+        self.refresh()
+
+
+# Mounted FileTrees, see refresh_tree.
+fileTrees: List[FileTree] = []
+
+
+def refresh_tree(path, names=None):
+    """Apply changes the editor itself made to the entries (or all) of the folder at path to every tree showing it."""
+    path = os.path.abspath(path)
+    for fileTree in list(fileTrees):
+        fileTree.refresh_folder(path, names)
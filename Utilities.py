@@ -1,8 +1,14 @@
-from textual.widgets import TextArea, Label
-from textual import events
+from textual.widgets import TextArea, Label, Log
+from textual.widgets.text_area import Edit, EditResult
+from textual import events, work
+from textual.message import Message
 from textual.reactive import reactive
-from textual.widgets.tree import TreeNode
-import os, re, json
+from textual.document._document_navigator import DocumentNavigator
+from textual.document._document import Document
+from textual.geometry import Size
+from DocumentUtilities import PieceTableDocument, MappedDocument, UnwrappedDocument, LineWrappedDocument, DocumentSnapshot, EditJournal, replay_journal
+from FileUtilities import atomic_write
+import threading
 
 default_css = """#welcome-message {
     margin: 1 0 1 2;
@@ -141,9 +147,62 @@ class ReactiveLabel(Label):
         """Define how the label is rendered."""
         return self.text
 
+# Lines the chat log keeps, older ones are dropped.
+CHAT_LOG_LINES = 10000
+
+class ChatLog(Log):
+    """Append-only log of the conversation with the assistant.
+
+    Appending only adds to the last line and the new ones, unlike replacing
+    the text of a TextArea with all of it. feed() can be called from any
+    thread, and the text fed until the UI gets to it is written at once.
+    """
+
+    def __init__(self, name=None, id=None, classes=None, disabled=False):
+        super().__init__(max_lines=CHAT_LOG_LINES, auto_scroll=True, name=name, id=id, classes=classes, disabled=disabled)
+        self._feedLock = threading.Lock()
+        self._fed = []
+
+    def feed(self, text: str):
+        """Append text from any thread."""
+        with self._feedLock:
+            self._fed.append(text)
+            if len(self._fed) > 1:
+                # Already scheduled.
+                return
+        self.call_later(self._write_fed)
+
+    def _write_fed(self):
+        with self._feedLock:
+            text = "".join(self._fed)
+            self._fed.clear()
+        self.write(text)
+
 class NVRTextArea(TextArea):
     """A subclass of TextArea with enhanced functionality."""
 
+    # Buffers at least this many characters long are kept in a PieceTableDocument (without syntax highlighting).
+    PIECE_TABLE_THRESHOLD = 4 * 1024 * 1024
+
+    # Edits, undo and redo each start a new generation, a buffer is modified when it isn't at the saved one.
+    _generation: int = 0
+    _savedGeneration: int = 0
+    _pendingLocation = None
+    journal: EditJournal = None
+
+    class DocumentIndexed(Message, namespace="nvr_text_area"):
+        """Posted when the background indexer of a MappedDocument found more lines."""
+
+        def __init__(self, text_area: "NVRTextArea", line_count: int, finished: bool):
+            self.text_area = text_area
+            self.line_count = line_count
+            self.finished = finished
+            super().__init__()
+
+        @property
+        def control(self) -> "NVRTextArea":
+            return self.text_area
+
     def __init__(
         self, 
         text="", 
@@ -179,6 +238,180 @@ class NVRTextArea(TextArea):
             tooltip=tooltip
         )
 
+    def _set_document(self, text: str, language: str | None) -> None:
+        previous = self.document
+        if len(text) < self.PIECE_TABLE_THRESHOLD:
+            super()._set_document(text, language)
+            # TextArea wraps it with a WrappedDocument, whose edits take time in proportion to the document.
+            self.wrapped_document = LineWrappedDocument(self.document, tab_width=self.indent_width)
+            self.navigator = DocumentNavigator(self.wrapped_document)
+            self._rewrap_and_refresh_virtual_size()
+            self._savedGeneration = self._generation
+            self._journal_document()
+        else:
+            self._use_document(PieceTableDocument(text), LineWrappedDocument)
+
+        if self.journal:
+            self.journal.record_load(previous, self.document)
+        if isinstance(previous, MappedDocument):
+            previous.close()
+
+    def _use_document(self, document, wrapped_document_class):
+        """Install a document that isn't syntax aware, wrapped by the given class."""
+        self._highlight_query = None
+        self.document = document
+        self.wrapped_document = wrapped_document_class(document, tab_width=self.indent_width)
+        self.navigator = DocumentNavigator(self.wrapped_document)
+        self._build_highlight_map()
+        self.move_cursor((0, 0))
+        self._rewrap_and_refresh_virtual_size()
+        self._journal_document()
+
+    def _refresh_size(self) -> None:
+        if self.soft_wrap or not isinstance(self.wrapped_document, LineWrappedDocument):
+            super()._refresh_size()
+            return
+        # The wrapped document keeps the width of every line, so the widest isn't measured again after each edit.
+        width, height = self.wrapped_document.get_size()
+        self.virtual_size = Size(width + self.gutter_width + 1, height)
+
+    def attach_journal(self, journal: EditJournal):
+        """Record every following change of the buffer into journal."""
+        self.detach_journal()
+        self.journal = journal
+        self._journal_document()
+
+    def detach_journal(self):
+        if self.journal and "replace_range" in vars(self.document):
+            del self.document.replace_range
+        self.journal = None
+
+    def _journal_document(self):
+        # Edits, undo and redo all end up in document.replace_range, so that is where they are recorded.
+        if self.journal is None:
+            return
+        document = self.document
+        journal = self.journal
+        replace_range = type(document).replace_range
+
+        def journaled_replace_range(start, end, text):
+            result = replace_range(document, start, end, text)
+            journal.record(start, end, text)
+            return result
+
+        document.replace_range = journaled_replace_range
+
+    def replay(self, records: list):
+        """Apply the records of an EditJournal to the buffer. A MappedDocument has to be fully indexed first."""
+        if isinstance(self.document, PieceTableDocument):
+            document = replay_journal(self.document, records)
+        else:
+            document = replay_journal(Document(self.text), records)
+
+        if document is self.document:
+            self.history.clear()
+            self._rewrap_and_refresh_virtual_size()
+            self.refresh()
+            self.post_message(self.Changed(self))
+        else:
+            # The buffer still has to differ from the file the records were replayed over.
+            modified = document.text != self.text
+            self.load_text(document.text)
+            if modified:
+                self._generation += 1
+
+    def load_document(self, document: MappedDocument, location=None):
+        """Show a memory-mapped document and index the rest of it on a worker thread.
+
+        Lines are never wrapped for such documents, and the cursor is moved to
+        location as soon as the indexer reached it.
+        """
+        if isinstance(self.document, MappedDocument) and self.document is not document:
+            self.document.close()
+        self.history.clear()
+        self._use_document(document, UnwrappedDocument)
+        self._pendingLocation = location
+        self._document_grew(document)
+        if not document.is_indexed:
+            # Let the first screen paint before the indexer starts competing for the GIL.
+            self.call_after_refresh(self._index_document, document)
+
+    @work(thread=True, exclusive=True, group="index")
+    def _index_document(self, document: MappedDocument):
+        document.build_index(lambda: self.app.call_from_thread(self._document_grew, document))
+
+    def _document_grew(self, document: MappedDocument):
+        if document is not self.document:
+            return
+        line_count = document.extend_original()
+        self._refresh_size()
+        self.refresh()
+        if self._pendingLocation and self._pendingLocation[0] < line_count:
+            self.move_cursor(self._pendingLocation, center=True)
+            self._pendingLocation = None
+        self.post_message(self.DocumentIndexed(self, line_count, document.is_indexed))
+
+    def save(self, path: str):
+        """Atomically write the buffer to path and mark it as saved."""
+        snapshot = self.snapshot()
+        if isinstance(self.document, MappedDocument):
+            # The file backs the document, so it can only be swapped out once the mapping is released.
+            location = self.cursor_location
+            atomic_write(path, snapshot.write, before_replace=self.document.close)
+            self.load_document(MappedDocument(path), location)
+        else:
+            atomic_write(path, snapshot.write)
+            self.mark_saved(snapshot)
+
+    def edit(self, edit: Edit) -> EditResult:
+        self._generation += 1
+        return super().edit(edit)
+
+    def undo(self) -> None:
+        self._generation += 1
+        super().undo()
+
+    def redo(self) -> None:
+        self._generation += 1
+        super().redo()
+
+    @property
+    def is_modified(self) -> bool:
+        """Whether the buffer was edited since it was loaded or last saved."""
+        if isinstance(self.document, PieceTableDocument):
+            return self.document.is_modified
+        return self._generation != self._savedGeneration
+
+    def snapshot(self) -> DocumentSnapshot:
+        """Capture the buffer so it can be written later, or from another thread."""
+        if isinstance(self.document, PieceTableDocument):
+            return DocumentSnapshot(self.document, self.document.snapshot())
+        return DocumentSnapshot(self.document, self.document.text, self._generation)
+
+    def mark_saved(self, snapshot: DocumentSnapshot = None):
+        """Remember the current buffer (or a snapshot of it) as the saved state."""
+        if snapshot is None:
+            snapshot = self.snapshot()
+        if snapshot.document is not self.document:
+            return
+        if isinstance(self.document, PieceTableDocument):
+            self.document.mark_saved(snapshot.state)
+        else:
+            self._savedGeneration = snapshot.generation
+
+    def write(self, file):
+        """Write the buffer into a binary file object as UTF-8."""
+        self.snapshot().write(file)
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines in the document, without joining the buffer."""
+        return self.document.line_count
+
+    def line_at(self, index: int) -> str:
+        """Return a single line of the document in O(1), without newline characters."""
+        return self.document.get_line(index)
+
     def _on_key(self, event: events.Key) -> None:
         if event.character == "(":
             self.insert("()")
@@ -208,9 +441,8 @@ class NVRTextArea(TextArea):
         elif event.key == "enter":
             # Determine the current line's indentation
             cursor_line = self.cursor_location[0]
-            lines = self.text.splitlines()
-            if 0 <= cursor_line < len(lines):
-                current_line = lines[cursor_line]
+            if 0 <= cursor_line < self.line_count:
+                current_line = self.line_at(cursor_line)
                 leading_whitespace = len(current_line) - len(current_line.lstrip())
                 indentation = current_line[:leading_whitespace]
 
@@ -236,83 +468,11 @@ class NVRTextArea(TextArea):
         elif event.key == "backspace":
             current_position = self.cursor_location[1] - 1
 
-            if 0 <= self.cursor_location[0] < len(self.text.splitlines()):
-                text = self.text.splitlines()[self.cursor_location[0]]
+            if 0 <= self.cursor_location[0] < self.line_count:
+                text = self.line_at(self.cursor_location[0])
                 
                 if current_position >= 0:
                     if text[:current_position + 1].strip() == "" and text[:current_position + 1].endswith("    "):
                         for _ in range(4):
                             self.action_delete_left()
                         event.prevent_default()
-
-class WorkspaceClass:
-    def __init__(self, path):
-        self.config_path = path
-
-        if not os.path.exists(self.config_path):
-            with open(self.config_path, "w") as f:
-                f.write(json.dumps({'updatedFiles': []}))
-                f.close()
-
-        self.config = {}
-
-        self.load()
-
-
-    def load(self):
-        """Discover and load plugins from the plugins directory."""
-        if not os.path.exists(self.config_path):
-            open(self.config_path, "w").write(json.dumps({})).close()
-        else:
-            with open(self.config_path, "r") as config_file:
-                self.config = json.load(config_file)
-
-    def save(self):
-        with open(self.config_path, "+w") as config_file:
-            json.dump(self.config, config_file, indent=4)
-
-    def get(self, key, default=None):
-        self.load()
-        return self.config.get(key, default)
-    
-    def set(self, key, value):
-        self.config[key] = value
-        self.save()
-
-def populate_tree(node: TreeNode, path):
-        """Recursively populate the self.tree with files and folders."""
-        try:
-            for entry in os.scandir(path):
-                if entry.is_dir():
-                    # Add a folder and expand it lazily
-                    folder_node = node.add(entry.name, expand=False)
-                    # Attach the path as data for future expansion
-                    folder_node.data = entry.path
-                elif entry.is_file():
-                    # Add a file leaf node
-                    file_node = node.add_leaf("📄 " + entry.name)
-                    file_node.data = entry.path
-        except PermissionError:
-            # Handle directories we can't access
-            node.add_leaf("[Access Denied]")
-
-def remove_code_snippets(markdown_text):
-    """
-    Removes code snippets from a Markdown string and leaves only the text.
-
-    Parameters:
-        markdown_text (str): The Markdown content.
-
-    Returns:
-        str: The Markdown content with code snippets removed.
-    """
-    # Regex pattern for fenced code blocks
-    code_block_pattern = r"```.*?\n(.*?)```"
-    
-    # Remove code snippets
-    text_without_code = re.sub(code_block_pattern, '', markdown_text, flags=re.DOTALL)
-    
-    # Remove extra blank lines left behind by the removal
-    cleaned_text = re.sub(r'\n\s*\n', '\n\n', text_without_code).strip()
-
-    return cleaned_text
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Seconds the changes to a workspace are kept in an open transaction for more changes before they are committed.
+WORKSPACE_COMMIT_DELAY = 0.5
+
+# Recently opened files recent_files returns by default.
+RECENT_FILES = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    opened REAL,
+    modified INTEGER NOT NULL DEFAULT 0,
+    cursor_row INTEGER,
+    cursor_column INTEGER,
+    scroll_x INTEGER,
+    scroll_y INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_opened ON files (opened) WHERE opened IS NOT NULL;
+CREATE INDEX IF NOT EXISTS files_modified ON files (path) WHERE modified;
+"""
+
+
+class Workspace:
+    """The state the editor keeps for a project, in an SQLite database.
+
+    Every file the editor touched has a row keyed by its absolute path, so
+    looking one up is a B-tree search however many files a session touched.
+    A row holds when the file was last opened (recent_files), whether it is
+    in the modified set shown as the workspace files, and where its cursor
+    and scroll offset were when it was left.
+
+    Changes go into one open transaction that is committed
+    WORKSPACE_COMMIT_DELAY seconds after the first of them, or at exit. The
+    connection is shared by the threads under a lock, so reads see the
+    changes that aren't committed yet. Use workspace() to share one per
+    project.
+    """
+
+    def __init__(self, root: str, path: str):
+        self.root = os.path.abspath(root)
+        self.path = path
+        self._lock = threading.RLock()
+        self._timer: threading.Timer = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def _write(self, sql: str, parameters=()) -> int:
+        """Run sql in the open transaction and have it committed soon, return the rows it changed."""
+        with self._lock:
+            if self._connection is None:
+                return 0
+            changed = self._connection.execute(sql, parameters).rowcount
+            if self._timer is None:
+                self._timer = threading.Timer(WORKSPACE_COMMIT_DELAY, self.commit)
+                self._timer.daemon = True
+                self._timer.start()
+            return changed
+
+    def _read(self, sql: str, parameters=()) -> list:
+        with self._lock:
+            if self._connection is None:
+                return []
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def commit(self):
+        """Commit the changes made so far now."""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self._connection is None:
+                return
+            try:
+                self._connection.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing the workspace '{self.path}': {e}")
+
+    def close(self):
+        self.commit()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def opened(self, path: str):
+        """Record that path was opened just now."""
+        self._write(
+            "INSERT INTO files (path, opened) VALUES (?, ?) ON CONFLICT (path) DO UPDATE SET opened = excluded.opened",
+            (os.path.abspath(path), time.time()),
+        )
+
+    def recent_files(self, limit: int = RECENT_FILES) -> List[str]:
+        """The files opened last, the latest first."""
+        rows = self._read("SELECT path FROM files WHERE opened IS NOT NULL ORDER BY opened DESC LIMIT ?", (limit,))
+        return [path for path, in rows]
+
+    def set_location(self, path: str, cursor: Tuple[int, int], scroll: Tuple[int, int]):
+        """Remember the (row, column) of the cursor and the (x, y) scroll offset of path."""
+        self._write(
+            "INSERT INTO files (path, cursor_row, cursor_column, scroll_x, scroll_y) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET cursor_row = excluded.cursor_row, cursor_column = excluded.cursor_column, "
+            "scroll_x = excluded.scroll_x, scroll_y = excluded.scroll_y",
+            (os.path.abspath(path), *cursor, *scroll),
+        )
+
+    def location(self, path: str) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """The cursor and scroll offset remembered for path, or None."""
+        rows = self._read("SELECT cursor_row, cursor_column, scroll_x, scroll_y FROM files WHERE path = ?", (os.path.abspath(path),))
+        if not rows or rows[0][0] is None:
+            return None
+        row, column, x, y = rows[0]
+        return (row, column), (x or 0, y or 0)
+
+    def mark_modified(self, path: str) -> bool:
+        """Add path to the modified set, return whether it wasn't in it yet."""
+        return self._write(
+            "INSERT INTO files (path, modified) VALUES (?, 1) ON CONFLICT (path) DO UPDATE SET modified = 1 WHERE NOT modified",
+            (os.path.abspath(path),),
+        ) > 0
+
+    def unmark_modified(self, path: str) -> bool:
+        """Remove path from the modified set, return whether it was in it."""
+        return self._write("UPDATE files SET modified = 0 WHERE path = ? AND modified", (os.path.abspath(path),)) > 0
+
+    def is_modified(self, path: str) -> bool:
+        return bool(self._read("SELECT 1 FROM files WHERE path = ? AND modified", (os.path.abspath(path),)))
+
+    def modified_files(self) -> List[str]:
+        """The modified set, by path."""
+        return [path for path, in self._read("SELECT path FROM files WHERE modified ORDER BY path")]
+
+    def import_json(self, path: str):
+        """Take over the modified files of a .workspace.json the editor used to write into the current folder."""
+        try:
+            with open(path, "r") as file:
+                files = json.load(file).get("updatedFiles", [])
+        except (OSError, ValueError, AttributeError):
+            return
+        with self._lock:
+            for file in files:
+                if isinstance(file, str):
+                    self.mark_modified(os.path.join(self.root, file.strip()))
+
+
+# The Workspace of each project, see workspace.
+workspaces: Dict[str, Workspace] = {}
+
+
+def workspace(root: str, directory: str) -> Workspace:
+    """Return the Workspace shared for the project at root, kept in a database under directory."""
+    root = os.path.abspath(root)
+    if root not in workspaces:
+        path = os.path.join(directory, hashlib.sha1(root.encode("utf-8")).hexdigest() + ".sqlite3")
+        new = not os.path.exists(path)
+        workspaces[root] = Workspace(root, path)
+        if new:
+            workspaces[root].import_json(os.path.join(root, ".workspace.json"))
+    return workspaces[root]
+
+
+@atexit.register
+def close_workspaces():
+    for store in list(workspaces.values()):
+        store.close()
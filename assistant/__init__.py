@@ -1,69 +1,121 @@
-from ollama import chat
-from ollama import ChatResponse
-import re, time
+import time, asyncio
+from typing import Callable
 import intellimerge
+from assistant.context import ConversationContext, CONTEXT_TOKENS
+from assistant.fences import FenceParser
+from assistant.cache import ResponseCache, CachedMessage, CachedResponse, cache_key, CACHE_BYTES
+from assistant.client import OllamaClient
 
 # RUN IN TERMINAL: ollama run granite3.1-dense
 
 class ArtificialIntelligence():
-    history = []
-
-    def __init__(self, model = "granite3.1-dense", promptPath = None):
+    def __init__(self, model = "granite3.1-dense", promptPath = None, contextTokens: int = CONTEXT_TOKENS, cachePath: str = None, cacheBytes: int = CACHE_BYTES):
         if not promptPath:
             raise Exception("No prompt path provided!")
 
         self.prompt = open(promptPath, "r").read()
         self.promptPath = promptPath
         self.model = model
-
-        self.history = [
-            {
-                'role': 'system',
-                'content': self.prompt
-            }
-        ]
-
-    def generate(self, code:str, userPrompt:str):
-        self.history.append({
-                'role': 'user',
-                'content': code
-            })
-
-        self.history.append({
-                'role': 'user',
-                'content': userPrompt,
-            })
-
-        response: ChatResponse = chat(model=self.model, messages=self.history)
-
-        self.history.append({
-            'role': 'assistant',
-            'content': response.message.content
-        })
-
-        snippets = self._extractCode(response.message.content)
-
+        self.contextTokens = contextTokens
+        # Replies by model, system prompt, code and instruction, None when no cachePath was given.
+        self.cache = ResponseCache(cachePath, cacheBytes) if cachePath else None
+        self.client = OllamaClient()
+
+        # The conversation of generate calls that don't bring their own.
+        self.context = self.conversation()
+
+    def conversation(self) -> ConversationContext:
+        """Start a new conversation, every editor has its own."""
+        return ConversationContext(self.prompt, self.contextTokens)
+
+    async def generate(self, code:str, userPrompt:str, context: ConversationContext = None, on_text: Callable[[str], None] = None, on_snippet: Callable[[dict], None] = None, cache: bool = True, focus: int = 0):
+        """Ask the model for changes to code, streaming the reply to on_text(text) piece by piece as it arrives.
+
+        Every snippet of the reply is merged into the code as soon as its
+        closing fence arrives, while the model writes the rest, and handed to
+        on_snippet(snippet). A snippet that isn't valid Python or can't be
+        merged is left out, with the reason as its "error".
+
+        The same instruction about the same code is answered from the
+        ResponseCache, unless cache is False; the fresh reply is cached then.
+
+        Code too long for the context is sent as the lines around line focus,
+        snippets are still merged into all of it.
+
+        The request waits for its turn in the queue of self.client, which
+        raises QueueFull when too many are waiting. Cancelling the task
+        awaiting generate closes the stream, so Ollama stops generating.
+
+        Returns the code with the snippets merged into it, the last response
+        (holding the whole reply as its content) and the merged snippets.
+        """
+        context = context or self.context
+        messages, metrics = context.messages(code, userPrompt, focus)
+
+        start = time.perf_counter()
+        key = cache_key(self.model, self.prompt, code, userPrompt) if self.cache else None
+        cached = await asyncio.to_thread(self.cache.get, key) if key and cache else None
+        response = None
+
+        async def pieces():
+            nonlocal response
+            if cached is not None:
+                response = CachedResponse(self.model, CachedMessage("assistant", cached))
+                yield cached
+                return
+            responses = self.client.stream(self.model, messages)
+            try:
+                async for response in responses:
+                    yield response.message.content
+            finally:
+                await responses.aclose()
+
+        firstToken = None
+        parts = []
+        parser = FenceParser()
         mergedOutput: str = code
-
-
-        for snippet in snippets:
-            mergedOutput = intellimerge.merge(mergedOutput, snippet["code"])
+        snippets = []
+        texts = pieces()
+        try:
+            async for text in texts:
+                if not text:
+                    continue
+                if firstToken is None:
+                    firstToken = time.perf_counter() - start
+                parts.append(text)
+                if on_text:
+                    on_text(text)
+                for snippet in parser.feed(text):
+                    try:
+                        # Off the event loop, merging into a long file takes a while.
+                        mergedOutput = await asyncio.to_thread(intellimerge.merge, mergedOutput, snippet["code"])
+                        snippets.append(snippet)
+                    except Exception as e:
+                        snippet["error"] = f"{e.__class__.__name__}: {e}"
+                    if on_snippet:
+                        on_snippet(snippet)
+        finally:
+            await texts.aclose()
+        if response is None:
+            raise Exception("The model didn't respond!")
+        parser.close()
+        if cached is None:
+            response.message.content = "".join(parts)
+            if key and response.message.content.strip():
+                await asyncio.to_thread(self.cache.put, key, response.message.content)
+
+        metrics = metrics._replace(
+            evaluated_tokens=getattr(response, "prompt_eval_count", None),
+            first_token=firstToken,
+            duration=time.perf_counter() - start,
+            cached=cached is not None,
+        )
+        context.record(userPrompt, response.message.content, metrics)
 
         return mergedOutput, response, snippets
 
     def _extractCode(self, text:str) -> list:
-        # Regex pattern for fenced code blocks
-        code_block_pattern = r"```(\w+)?\n(.*?)```"
-
-        # Find all code blocks
-        matches = re.findall(code_block_pattern, text, re.DOTALL)
-
-        # Add snippets to the list
-        snippet_list = []
-        for language, code in matches:
-            snippet_list.append({
-                "language": language.strip() if language else None,
-                "code": code.strip()
-            })
-
-        return snippet_list
\ No newline at end of file
+        parser = FenceParser()
+        snippets = parser.feed(text)
+        parser.close()
+        return snippets
@@ -0,0 +1,114 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import NamedTuple, Optional
+
+# Bytes of replies the cache keeps, the ones used longest ago are dropped first.
+CACHE_BYTES = 16 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    key TEXT PRIMARY KEY,
+    reply TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS replies_used ON replies (used);
+"""
+
+
+class CachedMessage(NamedTuple):
+    role: str
+    content: str
+
+
+class CachedResponse(NamedTuple):
+    """Stands in for the ChatResponse of a reply that came from the cache, without importing the client."""
+    model: str
+    message: CachedMessage
+    prompt_eval_count: Optional[int] = None
+
+
+def cache_key(model: str, prompt: str, code: str, instruction: str) -> str:
+    """The key of the reply of model to instruction about code, with the system prompt prompt."""
+    digest = hashlib.sha256()
+    for part in (model or "", hashlib.sha256(prompt.encode("utf-8")).hexdigest(), hashlib.sha256(code.encode("utf-8")).hexdigest(), instruction):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Replies of the model on disk, in an SQLite database.
+
+    A reply is kept by cache_key, so asking the same model the same thing
+    about the same code with the same system prompt is answered from the
+    cache. Once the replies take more than limit bytes, the ones used
+    longest ago are dropped. Errors of the database are printed and treated
+    as a miss, the cache never fails a request.
+    """
+
+    def __init__(self, path: str, limit: int = CACHE_BYTES):
+        self.path = path
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            print(f"Error opening the response cache '{path}': {e}")
+            self._connection = None
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = None
+            if self._connection is not None:
+                try:
+                    row = self._connection.execute("SELECT reply FROM replies WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        self._connection.execute("UPDATE replies SET used = ? WHERE key = ?", (time.time(), key))
+                        self._connection.commit()
+                except sqlite3.Error as e:
+                    print(f"Error reading the response cache '{self.path}': {e}")
+                    row = None
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, reply: str):
+        size = len(reply.encode("utf-8"))
+        if size > self.limit:
+            return
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO replies (key, reply, size, used) VALUES (?, ?, ?, ?)",
+                    (key, reply, size, time.time()),
+                )
+                total = self._connection.execute("SELECT SUM(size) FROM replies").fetchone()[0] or 0
+                if total > self.limit:
+                    for evictKey, evictSize in self._connection.execute("SELECT key, size FROM replies ORDER BY used").fetchall():
+                        if total <= self.limit:
+                            break
+                        self._connection.execute("DELETE FROM replies WHERE key = ?", (evictKey,))
+                        total -= evictSize
+                self._connection.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing the response cache '{self.path}': {e}")
+
+    def clear(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM replies")
+                self._connection.commit()
@@ -0,0 +1,74 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+# Requests streamed from Ollama at once, Ollama works on one at a time by default.
+ACTIVE_REQUESTS = 1
+# Requests that may wait for their turn, more are turned down with QueueFull.
+QUEUED_REQUESTS = 4
+# Seconds an idle connection is kept open for the next request.
+KEEPALIVE_SECONDS = 300
+
+
+class QueueFull(Exception):
+    """QUEUED_REQUESTS requests are waiting for the model already."""
+
+
+class OllamaClient:
+    """Streams chat replies from Ollama over a pool of persistent connections.
+
+    One ollama.AsyncClient, and with it one httpx connection pool, serves
+    every request, so the connection to Ollama is opened once and kept open
+    between requests. At most active requests are streamed at once; others
+    wait for their turn in the order they came, up to queued of them.
+
+    stream() is an async generator. Cancelling the task consuming it, or
+    closing it, closes the connection of the request, which makes Ollama
+    stop generating. Like every asyncio object, it has to be used from one
+    event loop, the one of the app.
+    """
+
+    def __init__(self, host: Optional[str] = None, active: int = ACTIVE_REQUESTS, queued: int = QUEUED_REQUESTS):
+        self.host = host
+        self.active = active
+        self.queued = queued
+        self.waiting = 0
+        self._client = None
+        self._slots: asyncio.Semaphore = None
+
+    def _async_client(self):
+        if self._client is None:
+            # Imported on the first request, importing the client takes longer than starting the editor.
+            import httpx
+            from ollama import AsyncClient
+            self._client = AsyncClient(
+                host=self.host,
+                limits=httpx.Limits(max_connections=self.active, max_keepalive_connections=self.active, keepalive_expiry=KEEPALIVE_SECONDS),
+            )
+        return self._client
+
+    async def stream(self, model: str, messages: list) -> AsyncIterator:
+        """Yield the ChatResponse pieces of the reply of model to messages, once it is the turn of this request."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.active)
+        if self._slots.locked() and self.waiting >= self.queued:
+            raise QueueFull(f"{self.waiting} requests are waiting for the model already!")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            responses = await self._async_client().chat(model=model, messages=messages, stream=True)
+            try:
+                async for response in responses:
+                    yield response
+            finally:
+                # Closes the connection if the reply isn't complete, Ollama stops generating it then.
+                await responses.aclose()
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
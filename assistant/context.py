@@ -0,0 +1,149 @@
+import re
+from collections import deque
+from typing import List, NamedTuple, Optional
+
+# Tokens the messages of a request may take, estimated with CHARS_PER_TOKEN.
+CONTEXT_TOKENS = 8192
+CHARS_PER_TOKEN = 4
+
+# PromptMetrics a ConversationContext keeps.
+METRICS_KEPT = 50
+
+CODE_BLOCK = re.compile(r"```.*?\n.*?```", re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def code_window(code: str, tokens: int, focus: int = 0) -> tuple:
+    """Return the lines of code around line focus that fit into tokens estimated tokens, and how many were left out.
+
+    A comment takes the place of the lines left out above and below. Returns
+    (None, number of lines) when not even line focus fits.
+    """
+    if not code or estimate_tokens(code) <= tokens:
+        return code, 0
+    lines = code.splitlines(keepends=True)
+    focus = min(max(focus, 0), len(lines) - 1)
+    # Room for the two comments, which can't be longer than this.
+    room = tokens * CHARS_PER_TOKEN - 2 * len(f"# ... {len(lines)} lines below left out\n")
+    used = len(lines[focus])
+    if used > room:
+        return None, len(lines)
+    first, last = focus, focus + 1
+    grew = True
+    while grew:
+        grew = False
+        if first > 0 and used + len(lines[first - 1]) <= room:
+            first -= 1
+            used += len(lines[first])
+            grew = True
+        if last < len(lines) and used + len(lines[last]) <= room:
+            used += len(lines[last])
+            last += 1
+            grew = True
+    window = "".join(lines[first:last])
+    if first:
+        window = f"# ... {first} lines above left out\n" + window
+    if last < len(lines):
+        window += f"# ... {len(lines) - last} lines below left out\n"
+    return window, first + len(lines) - last
+
+
+class PromptMetrics(NamedTuple):
+    """The size of the messages of one request, in estimated tokens."""
+    messages: int
+    turns: int
+    evicted: int
+    system_tokens: int
+    history_tokens: int
+    code_tokens: int
+    prompt_tokens: int
+    budget: int
+    # Reported by Ollama once the response arrived, None before.
+    evaluated_tokens: Optional[int] = None
+    # Seconds from sending the request until the first text of the reply arrived, and until all of it did.
+    first_token: Optional[float] = None
+    duration: Optional[float] = None
+    # Whether the reply came from the ResponseCache.
+    cached: bool = False
+    # Lines of the code that didn't fit into the budget and were left out.
+    omitted_lines: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.system_tokens + self.history_tokens + self.code_tokens + self.prompt_tokens
+
+    def __str__(self):
+        evaluated = f", {self.evaluated_tokens} evaluated" if self.evaluated_tokens is not None else ""
+        evicted = f" ({self.evicted} dropped)" if self.evicted else ""
+        timing = f", first token after {self.first_token:.1f} s" if self.first_token is not None else ""
+        timing += f", done after {self.duration:.1f} s" if self.duration is not None else ""
+        timing += " (cached)" if self.cached else ""
+        omitted = f" ({self.omitted_lines} lines left out)" if self.omitted_lines else ""
+        return f"~{self.total_tokens} of {self.budget} tokens, code {self.code_tokens}{omitted}, {self.turns} turns{evicted}{evaluated}{timing}"
+
+
+class ConversationContext:
+    """The messages sent to the model for a conversation about one file.
+
+    Only the latest snapshot of the code is sent, as the last message before
+    the prompt, instead of a copy of the file for every turn. The earlier
+    turns keep the prompt and the reply, with the code blocks of all but the
+    latest reply left out as they were merged into the code or turned down.
+    The oldest turns are dropped until the messages fit into budget
+    estimated tokens; the system prompt, the code and the prompt are always
+    sent. Code that doesn't fit next to the system prompt and the prompt by
+    itself is cut down to the lines around the focus line (the cursor). The
+    PromptMetrics of the latest METRICS_KEPT requests are kept in metrics.
+    """
+
+    def __init__(self, system: str, budget: int = CONTEXT_TOKENS):
+        self.system = system
+        self.budget = budget
+        # (prompt, reply) of the earlier turns, oldest first.
+        self.turns: List[tuple] = []
+        self.metrics = deque(maxlen=METRICS_KEPT)
+
+    def messages(self, code: str, prompt: str, focus: int = 0) -> tuple:
+        """Return the messages of a request for prompt about code and their PromptMetrics, dropping turns that don't fit.
+
+        Raises ValueError when not even line focus of the code fits.
+        """
+        system_tokens = estimate_tokens(self.system)
+        prompt_tokens = estimate_tokens(prompt)
+        code, omitted_lines = code_window(code, self.budget - system_tokens - prompt_tokens, focus)
+        if code is None:
+            raise ValueError(f"Line {focus + 1} of the code doesn't fit into the context of {self.budget} tokens next to the system prompt and the prompt.")
+        code_tokens = estimate_tokens(code)
+        room = self.budget - system_tokens - code_tokens - prompt_tokens
+
+        sizes = [estimate_tokens(turnPrompt) + estimate_tokens(reply) for turnPrompt, reply in self.turns]
+        history_tokens = sum(sizes)
+        evicted = 0
+        while evicted < len(sizes) and history_tokens > room:
+            history_tokens -= sizes[evicted]
+            evicted += 1
+        del self.turns[:evicted]
+
+        messages = [{'role': 'system', 'content': self.system}]
+        for turnPrompt, reply in self.turns:
+            messages.append({'role': 'user', 'content': turnPrompt})
+            messages.append({'role': 'assistant', 'content': reply})
+        messages.append({'role': 'user', 'content': code})
+        messages.append({'role': 'user', 'content': prompt})
+
+        metrics = PromptMetrics(len(messages), len(self.turns), evicted, system_tokens, history_tokens, code_tokens, prompt_tokens, self.budget, omitted_lines=omitted_lines)
+        return messages, metrics
+
+    def record(self, prompt: str, reply: str, metrics: PromptMetrics):
+        """Add the turn of a request that got a reply."""
+        if self.turns:
+            previousPrompt, previousReply = self.turns[-1]
+            self.turns[-1] = (previousPrompt, CODE_BLOCK.sub("[code omitted]", previousReply))
+        self.turns.append((prompt, reply))
+        self.metrics.append(metrics)
+
+    def clear(self):
+        self.turns.clear()
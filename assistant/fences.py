@@ -0,0 +1,76 @@
+import re
+from typing import List
+
+FENCE = "```"
+OPENING_FENCE = re.compile(r"```(\w*)\n")
+# A fence whose language could still be followed by more of it.
+PARTIAL_OPENING_FENCE = re.compile(r"```\w*\Z")
+
+
+class FenceParser:
+    """Finds the fenced code blocks of a markdown reply while it streams in.
+
+    feed() takes the reply piece by piece and returns the snippets whose
+    closing fence arrived with that piece, as {"language", "code"} dicts.
+    Blocks are found the way _extractCode's regex finds them in the whole
+    reply: an opening fence with an optional word as the language and a
+    newline, up to the next fence. The text outside of the blocks collects
+    in prose.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._language = None
+        self._inside = False
+        # Where to look for the closing fence, the code before it was searched already.
+        self._searched = 0
+        self._prose: List[str] = []
+        self.snippets: List[dict] = []
+
+    @property
+    def prose(self) -> str:
+        return "".join(self._prose)
+
+    def feed(self, text: str) -> List[dict]:
+        self._buffer += text
+        found = []
+        while True:
+            if self._inside:
+                end = self._buffer.find(FENCE, self._searched)
+                if end < 0:
+                    self._searched = max(0, len(self._buffer) - len(FENCE) + 1)
+                    break
+                snippet = {"language": self._language, "code": self._buffer[:end].strip()}
+                self._buffer = self._buffer[end + len(FENCE):]
+                self._inside = False
+                self.snippets.append(snippet)
+                found.append(snippet)
+            else:
+                start = self._buffer.find(FENCE)
+                if start < 0:
+                    # Keep what could be the start of a fence.
+                    keep = len(self._buffer) - len(self._buffer.rstrip("`"))
+                    self._prose.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._prose.append(self._buffer[:start])
+                self._buffer = self._buffer[start:]
+                match = OPENING_FENCE.match(self._buffer)
+                if match:
+                    self._language = match.group(1) or None
+                    self._buffer = self._buffer[match.end():]
+                    self._inside = True
+                    self._searched = 0
+                elif PARTIAL_OPENING_FENCE.match(self._buffer):
+                    # Wait for the rest of the opening fence.
+                    break
+                else:
+                    self._prose.append(self._buffer[0])
+                    self._buffer = self._buffer[1:]
+        return found
+
+    def close(self):
+        """The reply is complete, an unclosed block isn't a snippet."""
+        if not self._inside:
+            self._prose.append(self._buffer)
+        self._buffer = ""
@@ -0,0 +1,101 @@
+"""Measure what the response cache saves when the same instruction is asked again.
+
+Run from the repository root:
+
+    python benchmarks/ai_cache.py [seconds per reply]
+
+A stub model server on a local port streams a made-up reply of PIECES
+pieces over the given time (5 seconds by default) for every /api/chat
+request, the way Ollama streams one. The same instruction about the same
+code is asked three times, the last time opting out of the cache, and the
+time of every request is printed with whether it came from the cache and
+how many requests reached the server. The cache lives in a temporary
+folder, the ResponseCache of the editor isn't touched.
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from assistant import ArtificialIntelligence
+
+PIECES = 50
+REPLY = "Here you go.\n```python\ndef greet(name):\n    return f\"Hello {name}!\"\n```\nIt greets."
+
+
+class StubModel(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seconds = 5.0
+    requests = 0
+    # Client ports requests came from, and replies the client hung up on before they were complete.
+    connections = set()
+    disconnects = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubModel.requests += 1
+        StubModel.connections.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = -(-len(REPLY) // PIECES)
+        pieces = [REPLY[index:index + size] for index in range(0, len(REPLY), size)]
+        try:
+            for index, piece in enumerate(pieces + [""]):
+                time.sleep(self.seconds / len(pieces))
+                line = json.dumps({
+                    "model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": piece}, "done": index == len(pieces),
+                }).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Stop generating, like Ollama does when the client hangs up.
+            StubModel.disconnects += 1
+            self.close_connection = True
+
+
+def start_stub(seconds: float) -> ThreadingHTTPServer:
+    """Serve StubModel on a free local port and point the Ollama client at it."""
+    StubModel.seconds = seconds
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubModel)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    return server
+
+
+async def main(seconds: float):
+    server = start_stub(seconds)
+
+    with tempfile.TemporaryDirectory() as directory:
+        promptPath = os.path.join(directory, "prompt.txt")
+        with open(promptPath, "w") as file:
+            file.write("You are a coding assistant.")
+        ai = ArtificialIntelligence(model="stub", promptPath=promptPath, cachePath=os.path.join(directory, "cache", "responses.sqlite3"))
+        code = "def greet(name):\n    return name\n"
+
+        for label, cache in (("first request", True), ("same request", True), ("opted out of the cache", False)):
+            context = ai.conversation()
+            start = time.perf_counter()
+            merged, response, snippets = await ai.generate(code, "Make greet say hello.", context, cache=cache)
+            elapsed = time.perf_counter() - start
+            source = "cache" if context.metrics[-1].cached else "model"
+            print(f"{label}: {elapsed * 1000:.1f} ms from the {source}, {len(snippets)} snippets merged, {StubModel.requests} requests reached the server")
+        print(f"cache: {ai.cache.hits} hits, {ai.cache.misses} misses")
+        await ai.client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0))
@@ -0,0 +1,72 @@
+"""Check how the assistant talks to Ollama, against the stub model server of ai_cache.py.
+
+Run from the repository root:
+
+    python benchmarks/ai_client.py [seconds per reply]
+
+Three requests are made one after another and the number of connections
+the stub saw them on is printed, one when the connection is reused. Then a
+request is cancelled half a second in and the time until the stub noticed
+that the client hung up (and stopped generating) is printed. Last,
+QUEUED_REQUESTS + 2 requests are made at once: one is streamed, the queued
+ones wait for their turn and the last one is turned down with QueueFull.
+The response cache isn't used.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from ai_cache import StubModel, start_stub
+from assistant import ArtificialIntelligence
+from assistant.client import QueueFull, QUEUED_REQUESTS
+
+CODE = "def greet(name):\n    return name\n"
+
+
+async def main(seconds: float):
+    server = start_stub(seconds)
+    with tempfile.TemporaryDirectory() as directory:
+        promptPath = os.path.join(directory, "prompt.txt")
+        with open(promptPath, "w") as file:
+            file.write("You are a coding assistant.")
+        ai = ArtificialIntelligence(model="stub", promptPath=promptPath)
+
+        for _ in range(3):
+            await ai.generate(CODE, "Make greet say hello.", ai.conversation())
+        print(f"{StubModel.requests} requests one after another over {len(StubModel.connections)} connections")
+
+        task = asyncio.create_task(ai.generate(CODE, "Make greet say hello.", ai.conversation()))
+        await asyncio.sleep(0.5)
+        start = time.perf_counter()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        while StubModel.disconnects == 0 and time.perf_counter() - start < seconds:
+            await asyncio.sleep(0.001)
+        noticed = f"{(time.perf_counter() - start) * 1000:.0f} ms" if StubModel.disconnects else "never"
+        print(f"cancelled request: the stub stopped generating after {noticed}")
+
+        finished = []
+
+        async def request(index: int):
+            try:
+                await ai.generate(CODE, "Make greet say hello.", ai.conversation())
+                finished.append(index)
+            except QueueFull as e:
+                print(f"request {index} turned down: {e}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(index) for index in range(QUEUED_REQUESTS + 2)))
+        print(f"requests {finished} done in this order after {time.perf_counter() - start:.1f} s")
+        await ai.client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0))
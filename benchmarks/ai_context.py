@@ -0,0 +1,48 @@
+"""Measure how large the requests to the assistant get over a conversation.
+
+Run from the repository root:
+
+    python benchmarks/ai_context.py [lines] [turns]
+
+A conversation of TURNS requests (10 by default) about a synthetic file of
+LINES lines (3000 by default) is built with ConversationContext, with a
+reply holding a code block for every request, and the PromptMetrics of
+every request are printed next to the size the request had when a copy of
+the file was sent for every turn. No model is needed, the replies are made
+up.
+
+The default file takes ~12.2k tokens by itself, more than CONTEXT_TOKENS,
+so every request sends the lines around the middle of it instead, and the
+earlier turns are dropped:
+
+    request 2: ~8192 of 8192 tokens, code 8009 (1042 lines left out), 0 turns (1 dropped)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from assistant.context import ConversationContext, estimate_tokens
+
+LINES = 3000
+TURNS = 10
+
+
+def main(lines: int, turns: int):
+    system = "You are NEVER, a coding assistant. " * 20
+    code = "".join(f"def function_{index}(value):\n    return value * {index}\n\n" for index in range(lines // 3))
+    reply = "Here is the change:\n```python\n" + "def function_0(value):\n    return value + 1\n" * 20 + "```\nIt adds one."
+
+    context = ConversationContext(system)
+    unbounded = estimate_tokens(system)
+    for turn in range(turns):
+        prompt = f"Change function_{turn} to add one."
+        messages, metrics = context.messages(code, prompt, lines // 2)
+        context.record(prompt, reply, metrics)
+        unbounded += estimate_tokens(code) + estimate_tokens(prompt)
+        print(f"request {turn + 1}: {metrics}; a copy per turn: ~{unbounded} tokens")
+        unbounded += estimate_tokens(reply)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else LINES, int(sys.argv[2]) if len(sys.argv) > 2 else TURNS)
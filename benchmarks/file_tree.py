@@ -0,0 +1,73 @@
+"""Measure what a folder with many entries costs the file tree.
+
+Run from the repository root:
+
+    python benchmarks/file_tree.py [entries]
+
+The entries of a synthetic folder (ENTRIES by default) are handed to an
+unmounted FileTree in batches of FILE_TREE_BATCH, the way the scanning
+thread delivers them, and the time the UI thread spends adding them is
+printed along with the memory of the tree's arrays and name strings. The
+time to lay out the rows of the folder when it is expanded again and to
+look up paths and single entries by name is printed after that.
+"""
+import os
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from TreeUtilities import FileTree, FILE_TREE_BATCH
+
+ENTRIES = 100_000
+LOOKUPS = 1000
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def tree_size(tree: FileTree) -> int:
+    size = sum(sys.getsizeof(chunk) for chunk in tree._chunks)
+    size += sum(sys.getsizeof(part) for part in (tree._chunkFirsts, tree._starts, tree._parents, tree._kinds, tree._rows))
+    size += sum(sys.getsizeof(children) for children in tree._children.values())
+    return size
+
+
+def main(entries: int):
+    names = [f"{'folder' if index % 10 == 0 else 'file'}_{index:07d}.py" for index in range(entries)]
+    kinds = bytes(index % 10 == 0 for index in range(entries))
+
+    tree = FileTree("/project")
+    tree._children[0] = array("i")
+    tree._chunksOf[0] = []
+    batches = []
+    for start in range(0, entries, FILE_TREE_BATCH):
+        _, elapsed = timed(lambda: tree._add_children(0, names[start:start + FILE_TREE_BATCH], kinds[start:start + FILE_TREE_BATCH]))
+        batches.append(elapsed)
+    print(f"{entries} entries in {len(batches)} batches: {sum(batches) * 1000:.1f} ms in total, {max(batches) * 1000:.2f} ms at most")
+
+    tree = FileTree("/project")
+    tree._children[0] = array("i")
+    tree._chunksOf[0] = []
+    _, elapsed = timed(lambda: tree._add_children(0, names, kinds))
+    print(f"{entries} entries at once (a cached listing): {elapsed * 1000:.1f} ms")
+    size = tree_size(tree)
+    print(f"memory: {size / 1024 ** 2:.1f} MB, {size / entries:.0f} bytes per entry including the name")
+
+    rows, elapsed = timed(lambda: tree._flatten(0))
+    print(f"rows of the loaded folder when it is expanded again: {elapsed * 1000:.1f} ms for {len(rows)} rows")
+
+    step = max(1, entries // LOOKUPS)
+    picked = range(1, entries + 1, step)
+    _, elapsed = timed(lambda: [tree.path_of(entry) for entry in picked])
+    print(f"path of an entry: {elapsed / len(picked) * 1e6:.1f} us")
+    _, elapsed = timed(lambda: [tree._find_child(0, names[entry - 1]) for entry in picked])
+    print(f"entry by name: {elapsed / len(picked) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES)
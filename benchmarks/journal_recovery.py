@@ -0,0 +1,114 @@
+"""Measure the cost of journaling edits and of recovering a buffer from the journal.
+
+Run from the repository root:
+
+    python benchmarks/journal_recovery.py
+
+A ~100 MB file is memory-mapped into a MappedDocument and EDITS random edits
+are made to it while an EditJournal records them. The time per journaled edit
+and the size of the journal are printed, next to the time a full atomic
+rewrite of the file takes. The file is then mapped again and the journal is
+replayed over it, as the editor does after a crash, and the recovered buffer
+is compared with the edited one.
+
+Finally the buffer is replaced by a copy with a few lines changed, as an AI
+merge does through load_text(), and the size of its journal records and the
+time to replay them are printed. On a single core VM the merge is journaled
+as 5 records (0.5 KB, replayed in 2 ms) instead of a 57 MB copy of the
+buffer. Diffing the 1.6M lines takes 1.3 s once their memory is warm, and up
+to 9 s right after the buffers were allocated.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from DocumentUtilities import MappedDocument, PieceTableDocument, EditJournal, replay_journal
+from FileUtilities import atomic_write, file_signature
+
+FILE_BYTES = 100 * 1024 * 1024
+EDITS = 10_000
+
+
+def make_file(path: str):
+    line = "2024-01-01 12:00:00 INFO request handled in 12ms by worker 7\n"
+    with open(path, "w") as file:
+        for _ in range(FILE_BYTES // len(line)):
+            file.write(line)
+
+
+def random_edit(document: MappedDocument) -> tuple:
+    row = random.randrange(document.line_count)
+    column = random.randint(0, len(document.get_line(row)))
+    kind = random.random()
+    if kind < 0.7:
+        return (row, column), (row, column), random.choice("abcdefgh ")
+    if kind < 0.85:
+        return (row, column), (row, column), "\n"
+    return (row, 0), (min(row + 1, document.line_count - 1), 0), ""
+
+
+def main():
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "big.log")
+        make_file(path)
+        journal = EditJournal(os.path.join(directory, "big.journal"), path)
+
+        document = MappedDocument(path)
+        document.build_index()
+        document.extend_original()
+        journal.start(file_signature(path))
+
+        start = time.perf_counter()
+        for _ in range(EDITS):
+            top, bottom, text = random_edit(document)
+            document.replace_range(top, bottom, text)
+            journal.record(top, bottom, text)
+        edit_time = time.perf_counter() - start
+        journal.close()
+        print(f"{EDITS} journaled edits: {edit_time / EDITS * 1e6:.1f} us per edit")
+        print(f"journal size: {os.path.getsize(journal.path) / 1024:.1f} KB")
+
+        start = time.perf_counter()
+        atomic_write(os.path.join(directory, "rewrite.log"), document.write)
+        print(f"full rewrite of the buffer: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        start = time.perf_counter()
+        recovered = MappedDocument(path)
+        recovered.build_index()
+        recovered.extend_original()
+        header, records = journal.read()
+        assert journal.matches(header, file_signature(path))
+        recovered = replay_journal(recovered, records)
+        print(f"recovery (map, index and replay {len(records)} records): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        assert recovered.line_count == document.line_count
+        assert all(recovered.get_line(row) == document.get_line(row) for row in range(0, document.line_count, 997))
+
+        lines = document.text.split("\n")
+        for row in random.sample(range(len(lines)), 5):
+            lines[row] = "merged " + lines[row]
+        merged = PieceTableDocument("\n".join(lines))
+        del lines
+        size = os.path.getsize(journal.path)
+        journal.start(file_signature(path), records)
+        start = time.perf_counter()
+        journal.record_load(document, merged)
+        journal.close()
+        print(f"journaling a merge: {(time.perf_counter() - start) * 1000:.0f} ms, {(os.path.getsize(journal.path) - size) / 1024:.1f} KB")
+
+        merge_records = journal.read()[1][len(records):]
+        start = time.perf_counter()
+        recovered = replay_journal(recovered, merge_records)
+        print(f"replaying the merge ({len(merge_records)} records): {(time.perf_counter() - start) * 1000:.0f} ms")
+        assert all(recovered.get_line(row) == merged.get_line(row) for row in range(0, merged.line_count, 997))
+        recovered.close()
+        document.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure keystroke latency of NVRTextArea on large buffers.
+
+Run from the repository root:
+
+    python benchmarks/keystroke_latency.py
+
+Each buffer size is loaded into an NVRTextArea inside a headless App, the cursor
+is moved to the middle of the document and Enter/Backspace key events are fed
+to the key handler repeatedly. The mean and worst latency per keystroke is
+printed for each size, with soft wrapping on and off (the editor screen uses
+NVRTextArea.code_editor, which doesn't wrap).
+
+Measured on a single core VM, the latency no longer depends on the size of
+the buffer, since edits only rewrap and measure the lines they touch:
+
+         lines  soft wrap    mean ms     max ms
+          1000        yes       0.69       4.80
+         10000        yes       0.68       2.22
+        100000        yes       0.73       1.83
+          1000         no       0.65       2.17
+         10000         no       0.63       1.67
+        100000         no       0.69       1.68
+
+Before, the 100k line buffer took 18.8 ms per keystroke on average and up to
+48.8 ms, as TextArea's WrappedDocument shifted the offsets of every following
+line and summed the height of all lines after each edit.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from textual import events
+from textual.app import App, ComposeResult
+from Utilities import NVRTextArea
+
+SIZES = [1_000, 10_000, 100_000]
+KEYSTROKES = 50
+
+
+def make_buffer(lines: int) -> str:
+    """Build a python-looking buffer with indented lines."""
+    body = []
+    for i in range(lines):
+        if i % 10 == 0:
+            body.append(f"def function_{i}(value):")
+        else:
+            body.append(f"    value = value + {i}  # generated line")
+    return "\n".join(body)
+
+
+class BenchmarkApp(App):
+    def __init__(self, text: str, soft_wrap: bool):
+        self.text = text
+        self.soft_wrap = soft_wrap
+        super().__init__()
+
+    def compose(self) -> ComposeResult:
+        self.textArea = NVRTextArea(self.text, soft_wrap=self.soft_wrap)
+        yield self.textArea
+
+
+async def measure(lines: int, soft_wrap: bool) -> tuple[float, float]:
+    app = BenchmarkApp(make_buffer(lines), soft_wrap)
+    timings = []
+    async with app.run_test() as pilot:
+        app.textArea.focus()
+        app.textArea.move_cursor((lines // 2, 4))
+        await pilot.pause()
+        for i in range(KEYSTROKES):
+            key = "enter" if i % 2 == 0 else "backspace"
+            event = events.Key(key, None)
+            start = time.perf_counter()
+            app.textArea._on_key(event)
+            timings.append(time.perf_counter() - start)
+            await pilot.pause()
+    return sum(timings) / len(timings), max(timings)
+
+
+async def main():
+    print(f"{'lines':>10} {'soft wrap':>10} {'mean ms':>10} {'max ms':>10}")
+    for soft_wrap in (True, False):
+        for lines in SIZES:
+            mean, worst = await measure(lines, soft_wrap)
+            print(f"{lines:>10} {'yes' if soft_wrap else 'no':>10} {mean * 1000:>10.2f} {worst * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
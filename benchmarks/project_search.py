@@ -0,0 +1,72 @@
+"""Measure how fast a project search streams matches and how fast it can be cancelled.
+
+Run from the repository root:
+
+    python benchmarks/project_search.py <project folder> [query]
+
+The project is indexed first. A search for a query that matches nothing is
+run to completion to get the throughput over every file, then the query is
+searched for and the time until the first batch of matches arrives is
+printed. Last, a search is cancelled half a second in and the time until its
+coordinator thread stopped is printed.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from SearchUtilities import FileIndex, ProjectSearch, compile_search, search_pool, SEARCH_WORKERS
+
+
+def run(index: FileIndex, query: str) -> tuple:
+    first = []
+    found = []
+    start = time.perf_counter()
+
+    def on_matches(matches):
+        if not first:
+            first.append(time.perf_counter() - start)
+        found.extend(matches)
+
+    search = ProjectSearch(index, compile_search(query), on_matches)
+    search.start()
+    search.wait()
+    return search, len(found), first[0] if first else None, time.perf_counter() - start
+
+
+def main(root: str, query: str):
+    index = FileIndex(root)
+    index.refresh()
+    index.wait()
+    size = 0
+    for path in index.files():
+        try:
+            size += os.path.getsize(os.path.join(root, path))
+        except OSError:
+            pass
+    print(f"{index.file_count} files, {size / 1024 ** 2:.0f} MB, {SEARCH_WORKERS} workers")
+    # Start the workers before anything is timed.
+    search_pool().submit(len, []).result()
+
+    search, _, _, elapsed = run(index, "\x01no such text\x01")
+    print(f"full scan without matches: {elapsed:.2f} s, {size / 1024 ** 2 / elapsed:.0f} MB/s")
+
+    search, found, first, elapsed = run(index, query)
+    first = f"{first * 1000:.0f} ms" if first is not None else "-"
+    print(f"'{query}': {found} matches{' (truncated)' if search.truncated else ''}, first batch after {first}, done after {elapsed:.2f} s")
+
+    search = ProjectSearch(index, compile_search("\x01no such text\x01"), lambda matches: None)
+    search.start()
+    time.sleep(0.5)
+    start = time.perf_counter()
+    search.cancel()
+    search.wait()
+    print(f"cancelled after {search.searched} of {search.files} files in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "import")
@@ -0,0 +1,82 @@
+"""Measure how long building and querying the quick open file index takes.
+
+Run from the repository root:
+
+    python benchmarks/quick_open.py [project folder]
+
+Without a folder, a synthetic project with FILES empty files is generated in a
+temporary folder first (this takes a while). The index is built cold, then
+refreshed with nothing changed, then loaded from its persisted state by a new
+FileIndex. The latency of a few substring, subsequence and path queries is
+printed after that.
+
+On a single slow core with the synthetic 500,000 files, the cold build took
+2-9 s (most of it listing folders). A refresh with nothing changed took
+0.12 s, and loading the persisted index and refreshing it took 0.18 s. The
+mean query took 8-17 ms; single queries took up to 24 ms when the machine
+was busy.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from SearchUtilities import FileIndex
+
+FILES = 500_000
+FILES_PER_FOLDER = 50
+WORDS = ["src", "lib", "core", "utils", "components", "tests", "api", "server", "client", "models",
+         "views", "vendor", "pkg", "internal", "docs", "assets", "styles", "scripts", "handlers", "config"]
+QUERIES = ["utils_api", "server_client_12345", "views", "ut", "cfgapi", "hndlrsrv99", "core12/api", "zzzz", "gen1"]
+REPEAT = 20
+
+
+def make_project(root: str):
+    random.seed(0)
+    folders = [root]
+    for index in range(FILES // FILES_PER_FOLDER):
+        folder = os.path.join(random.choice(folders[-2000:]), f"{random.choice(WORDS)}{index}")
+        os.makedirs(folder, exist_ok=True)
+        folders.append(folder)
+        for file in range(FILES_PER_FOLDER):
+            name = f"{random.choice(WORDS)}_{random.choice(WORDS)}_{index * FILES_PER_FOLDER + file}.py"
+            open(os.path.join(folder, name), "w").close()
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(root: str, cache_path: str):
+    index = FileIndex(root, cache_path)
+    _, elapsed = timed(lambda: (index.refresh(), index.wait()))
+    print(f"cold build: {elapsed:.2f} s for {index.file_count} files")
+    _, elapsed = timed(lambda: (index.refresh(), index.wait()))
+    print(f"refresh without changes: {elapsed:.2f} s")
+    reloaded = FileIndex(root, cache_path)
+    _, elapsed = timed(lambda: (reloaded.refresh(), reloaded.wait()))
+    print(f"load persisted index and refresh: {elapsed:.2f} s")
+
+    print(f"{'query':>22} {'results':>8} {'mean ms':>8} {'max ms':>8}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(REPEAT):
+            results, elapsed = timed(lambda: index.query(query))
+            timings.append(elapsed)
+        print(f"{query:>22} {len(results):>8} {sum(timings) / len(timings) * 1000:>8.2f} {max(timings) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        if len(sys.argv) > 1:
+            root = sys.argv[1]
+        else:
+            root = os.path.join(directory, "project")
+            print(f"generating {FILES} files...")
+            make_project(root)
+        main(root, os.path.join(directory, "index"))
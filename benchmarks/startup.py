@@ -0,0 +1,110 @@
+"""Measure how long the editor takes to start and fail when it takes longer than its budget.
+
+Run from the repository root:
+
+    python benchmarks/startup.py [file to open]
+
+Every measurement runs in a new interpreter, the way the editor is launched,
+and the median of RUNS runs is compared to its budget:
+
+- import: the time `python -X importtime -c "import main"` reports for main,
+  with the slowest modules it imported.
+- first paint: from starting the interpreter until App.run_test has shown
+  the first screen, with the file open in the editor if one is given.
+
+The exit status is 1 when a budget is exceeded, so scripts can run this to
+catch startup regressions. The budgets leave room for slower machines; the
+modules listed as slowest are where to look when one is exceeded.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+RUNS = 5
+SLOWEST = 10
+# Milliseconds.
+IMPORT_BUDGET = 400
+FIRST_PAINT_BUDGET = 1000
+
+FIRST_PAINT = """
+import asyncio, sys
+import main
+
+async def run():
+    app = main.NVRMain(filepath=sys.argv[1] or None)
+    async with app.run_test(size=(120, 40)) as pilot:
+        print("painted", flush=True)
+
+asyncio.run(run())
+"""
+
+
+def environment() -> dict:
+    env = dict(os.environ)
+    # The editor keeps its config below USERPROFILE, which isn't set outside Windows.
+    env.setdefault("USERPROFILE", os.path.expanduser("~"))
+    return env
+
+
+def import_time() -> tuple:
+    """Milliseconds the import of main took, and the slowest modules it imported, for one run."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=environment(), capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line.split("|")
+            modules.append((int(cumulative), name.strip()))
+        except ValueError:
+            continue
+    total = next(cumulative for cumulative, name in modules if name == "main")
+    return total / 1000, sorted(modules, reverse=True)[1:SLOWEST + 1]
+
+
+def first_paint(path: str) -> float:
+    """Milliseconds from starting the interpreter until the first screen was shown, for one run."""
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", FIRST_PAINT, path],
+            cwd=directory if not path else os.path.dirname(os.path.abspath(path)),
+            env=dict(environment(), PYTHONPATH=ROOT), stdout=subprocess.PIPE, text=True,
+        )
+        for line in process.stdout:
+            if line.strip() == "painted":
+                elapsed = time.perf_counter() - start
+                break
+        else:
+            process.wait()
+            raise RuntimeError(f"The editor exited with status {process.returncode} before it showed a screen.")
+        process.wait()
+        return elapsed * 1000
+
+
+def main(path: str) -> int:
+    imports = [import_time() for _ in range(RUNS)]
+    importMs = statistics.median(total for total, _ in imports)
+    paintMs = statistics.median(first_paint(path) for _ in range(RUNS))
+
+    print("slowest imports (cumulative ms):")
+    for cumulative, name in imports[-1][1]:
+        print(f"  {cumulative / 1000:8.1f}  {name}")
+    failed = False
+    for label, measured, budget in (("import main", importMs, IMPORT_BUDGET), ("first paint", paintMs, FIRST_PAINT_BUDGET)):
+        over = measured > budget
+        failed = failed or over
+        print(f"{label}: {measured:.0f} ms (budget {budget} ms){'  OVER BUDGET' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else ""))
@@ -0,0 +1,63 @@
+"""Measure what the workspace database costs the editor for a project where many files were touched.
+
+Run from the repository root:
+
+    python benchmarks/workspace.py [files]
+
+FILES files (10000 by default) are opened, given a location and added to
+the modified set of a workspace in a temporary folder, and the time per
+change is printed, then the time it took to commit them. After that the
+time of the lookups the editor makes on the UI thread is printed: whether
+a file is modified, its location, the recent files and the whole modified
+set.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")))
+
+from WorkspaceUtilities import Workspace
+
+FILES = 10_000
+LOOKUPS = 1000
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(files: int):
+    with tempfile.TemporaryDirectory() as directory:
+        workspace = Workspace(directory, os.path.join(directory, "workspace.sqlite3"))
+        paths = [os.path.join(directory, f"package_{index // 100}", f"module_{index}.py") for index in range(files)]
+
+        def touch():
+            for index, path in enumerate(paths):
+                workspace.opened(path)
+                workspace.set_location(path, (index, 0), (0, index))
+                workspace.mark_modified(path)
+
+        _, elapsed = timed(touch)
+        print(f"{files} files opened, moved and modified: {elapsed / (files * 3) * 1e6:.1f} us per change")
+        _, elapsed = timed(workspace.commit)
+        print(f"commit: {elapsed * 1000:.1f} ms")
+
+        step = max(1, files // LOOKUPS)
+        picked = paths[::step]
+        _, elapsed = timed(lambda: [workspace.is_modified(path) for path in picked])
+        print(f"is_modified: {elapsed / len(picked) * 1e6:.1f} us")
+        _, elapsed = timed(lambda: [workspace.location(path) for path in picked])
+        print(f"location: {elapsed / len(picked) * 1e6:.1f} us")
+        _, elapsed = timed(workspace.recent_files)
+        print(f"recent_files: {elapsed * 1000:.2f} ms")
+        modified, elapsed = timed(workspace.modified_files)
+        print(f"modified_files: {elapsed * 1000:.1f} ms for {len(modified)} files")
+        workspace.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else FILES)
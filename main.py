@@ -1,23 +1,30 @@
 from textual.app import App, ComposeResult, SystemCommand
-from textual.widgets import *
-from textual.containers import *
+from textual.binding import Binding
+from textual.widget import Widget
+from textual.widgets import Footer, Header, Input, Label, Tree
+from textual.containers import Container
 from textual.screen import Screen
 from textual.events import DescendantFocus
+from textual.timer import Timer
 from typing import Iterable
-from Screens import TextEditor, Settings
-import os, shutil, sys
+import os, sys
 import string
-from PluginUtilities import PluginLoader
+from PluginUtilities import PluginLoader, Plugin, plugin_loader
 from Config import config
-from Utilities import NVRTextArea, populate_tree, default_css
+from Utilities import NVRTextArea, default_css
+from FileUtilities import FileOperation, fileOperations, watcher
+from TreeUtilities import FileTree, refresh_tree
+
+# Seconds the file trees wait for more finished file operations before they are updated.
+TREE_UPDATE_DELAY = 0.2
 
 class NVRMain(App):
     """Application with multiple screens."""
 
-    tree: Tree[str] = None
+    tree: FileTree = None
     driveTree: Tree[str] = None
     pluginsTree: Tree[str] = None
-    PL: PluginLoader
+    PL: PluginLoader = None
     TITLE = "A simple Code Editor made in Python!"
     documentNever = os.path.join(os.getenv("USERPROFILE"), "Documents", "NEVER Editor")
     if not os.path.exists(os.path.join(documentNever, "styles.tcss")):
@@ -27,6 +34,7 @@ class NVRMain(App):
     CSS_PATH = os.path.join(documentNever, "styles.tcss")
 
     lastFocused: Widget = None
+    treeUpdateTimer: Timer = None
 
 
     BINDINGS = [
@@ -37,10 +45,12 @@ class NVRMain(App):
         Binding("ctrl+insert", "newFile", "Create File", "Create a new File", priority=False, tooltip="Create a new File"),
         Binding("ctrl+home", "newFolder", "Create Folder", "Create a new Folder", priority=False, tooltip="Create a new Folder"),
         Binding("ctrl+delete", "deletePath", "Delete Path", "Delete a Path (File/Folder)", priority=False, tooltip="Delete a Path (File/Folder)"),
+        Binding("ctrl+k", "cancelFileOperations", "Cancel File Operations", "Cancel the running and queued file operations", priority=True, tooltip="Cancel the running and queued file operations"),
     ]
 
     def __init__(self, driver_class = None, css_path = None, watch_css = False, ansi_color = False, filepath:str = None):
         self.filepath = filepath
+        self.treeUpdates = {}
         super().__init__(driver_class, css_path, watch_css, ansi_color)
 
     async def on_descendant_focus(self, event: DescendantFocus) -> None:
@@ -73,15 +83,8 @@ class NVRMain(App):
         # Go back one directory
         if len(self.screen_stack) == 1:
             parent_dir = os.path.dirname(os.getcwd())
-            if os.path.ismount(parent_dir):
-                self.tree.root.label = f"{parent_dir}"
-                self.tree.root.expand()
-            else:
-                self.tree.root.label = f"..\\{parent_dir}"
-                self.tree.root.expand()
             os.chdir(parent_dir)  # Change to parent directory
-            self.tree.root.remove_children()  # Clear existing tree nodes
-            populate_tree(self.tree.root, parent_dir)
+            self.tree.set_root(parent_dir, f"{parent_dir}" if os.path.ismount(parent_dir) else f"..\\{parent_dir}")
 
     async def action_newFile(self) -> None:
         try:
@@ -105,39 +108,78 @@ class NVRMain(App):
             self.mount(Input(placeholder='Folder Name (e.g. "New Folder"): ', id="newFolderInput").set_styles("width: 100%;").focus())
 
     async def on_input_submitted(self, event: Input.Submitted):
-        def _doStuff(event: Input.Submitted) -> None:
-            event.input.remove()
-            if type(self.screen) is TextEditor.ScreenObject:
-                self.screen.fileTree.clear()
-                populate_tree(self.screen.fileTree.root, os.getcwd())
-            else:
-                self.tree.clear()
-                populate_tree(self.tree.root, os.getcwd())
-            _doStuff(event)
-
-        if event.input.id == "newFileInput" and event.value != "":
+        if event.value == "" or event.input.id not in ("newFileInput", "newFolderInput", "deletePathInput"):
+            return
+        event.input.remove()
+        path = os.path.join(os.getcwd(), event.value)
+        if event.input.id == "newFileInput":
+            self.submitFileOperation(FileOperation("create_file", path))
+        elif event.input.id == "newFolderInput":
+            self.submitFileOperation(FileOperation("create_folder", path))
+        elif event.input.id == "deletePathInput":
+            self.submitFileOperation(FileOperation("delete", path))
+
+    def submitFileOperation(self, operation: FileOperation, done=None) -> FileOperation:
+        """Run operation on the file operations thread, showing its progress and updating the trees once it's done."""
+        def from_thread(callback, *args):
             try:
-                open(os.path.join(os.getcwd(), event.value), "w").write("")
-            except Exception as e:
-                self.notify(f"Failed to create {event.value}!\n{e}")
-            _doStuff(event)
-
-        elif event.input.id == "newFolderInput" and event.value != "":
-            try:
-                os.makedirs(os.path.join(os.getcwd(), event.value))
-            except Exception as e:
-                self.notify(f"Failed to create {event.value}!\n{e}")
-            _doStuff(event)
-                
-        elif event.input.id == "deletePathInput" and event.value != "":
-            try:
-                if not os.path.isdir(os.path.join(os.getcwd(), event.value)):
-                    os.remove(os.path.join(os.getcwd(), event.value))
-                else:
-                    shutil.rmtree(os.path.join(os.getcwd(), event.value))
-            except Exception as e:
-                self.notify(f"Failed to delete {event.value}!\n{e}")
-            _doStuff(event)
+                self.call_from_thread(callback, *args)
+            except RuntimeError:
+                # The app stopped, the operation goes on without reporting to it.
+                pass
+
+        operation.progress = lambda operation: from_thread(self.showFileOperation, operation)
+        operation.done = lambda operation: from_thread(self.fileOperationDone, operation, done)
+        fileOperations.submit(operation)
+        self.showFileOperation(operation)
+        return operation
+
+    def showFileOperation(self, operation: FileOperation = None):
+        if not self.operationStatus.is_attached:
+            return
+        pending = [pending for pending in fileOperations.pending() if not pending.finished]
+        if operation is None or operation.finished:
+            operation = pending[0] if pending else None
+        if operation is None:
+            self.operationStatus.display = False
+            return
+        queued = f" (+{len(pending) - 1} queued)" if len(pending) > 1 else ""
+        self.operationStatus.update(f"{operation}{queued}  [ctrl+k to cancel]")
+        self.operationStatus.display = True
+
+    def fileOperationDone(self, operation: FileOperation, done=None):
+        name = os.path.basename(operation.path)
+        if operation.error:
+            verb = {"create_file": "create", "create_folder": "create"}.get(operation.kind, operation.kind)
+            self.notify(f"Failed to {verb} {name}!\n{operation.error}", severity="error")
+        elif operation.cancelled:
+            self.notify(f"Cancelled: {operation}", severity="warning")
+        elif operation.entries > 1000 or operation.bytes > 100 * 1024 ** 2:
+            self.notify(f"Done: {operation}")
+        for path in operation.changed_paths:
+            self.queueTreeUpdate(path)
+        self.showFileOperation()
+        if done:
+            done(operation)
+
+    def queueTreeUpdate(self, path: str):
+        """Update the entries of path and of its parent folders in the file trees, together with the other changes that come in soon."""
+        path = os.path.abspath(path)
+        while os.path.dirname(path) != path:
+            self.treeUpdates.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+            path = os.path.dirname(path)
+        if not self.treeUpdateTimer:
+            self.treeUpdateTimer = self.set_timer(TREE_UPDATE_DELAY, self.flushTreeUpdates)
+
+    def flushTreeUpdates(self):
+        updates, self.treeUpdates, self.treeUpdateTimer = self.treeUpdates, {}, None
+        for folder, names in updates.items():
+            refresh_tree(folder, names)
+
+    async def action_cancelFileOperations(self) -> None:
+        if fileOperations.pending():
+            fileOperations.cancel_all()
+            self.notify("Cancelling file operations.")
 
     async def action_refresh(self) -> None:
         """Refresh the screen."""
@@ -149,27 +191,88 @@ class NVRMain(App):
     
     async def action_openSettings(self) -> None:
         """Open the settings screen."""
-        self.push_screen(Settings.ScreenObject())
+        self.settingsScreen()
 
     def get_system_commands(self, screen: Screen) -> Iterable[SystemCommand]:
         yield from super().get_system_commands(screen)  
         yield SystemCommand("Settings", "NVR Settings Screen", self.settingsScreen) 
+        yield SystemCommand("Quick Open", "Find a file of the project by name", self.quickOpen)
+        yield SystemCommand("Find in Files", "Search the contents of the files of the project", self.findInFiles)
+
+    # The screens below are imported the first time they are opened, which keeps them and
+    # what they import (the AI assistant among it) out of the startup time.
 
     def settingsScreen(self):
+        from Screens import Settings
         self.push_screen(Settings.ScreenObject())
 
+    def quickOpen(self):
+        from textual.command import CommandPalette
+        from Screens import QuickOpen
+        self.push_screen(CommandPalette(providers=[QuickOpen.QuickOpenProvider], placeholder="Search for files…"))
+
+    def findInFiles(self):
+        from Screens import TextEditor, ProjectSearch
+        if isinstance(self.screen, TextEditor.ScreenObject):
+            self.push_screen(ProjectSearch.ScreenObject(directory=self.screen.mainDirectory))
+        else:
+            self.push_screen(ProjectSearch.ScreenObject(directory=os.getcwd()))
+
     def on_mount(self) -> None:
         """Set up screens when the app starts."""
         if self.filepath:
+            from Screens import TextEditor
             self.push_screen(TextEditor.ScreenObject(filepath=self.filepath))
 
         config.documentNever = self.documentNever
         self.theme = config.theme
-        
-    def compose(self) -> ComposeResult:
-        self.PL = PluginLoader(self.app, os.path.join(config.documentNever, "Plugins"))
+        config.subscribe(self.configChanged)
+        watcher.on_error = self.watcherError
+        # Plugins are loaded once the first screen is shown, not before it.
+        self.call_after_refresh(self.loadPlugins)
+
+    def configChanged(self, keys: set):
+        """Follow theme changes, including ones made to config.json by hand (reported from the file watcher thread)."""
+        if "theme" in keys:
+            self.call_later(self.applyTheme)
+
+    def watcherError(self, message: str):
+        """Show a problem of the file watcher, which may report it from its own thread."""
+        self.call_later(self.notify, message, severity="warning")
+
+    def applyTheme(self):
+        try:
+            if self.theme != config.theme:
+                self.theme = config.theme
+        except Exception as e:
+            self.notify(f"ERROR! {e.__class__.__name__}: {e.args[0]}", severity="error")
+
+    def loadPlugins(self):
+        self.PL = plugin_loader(self.app, os.path.join(config.documentNever, "Plugins"))
         self.PL.load_plugins()
+        self.PL.subscribe(self.pluginChanged)
+        self.listPlugins()
+
+    def pluginChanged(self, plugin: Plugin):
+        """Keep the plugins tree in step with plugins toggled or removed on any screen."""
+        for node in self.pluginsTree.root.children:
+            if node.data is plugin:
+                if plugin.name in self.PL.plugins:
+                    node.label = f"{plugin.name}: {'ON' if plugin.is_enabled else 'OFF'}"
+                else:
+                    node.remove()
 
+    def listPlugins(self):
+        """Fill the plugins tree of the sidebar, once the plugins are loaded."""
+        if self.PL is None:
+            return
+        self.pluginsTree.root.remove_children()
+        for plugin_name, plugin in self.PL.plugins.items():
+            plugin.load_config()
+            pluginNode = self.pluginsTree.root.add(f"{plugin.name}: {'ON' if plugin.is_enabled else 'OFF'}")
+            pluginNode.data = plugin
+
+    def compose(self) -> ComposeResult:
         self.driveTree = Tree("Drives")
         driveTree = self.driveTree
 
@@ -177,17 +280,13 @@ class NVRMain(App):
 
         self.pluginsTree = Tree("Plugins")
         pluginsTree = self.pluginsTree
+        self.listPlugins()
 
         drives = ['%s:' % d for d in string.ascii_uppercase if os.path.exists('%s:' % d)]
         for drive in drives:
-            driveNode = driveTree.root.add(drive)
-            driveNode.data = drive + "\\"
+            # Selecting a drive opens it in the file tree, so drives aren't expanded.
+            driveTree.root.add_leaf(drive, data=drive + "\\")
 
-        for plugin_name, plugin in self.PL.plugins.items():
-            plugin.load_config()
-            pluginNode = pluginsTree.root.add(f"{plugin.name}: {'ON' if plugin.is_enabled else 'OFF'}")
-            pluginNode.data = plugin
-        
         with Container(id="sidebar").set_styles("dock: left; width: 20%; padding: 1 0 1 0;") as sideBar:
             driveTree.root.expand()
             pluginsTree.root.expand()
@@ -195,102 +294,72 @@ class NVRMain(App):
             yield driveTree
             yield pluginsTree
         
-        self.tree = Tree(f"..{os.getcwd()}")
-        self.tree.root.expand()
-        self.tree.ICON_NODE = "📁 "
-        self.tree.ICON_NODE_EXPANDED = "📂 "
-
-        # Start from the current directory
-        populate_tree(self.tree.root, os.getcwd())
+        # Start from the current directory, folders are opened in place of it instead of expanding
+        self.tree = FileTree(os.getcwd(), f"..{os.getcwd()}", auto_expand=False)
 
         with Container() as contentContainer:
             self.contentContainer = contentContainer
             yield self.tree
 
+        self.operationStatus = Label("", id="fileOperationStatus").set_styles("dock: bottom; width: 100%; padding: 0 1 0 1;")
+        self.operationStatus.display = False
+        yield self.operationStatus
+
         yield Header(show_clock=True)
         yield Footer()
 
     async def on_tree_node_expanded(self, event: Tree.NodeExpanded) -> None:
-        """Handle lazy loading of folder contents when expanded."""
-        if event.control is self.tree or event.control is self.driveTree:
-            node = event.node
-            if node.data:
-                # Populate the folder if it has not been populated yet
-                if not node.children:
-                    populate_tree(node, node.data)
-
-            if node.is_expanded and not node.is_root:
-                node.collapse()
-        
-        elif event.control is self.pluginsTree:
+        """Show the actions of a plugin when its node is expanded."""
+        if event.control is self.pluginsTree:
             node = event.node
             plugin = node.data
             if node.data:
                 node.remove_children()
                 node.add_leaf(f"Delete Plugin", data=(plugin, "deletePlugin"))
                 node.add_leaf(f"Toggle Plugin", data=(plugin, "togglePlugin"))
+                node.add_leaf(f"Reload Plugin", data=(plugin, "reloadPlugin"))
+
+    async def on_file_tree_selected(self, event: FileTree.Selected) -> None:
+        """Handle file or folder selection."""
+        if event.is_root:
+            await self.action_back()
+        elif event.is_dir:
+            # Navigate into the selected folder
+            os.chdir(event.path)
+            self.tree.set_root(event.path, f"..\\{event.path}")
+        else:
+            # File handling (e.g., opening)
+            from Screens import TextEditor
+            self.push_screen(TextEditor.ScreenObject(filepath=event.path))
+        self.clear_notifications()
 
     async def on_tree_node_selected(self, event: Tree.NodeSelected) -> None:
         """Handle file or folder selection."""
         node = event.node
-        if node is self.tree.root:
-            # Go back one directory
-            parent_dir = os.path.dirname(os.getcwd())
-            if os.path.ismount(parent_dir):
-                self.tree.root.label = f"{parent_dir}"
-                self.tree.root.expand()
-            else:
-                self.tree.root.label = f"..\\{parent_dir}"
-                self.tree.root.expand()
-            os.chdir(parent_dir)  # Change to parent directory
-            node.remove_children()  # Clear existing tree nodes
-            populate_tree(node, parent_dir)
-        
-        elif node.parent is self.driveTree.root:
-            self.tree.root.label = f"{node.data}"
-
+        if node.parent is self.driveTree.root:
             os.chdir(node.data)
+            self.tree.set_root(os.getcwd(), f"{node.data}")
 
-            #self.notify(f"Drive opened: {node.data}")
-
-            self.tree.root.remove_children()  # Clear existing tree nodes
-            populate_tree(self.tree.root, os.getcwd())
-
-        elif node.data and node.parent is self.tree.root:
-            item_type = "File" if os.path.isfile(node.data) else "Folder"
-
-            if item_type == "Folder":
-                # Navigate into the selected folder
-                os.chdir(node.data)
-
-                # Clear root and repopulate tree for new path
-                self.tree.root.remove_children()
-                self.tree.root.label = f"..\\{node.data}"
-                populate_tree(self.tree.root, node.data)
-
-                #self.notify(f"Folder opened: {node.data}")
-            else:
-                # File handling (e.g., opening)
-                self.push_screen(TextEditor.ScreenObject(filepath=node.data))
-                #self.notify(f"File opened: {node.data}")
-            self.clear_notifications()
-        
         elif node.data is not None and node.parent.parent is self.pluginsTree.root:
             if node.data[1] == "deletePlugin":
                 plugin = node.data[0]
-                self.PL.plugins.pop(plugin.name)
-                plugin.unload()
-                node.parent.remove_children()
-                node.parent.remove()
-                shutil.rmtree(plugin.plugin_path)
-                self.notify(f"Plugin '{plugin.name}' deleted.")
+                self.PL.remove(plugin)
+
+                def deleted(operation: FileOperation):
+                    if not operation.error and not operation.cancelled:
+                        self.notify(f"Plugin '{plugin.name}' deleted.")
+
+                self.submitFileOperation(FileOperation("delete", plugin.plugin_path), deleted)
             if node.data[1] == "togglePlugin":
                 plugin = node.data[0]
                 if plugin.is_enabled:
                     plugin.disable()
                 else:
                     plugin.enable()
-                node.parent.label = f"{plugin.name}: {'ON' if plugin.is_enabled else 'OFF'}"
+            if node.data[1] == "reloadPlugin":
+                plugin = node.data[0]
+                plugin.reload()
+                self.notify(f"Plugin '{plugin.name}' reloaded.")
 
 
 if __name__ == "__main__":